@@ -1,8 +1,11 @@
 import logging
-import openai
 import random
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 import json
+import math
 import os
 import sys
 
@@ -11,68 +14,74 @@ import sys
 from workflow.state import GraphState
 import config
 from utils.token_tracker import TokenTracker
+from utils.llm_client import LLMClient, cascade_models
+from utils import metrics
+from utils.question_validator import case_study_problems
+from utils.json_cache import load_json
 
 logger = logging.getLogger(__name__)
 
 class CaseQuestionAgent:
-    def __init__(self, subject, token_tracker=None, case_studies_per_paper=2, questions_per_case=5):
+    def __init__(self, subject, token_tracker=None, case_studies_per_paper=2, questions_per_case=5, budget=None):
         self.subject = subject
         self.token_tracker = token_tracker or TokenTracker()
+        self.llm = LLMClient(self.token_tracker, budget=budget)
         self.case_studies_per_paper = case_studies_per_paper
         self.questions_per_case = questions_per_case
         # Load example case studies from PYQ
         self.example_case_studies = self._load_pyq_case_studies()
+        self._chapters = None
+        self._selected_examples = {}
 
-    def generate_case_studies(self, state: GraphState) -> Dict:
-        """Generate case study questions based on completed topics"""
-        logger.info(f"Generating {self.case_studies_per_paper} case studies with {self.questions_per_case} questions each")
-        
-        # Select random topics from the detected topics for case studies
+    def select_topics(self) -> List[str]:
+        """Pick the topics this paper's case studies will be about"""
         if self.subject == "Business Studies":
             available_topics = config.DEFAULT_TOPIC_BST.keys()
         else:
             available_topics = config.DEFAULT_TOPIC_ECO.keys()
- 
-        case_study_topics = random.sample(available_topics, 
-                                         min(self.case_studies_per_paper, len(available_topics)))
-        
-        case_studies = []
-        
-        for topic in case_study_topics:
-            # Get context for the topic
-            context = state["context"].get(topic, {"examples": [], "explanations": []})
-            
-            # Sample NCERT text for the topic
-            ncert_text = self._get_topic_text(topic)
-            
-            # Generate case study
-            case_study = self._generate_single_case_study(topic, ncert_text, context)
-            if case_study:
-                case_studies.append(case_study)
-        
+
+        return random.sample(list(available_topics), min(self.case_studies_per_paper, len(available_topics)))
+
+    def generate_case_study(self, topic: str, context: Dict = None) -> Dict:
+        """Generate one case study; needs only the topic's NCERT text and retrieved context"""
+        context = context or {"examples": [], "explanations": []}
+        ncert_text = self.ncert_text(topic)
+        return self._generate_single_case_study(topic, ncert_text, context)
+
+    def generate_case_studies(self, state: GraphState) -> Dict:
+        """Generate case study questions based on completed topics, all case studies in parallel"""
+        logger.info(f"Generating {self.case_studies_per_paper} case studies with {self.questions_per_case} questions each")
+        case_study_topics = self.select_topics()
+        self._load_chapters()
+
+        with ThreadPoolExecutor(max_workers=config.CASE_STUDY_WORKERS) as executor:
+            futures = [executor.submit(self.generate_case_study, topic, state["context"].get(topic))
+                       for topic in case_study_topics]
+            case_studies = [case_study for case_study in (f.result() for f in futures) if case_study]
+
         logger.info(f"Successfully generated {len(case_studies)} case studies")
-        
-        
         return case_studies
-    
-    def _get_topic_text(self, topic_name: str) -> str:
-        """Retrieve text content for a specific topic"""
-        try:
 
+    def _load_chapters(self) -> Dict[str, List[Dict]]:
+        """Load the NCERT chapters once per agent, keyed by chapter name"""
+        if self._chapters is None:
             if self.subject == 'Business Studies':
                 file_ = 'knowledge_base/business_studies.json'
             else:
                 file_ = 'knowledge_base/economics.json'
 
-            with open(file_, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                
-            for chapter in data["Chapter"]:
-                if chapter["Name"] == topic_name:
-                    texts = chapter["text"]
-                    # Select a few paragraphs to base the case study on
-                    selected_texts = random.sample(texts, min(5, len(texts)))
-                    return "\n\n".join([item["content"] for item in selected_texts])
+            data = load_json(file_)
+            self._chapters = {chapter["Name"]: chapter["text"] for chapter in data["Chapter"]}
+        return self._chapters
+
+    def ncert_text(self, topic_name: str) -> str:
+        """Retrieve text content for a specific topic"""
+        try:
+            texts = self._load_chapters().get(topic_name)
+            if texts:
+                # Select a few paragraphs to base the case study on
+                selected_texts = random.sample(texts, min(5, len(texts)))
+                return "\n\n".join([item["content"] for item in selected_texts])
             
             return "No topic text found"
         except Exception as e:
@@ -88,8 +97,7 @@ class CaseQuestionAgent:
             else:
                 file = 'knowledge_base/pyq/pyqs/eco/CUET_eco_pyq_topicwise.json'
 
-            with open(file, 'r', encoding='utf-8') as file:
-                pyq_data = json.load(file)
+            pyq_data = load_json(file)
             
             case_studies = []
             
@@ -110,7 +118,14 @@ class CaseQuestionAgent:
                             option_text = "\n".join([f"{key}. {value}" for key, value in options.items()])
                         
                         answer = f"Answer: {chr(64 + q.get('correct_answer')) if isinstance(q.get('correct_answer'), int) else q.get('correct_answer')}"
-                        formatted_questions.append(f"{q_text}\n{option_text}\n{answer}")
+                        # The PYQs carry no explanations; name the correct option so the example shows
+                        # the Explanation line the prompt (and case_study_problems) asks for
+                        correct = q.get('correct_answer')
+                        if isinstance(correct, int) and isinstance(options, list) and 0 < correct <= len(options):
+                            explanation = f"Explanation: The case points to {options[correct - 1]}."
+                        else:
+                            explanation = f"Explanation: The case points to option {correct}."
+                        formatted_questions.append(f"{q_text}\n{option_text}\n{answer}\n{explanation}")
                     
                     case_studies.append({
                         'title': case_study.get('title', ''),
@@ -124,8 +139,54 @@ class CaseQuestionAgent:
             logger.error(f"Error loading PYQ case studies: {e}")
             return []
     
-    def _generate_single_case_study(self, topic: str, ncert_text: str, context: Dict) -> Dict:
-        """Generate a single case study with questions"""
+    @staticmethod
+    def _term_counts(text: str) -> Counter:
+        return Counter(re.findall(r"[a-z]{3,}", text.lower()))
+
+    @staticmethod
+    def _cosine(a: Counter, b: Counter) -> float:
+        dot = sum(count * b[term] for term, count in a.items() if term in b)
+        norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+        return dot / norm if norm else 0.0
+
+    @staticmethod
+    def _example_tokens(example: Dict) -> int:
+        return len(f"{example['title']} {example['text']} {example['questions']}") // 4
+
+    def _select_examples(self, topic: str) -> List[Dict]:
+        """Most relevant PYQ case studies for a topic that fit config.CASE_STUDY_EXAMPLE_TOKENS, cached per topic"""
+        if topic in self._selected_examples:
+            return self._selected_examples[topic]
+
+        # Relevance: tagged with the same topic first, then term overlap with the topic's NCERT chapter
+        chapter = " ".join(item["content"] for item in self._load_chapters().get(topic, []))
+        topic_terms = self._term_counts(f"{topic} {chapter}")
+        normalized_topic = topic.lower().strip()
+
+        def score(example):
+            example_topic = (example.get('topic') or '').lower().strip()
+            same_topic = bool(example_topic) and (normalized_topic in example_topic or example_topic in normalized_topic)
+            return (same_topic, self._cosine(self._term_counts(f"{example['title']} {example['text']}"), topic_terms))
+
+        selected, used = [], 0
+        for example in sorted(self.example_case_studies, key=score, reverse=True):
+            if len(selected) >= config.CASE_STUDY_EXAMPLES:
+                break
+            tokens = self._example_tokens(example)
+            if used + tokens > config.CASE_STUDY_EXAMPLE_TOKENS:
+                # Too long for what is left of the budget (or for the whole budget, on its own)
+                logger.debug(f"Skipping example case study {example['title']!r} (~{tokens} tokens) for {topic}")
+                continue
+            selected.append(example)
+            used += tokens
+
+        logger.info(f"Selected {len(selected)} of {len(self.example_case_studies)} example case studies "
+                    f"(~{used} tokens) for {topic}")
+        self._selected_examples[topic] = selected
+        return selected
+
+    def build_messages(self, topic: str, ncert_text: str) -> List[Dict]:
+        """Chat messages asking for one case study on a topic, with PYQ case studies as examples"""
         prompt = f"""
         Create a case study with {self.questions_per_case} multiple-choice questions about {topic}.
         
@@ -171,7 +232,11 @@ class CaseQuestionAgent:
         ]
         
         # Add example case studies from PYQs as examples
-        for i, example in enumerate(self.example_case_studies):
+        examples = self._select_examples(topic)
+        if self.llm.budget and self.llm.budget.is_low() and len(examples) > 1:
+            self.llm.budget.record_cut("case_study_examples", f"{len(examples)} -> 1 examples for {topic}")
+            examples = examples[:1]
+        for i, example in enumerate(examples):
             messages.append({"role": "system", "content": f"Here's Example {i+1} of a CUET case study format:"})
             messages.append({"role": "system", "content": f"""
             CASE STUDY: {example['title']}
@@ -192,45 +257,67 @@ class CaseQuestionAgent:
         {ncert_text}
         -------------------------------------------------------------------------
         """})
-        
-        try:
-            response = openai.ChatCompletion.create(
-                model=config.GPT_MODEL,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2500
-            )
-            
-            if self.token_tracker:
-                self.token_tracker.update(response)
-                
-            content = response.choices[0].message.content
-            
-            # Parse the case study and questions
-            parts = content.split("QUESTIONS:")
-            if len(parts) < 2:
-                logger.warning(f"Unexpected response format for case study on {topic}")
-                return None
-                
-            case_text = parts[0].strip()
-            questions_text = parts[1].strip()
-            
-            # Clean up case text to extract title and content
-            case_parts = case_text.split("\n\n", 1)
-            title = case_parts[0].replace("CASE STUDY:", "").strip() if len(case_parts) > 1 else "Case Study"
-            content = case_parts[1].strip() if len(case_parts) > 1 else case_parts[0].strip()
-            
-            return {
-                "topic": topic,
-                "title": title,
-                "content": content,
-                "questions": questions_text
-            }
-            
-        except Exception as e:
-            logger.error(f"Error generating case study for {topic}: {e}")
+        return messages
+
+    def _generate_single_case_study(self, topic: str, ncert_text: str, context: Dict) -> Dict:
+        """Generate a single case study with questions"""
+        messages = self.build_messages(topic, ncert_text)
+        case_study = None
+        models = cascade_models()
+        for i, model in enumerate(models):
+            try:
+                response = self.llm.chat_completion(
+                    messages,
+                    model=model,
+                    temperature=0.7,
+                    max_tokens=2500,
+                    node="case_study" if i == 0 else "escalate_case_study",
+                    topic=topic,
+                    subject=self.subject
+                )
+                attempt = self.parse_case_study(topic, response.choices[0].message.content)
+            except Exception as e:
+                logger.error(f"Error generating case study for {topic} on {model}: {e}")
+                attempt = None
+
+            problems = case_study_problems(attempt, self.questions_per_case)
+            case_study = attempt or case_study
+            if not problems:
+                return attempt
+            if i + 1 < len(models) and not self.llm.escalation_allowed(f"case_study/{topic}"):
+                break
+            if i + 1 < len(models):
+                logger.info(f"Case study on {topic} from {model} failed validation ({'; '.join(problems[:3])}), "
+                            f"escalating to {models[i + 1]}")
+                metrics.MODEL_ESCALATIONS.inc(node="case_study", model=models[i + 1])
+
+        if case_study is None:
+            metrics.TOPIC_FAILURES.inc(subject=self.subject, topic=topic, stage="case_study")
+        return case_study
+
+    @staticmethod
+    def parse_case_study(topic: str, content: str) -> Dict:
+        """Split a response into title, case text and questions; None if it lacks the QUESTIONS: section"""
+        parts = content.split("QUESTIONS:")
+        if len(parts) < 2:
+            logger.warning(f"Unexpected response format for case study on {topic}")
             return None
 
+        case_text = parts[0].strip()
+        questions_text = parts[1].strip()
+
+        # Clean up case text to extract title and content
+        case_parts = case_text.split("\n\n", 1)
+        title = case_parts[0].replace("CASE STUDY:", "").strip() if len(case_parts) > 1 else "Case Study"
+        content = case_parts[1].strip() if len(case_parts) > 1 else case_parts[0].strip()
+
+        return {
+            "topic": topic,
+            "title": title,
+            "content": content,
+            "questions": questions_text
+        }
+
 if __name__ == "__main__":
     # Quick test for CaseQuestionAgent
     from agents.case_q_agent import CaseQuestionAgent
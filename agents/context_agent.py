@@ -3,7 +3,8 @@ import json
 import os
 from typing import Dict, List
 from workflow.state import GraphState
-from data.vector_store import VectorStore
+from utils.dedup import deduplicate
+from utils.json_cache import load_json
 
 logger = logging.getLogger(__name__)
 
@@ -21,11 +22,14 @@ class ContextAgent:
     def __init__(self, subject, vector_store):
         pyq_path = f"knowledge_base/pyq/pyqs/{sub[subject]}/CUET_{sub[subject]}_pyq_topicwise.json"
         mock_path = f"knowledge_base/pyq/mocks/{sub[subject]}/mock_questions.json"
+        self.subject = subject
         self.vector_store = vector_store
         self.pyq_path = os.path.join(os.getcwd(), pyq_path)
         self.mock_path = os.path.join(os.getcwd(), mock_path)
         self.pyq_data = self._load_pyq_data()
         self.mock_data = self._load_mock_data()
+        self._topic_matches = {}  # topic -> vector store results, shared by examples and explanations
+        self._untagged = False  # set once the collection turns out to carry no topic tags
         if subject == 'Business Studies':
             self.dict = {
                             "Nature and Significance of Management": 4,
@@ -112,8 +116,7 @@ class ContextAgent:
         """Load the structured PYQ data from JSON file"""
         try:
             if os.path.exists(self.pyq_path):
-                with open(self.pyq_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json(self.pyq_path)
             else:
                 logger.warning(f"PYQ data file not found: {self.pyq_path}")
                 return {}
@@ -124,8 +127,7 @@ class ContextAgent:
     def _load_mock_data(self) -> Dict:
         try:
             if os.path.exists(self.mock_path):
-                with open(self.mock_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json(self.mock_path)
             else:
                 logger.warning(f"Mock data file not found: {self.mock_path}")
                 return {}
@@ -133,6 +135,27 @@ class ContextAgent:
             logger.error(f"Error loading Mock data: {e}")
             return {}
             
+    def corpus_questions(self) -> List[str]:
+        """All PYQ and mock question texts with their options, e.g. to seed the novelty index"""
+        return [record["question"] for record in self.corpus_records()]
+
+    def corpus_records(self) -> List[Dict]:
+        """PYQ and mock questions as corpus records (question text with options, topic), e.g. for the lexical index"""
+        questions = [question for section in self.pyq_data.get('sections', [])
+                     for question in section.get('questions', [])]
+        questions += self.mock_data.get('questions', [])
+
+        records = []
+        for number, question in enumerate(questions):
+            text = question.get('questionText', '')
+            options = question.get('options', [])
+            if isinstance(options, dict):
+                options = list(options.values())
+            text += "".join(f"\n({chr(65 + i)}) {option}" for i, option in enumerate(options))
+            records.append({"question": text, "topic": question.get('topic', ''),
+                            "question_type": "pyq", "question_number": f"pyq-{number}"})
+        return records
+
     def _get_examples_from_pyq(self, topic: str, n_results: int) -> Dict:
         """Retrieve examples for a topic from the structured PYQ data"""
 
@@ -283,41 +306,8 @@ class ContextAgent:
         
     def _deduplicate_examples(self, examples):
         """Remove duplicates and very similar examples"""
-        if not examples:
-            return []
-            
-        unique_examples = []
-        example_texts = set()
-        
-        for example in examples:
-            # Create a simplified version for comparison
-            # Remove whitespace, lowercase, etc.
-            simplified = ' '.join(example.split()).lower()
-            
-            # Check if this is sufficiently different from existing examples
-            is_unique = True
-            for existing in example_texts:
-                # If more than 70% similar, consider it a duplicate
-                if self._similarity(simplified, existing) > 0.7:
-                    is_unique = False
-                    break
-                    
-            if is_unique:
-                unique_examples.append(example)
-                example_texts.add(simplified)
-                
-        return unique_examples
-        
-    def _similarity(self, text1, text2):
-        """Simple text similarity check"""
-        # Use Jaccard similarity on word sets
-        words1 = set(text1.split())
-        words2 = set(text2.split())
-        
-        intersection = len(words1.intersection(words2))
-        union = len(words1.union(words2))
-        
-        return intersection / union if union > 0 else 0.0
+        # Examples more than 70% Jaccard-similar to an earlier one are dropped (MinHash LSH + exact check)
+        return deduplicate(examples, threshold=0.7)
 
     def _retrieve_pyq_examples(self, topic: str) -> List[str]:
         """Retrieve examples for a topic from structured PYQ data"""
@@ -325,14 +315,37 @@ class ContextAgent:
         pyq_context = self._get_examples_from_pyq(topic, n_results=(3 * self.dict[topic]))
         return pyq_context["examples"]
         
+    def _query_topic(self, topic: str, n_results: int = 5) -> Dict:
+        """Vector store matches tagged with the topic; unfiltered if no document carries that tag.
+
+        Matches are kept per topic; an empty result (nothing indexed yet, or a vector store or
+        embedding failure) is not, so the next paper tries again. If an unfiltered fallback
+        shows no topic tags at all, later topics skip the filtered query.
+        """
+        if topic in self._topic_matches:
+            return self._topic_matches[topic]
+        results = None
+        if not self._untagged:
+            results = self.vector_store.query_collection(query_text=topic, n_results=n_results,
+                                                         subject=self.subject, where={"topic": topic})
+        if not (results and results["documents"] and results["documents"][0]):
+            results = self.vector_store.query_collection(query_text=topic, n_results=n_results, subject=self.subject)
+            metadatas = results["metadatas"][0] if results.get("metadatas") else []
+            if metadatas and not any(isinstance(m, dict) and m.get("topic") for m in metadatas):
+                logger.info(f"{self.subject} collection has no topic tags; querying it unfiltered from now on")
+                self._untagged = True
+        if results["documents"] and results["documents"][0]:
+            self._topic_matches[topic] = results
+        return results
+
     def _retrieve_from_vector_store(self, topic: str) -> List[str]:
         """Retrieve examples from vector store"""
-        results = self.vector_store.query_collection(query_text=topic, n_results=5)
+        results = self._query_topic(topic)
         return results["documents"][0] if results["documents"] and len(results["documents"]) > 0 else []
         
     def _retrieve_explanations(self, topic: str) -> List[str]:
         """Retrieve explanations from vector store"""
-        results = self.vector_store.query_collection(query_text=topic, n_results=5)
+        results = self._query_topic(topic)
         explanations = []
         
         if results["metadatas"] and len(results["metadatas"]) > 0:
@@ -1,9 +1,9 @@
 import logging
-import numpy as np
 from typing import Dict
 from workflow.state import GraphState
-from data.vector_store import VectorStore
 import json
+import config
+from utils.json_cache import load_json
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +33,24 @@ class DistributionAgent:
             sub = 'economics'
         self.default_distribution_path = f"utils/{sub}_distribution.json"
 
+    @staticmethod
+    def default_topics(subject: str) -> Dict[str, int]:
+        """Topics and default question counts for a subject from config"""
+        if subject == "Business Studies":
+            return config.DEFAULT_TOPIC_BST
+        elif subject == "Maths-Core":
+            return config.DEFAULT_TOPIC_MATH
+        elif subject == "Maths-Applied":
+            return config.DEFAULT_TOPIC_MAPP
+        elif subject == "General Aptitude":
+            return config.DEFAULT_TOPIC_GENAP
+        elif subject == "English":
+            return config.DEFAULT_TOPIC_ENG
+        elif subject == "Accountancy":
+            return config.DEFAULT_TOPIC_ACCT
+        else:  # Economics
+            return config.DEFAULT_TOPIC_ECO
+
     @staticmethod
     def question_distribution_manual(file_path: str) -> Dict:
         logger.info("Setting question distribution across topics")
@@ -42,29 +60,51 @@ class DistributionAgent:
             "Distribution": chap_ques
         }
 
+    @staticmethod
+    def scale(distribution: Dict[str, int], total: int, fixed: Dict[str, int] = None) -> Dict[str, int]:
+        """Resize a distribution to `total` questions, keeping its proportions (largest remainder).
+
+        Topics in `fixed` (per-request overrides) keep their counts and the others share what
+        is left; topics that round down to nothing are dropped.
+        """
+        fixed = {topic: count for topic, count in (fixed or {}).items() if topic in distribution}
+        free = {topic: count for topic, count in distribution.items() if topic not in fixed}
+        target = max(0, total - sum(fixed.values()))
+        current = sum(free.values())
+        if not free or current == target:
+            return distribution
+        shares = {topic: count * target / current for topic, count in free.items()}
+        scaled = {topic: int(share) for topic, share in shares.items()}
+        for topic in sorted(shares, key=lambda t: shares[t] - scaled[t], reverse=True)[:target - sum(scaled.values())]:
+            scaled[topic] += 1
+        return {topic: fixed.get(topic, scaled.get(topic, 0)) for topic in distribution
+                if fixed.get(topic, scaled.get(topic, 0)) > 0}
+
     def analyze_distribution(self, state: GraphState, file_path: str = None) -> Dict:
         """Get question distribution from manual config and set up state"""
         file_path = file_path or self.default_distribution_path
         logger.info("Setting question distribution across topics")
         try:
-            with open(file_path, "r", encoding="utf-8") as json_file:
-                distribution = json.load(json_file)
-
-            # Ensure compatibility with existing workflow expectations
-            return {
-                "distribution": distribution,
-                "remaining_topics": list(distribution.keys()),
-                "detected_topics": state["detected_topics"]
-            }
-            
+            distribution = dict(load_json(file_path))
         except Exception as e:
             logger.error(f"Error in analyze_distribution: {e}")
             # Fallback to uniform distribution
-            equal_dist = state["total_questions"] // len(state["detected_topics"])
+            equal_dist = (state.get("total_questions") or 50) // len(state["detected_topics"])
             distribution = {t: max(1, equal_dist) for t in state["detected_topics"]}
-            return {
-                "distribution": distribution,
-                "remaining_topics": list(distribution.keys()),
-                "detected_topics": state["detected_topics"]
-            }
 
+        # Per-request overrides: set a topic's count, or drop it with 0
+        overrides = state.get("distribution_overrides") or {}
+        if overrides:
+            logger.info(f"Applying distribution overrides: {overrides}")
+            distribution.update(overrides)
+            distribution = {topic: count for topic, count in distribution.items() if count > 0}
+
+        if state.get("total_questions"):
+            distribution = self.scale(distribution, state["total_questions"], fixed=overrides)
+
+        # Ensure compatibility with existing workflow expectations
+        return {
+            "distribution": distribution,
+            "remaining_topics": list(distribution.keys()),
+            "detected_topics": state["detected_topics"]
+        }
@@ -1,10 +1,13 @@
 import logging
-import openai
 from typing import Dict
 from workflow.state import GraphState
 import config
 from utils.token_tracker import TokenTracker
+from utils.llm_client import LLMClient, cascade_models
+from utils import metrics
+from utils.question_validator import question_problems
 from knowledge_base.chunk_selector import ChunkSelector
+from utils.json_cache import load_json
 import json
 import random
 import os
@@ -12,9 +15,12 @@ import os
 logger = logging.getLogger(__name__)
 
 class QuestionAgent:
-    def __init__(self, subject, token_tracker=None):
+    def __init__(self, subject, token_tracker=None, budget=None, novelty_index=None):
         self.token_tracker = token_tracker or TokenTracker()
+        self.llm = LLMClient(self.token_tracker, budget=budget)
         self.subject = subject
+        self.novelty_index = novelty_index
+        self._chapters = None
 
     def generate_questions(self, state: GraphState) -> Dict:
         """Generate questions for the current topic"""
@@ -28,29 +34,71 @@ class QuestionAgent:
 
         logger.info(f"Generating {target_count} questions for topic: {current_topic}")
 
-        # Build a prompt with examples if available
-        example_text = "\n\n".join(context['examples'][:3]) if context['examples'] else "No examples available"
-        example = context["examples"][: (3 * target_count)] if context['examples'] else ["No Examples"] * (3 * target_count)
+        NCERT_text = self.ncert_text(current_topic, target_count)
+        messages = self.build_messages(current_topic, target_count, context, NCERT_text)
+
+        # Keep only the last few-shot turn when the budget is running low
+        if self.llm.budget and self.llm.budget.is_low():
+            messages = [messages[0]] + messages[-3:]
+            self.llm.budget.record_cut("few_shot_examples", f"3 -> 1 example turns for {current_topic}")
+
+        try:
+            models = cascade_models()
+            response = self.llm.chat_completion(
+                messages,
+                model=models[0],
+                temperature=0.7,
+                max_tokens=2000,
+                node="generate_questions",
+                topic=current_topic,
+                subject=self.subject
+            )
+
+            content = response.choices[0].message.content
+            generated = self._escalate_invalid(content.split('\n\n'), messages, content, current_topic,
+                                               target_count, models[1:])
+            if self.novelty_index:
+                generated = self._replace_copies(generated, messages, content, current_topic)
+            logger.info(f"Generated {len(generated)} questions for {current_topic}")
+
+            return {
+                "questions": {**state.get("questions", {}), current_topic: generated},
+                "remaining_topics": state["remaining_topics"][1:],
+                "detected_topics": state["detected_topics"]
+            }
+        except Exception as e:
+            logger.error(f"Error generating questions for {current_topic}: {e}")
+            metrics.TOPIC_FAILURES.inc(subject=self.subject, topic=current_topic, stage="generate_questions")
+            # Continue with remaining topics rather than failing completely
+            return {
+                "questions": {**state.get("questions", {}), current_topic: []},
+                "remaining_topics": state["remaining_topics"][1:],
+                "detected_topics": state["detected_topics"]
+            }
 
-        def n_chunking(name, subject, n):
+    def _load_chapters(self):
+        """NCERT chapters keyed by chapter name, loaded once per agent"""
+        if self._chapters is None:
             # Construct the file path using lowercase subject name
             # Replace spaces with underscores to match file naming conventions
-            file_path = f'knowledge_base/{subject.lower().replace(" ", "_")}.json'
-            with open(file_path, "r", encoding="utf-8") as file:
-                data = json.load(file)
-            for chapter in data["Chapter"]:
-                if chapter["Name"] == name:
-                    texts = chapter["text"]
-                    selected_texts = random.sample(texts, min(n, len(texts)))  # Ensure N does not exceed available texts
-                    NCERT_text = "\n\n".join([item["content"] for item in selected_texts])
-                    return NCERT_text
-            return None
-        NCERT_text = str(n_chunking(current_topic, self.subject, target_count))
+            file_path = f'knowledge_base/{self.subject.lower().replace(" ", "_")}.json'
+            data = load_json(file_path)
+            self._chapters = {chapter["Name"]: chapter["text"] for chapter in data["Chapter"]}
+        return self._chapters
+
+    def ncert_text(self, topic, n):
+        """Random sample of n NCERT paragraphs for a topic"""
+        texts = self._load_chapters().get(topic)
+        if not texts:
+            return "No topic text found"
+        selected_texts = random.sample(texts, min(n, len(texts)))  # Ensure N does not exceed available texts
+        return "\n\n".join([item["content"] for item in selected_texts])
 
-        # Determine appropriate prompt based on subject
+    def _system_prompt(self):
+        """Subject-level instructions; identical for every topic so it can be served from the prompt cache"""
         if self.subject == "Maths-Core" or self.subject == "Maths-Applied":
             prompt = f"""
-            Generate {self.subject} exam questions about {current_topic} following CUET exam patterns.
+            Generate {self.subject} exam questions following CUET exam patterns.
         
             Guidelines:
             1. Include the following question types in the specified ratio:
@@ -85,7 +133,7 @@ class QuestionAgent:
             """
         elif self.subject == "General Aptitude":
             prompt = f"""
-            Generate {self.subject} exam questions about {current_topic} following CUET exam patterns.
+            Generate {self.subject} exam questions following CUET exam patterns.
         
             Guidelines:
             1. Include the following question types in the specified ratio:
@@ -115,7 +163,7 @@ class QuestionAgent:
             """
         elif self.subject == "English":
             prompt = f"""
-            Generate {self.subject} exam questions about {current_topic} following CUET exam patterns.
+            Generate {self.subject} exam questions following CUET exam patterns.
         
             Guidelines:
             1. Include the following question types in the specified ratio:
@@ -145,7 +193,7 @@ class QuestionAgent:
             """
         elif self.subject == "Accountancy":
             prompt = f"""
-            Generate {self.subject} exam questions about {current_topic} following CUET exam patterns.
+            Generate {self.subject} exam questions following CUET exam patterns.
         
             Guidelines:
             1. Include the following question types in the specified ratio:
@@ -175,7 +223,7 @@ class QuestionAgent:
             """
         else:
             prompt = f"""
-            Generate {self.subject} exam questions about {current_topic} following CUET exam patterns.
+            Generate {self.subject} exam questions following CUET exam patterns.
         
             Guidelines:
             1. Include the following question types in the specified ratio:
@@ -221,68 +269,135 @@ class QuestionAgent:
                - Options should be combinations like "1 and 3 only"
             """
 
+        return prompt
+
+    def build_messages(self, topic, target_count, context, ncert_text, request_count=None):
+        """Chat messages for one topic.
+
+        Static parts come first in a fixed order (subject prompt, then the few-shot PYQ
+        examples in the order ContextAgent returned them) and the sampled NCERT text comes
+        last, so requests for the same topic share a long prefix for provider prompt caching.
+        request_count asks for more questions than one paper's target_count (batch mode)
+        without changing that prefix.
+        """
+        request_count = request_count or target_count
+        distinct = " Every question must test a different idea; do not repeat questions." if request_count > target_count else ""
+        example = context["examples"][: (3 * target_count)] if context['examples'] else ["No Examples"] * (3 * target_count)
+
         # Convert example lists to strings with proper formatting
         example_str_1 = "\n\n".join(example[0:(target_count - 1)]) if isinstance(example[0], str) else "No examples available"
         example_str_2 = "\n\n".join(example[(target_count - 1):((2 * target_count) - 1)]) if isinstance(example[0], str) else "No examples available"
         example_str_3 = "\n\n".join(example[((2 * target_count) - 1):(3 * target_count)]) if isinstance(example[0], str) else "No examples available"
 
-        messages = [
-            {"role": "system", "content": prompt},
+        return [
+            {"role": "system", "content": self._system_prompt()},
 
-            # First few-shot examples
-            {"role": "user", "content": f"""Use the below provided text as information base to prepare the {target_count - 1} questions
-        -------------------------------------------------------------------------
-        {NCERT_text}
-        -------------------------------------------------------------------------
-        Number of Questions: {target_count - 1}, Topic: {current_topic}"""},
+            # Few-shot examples; no per-request text here so the prefix stays cacheable
+            {"role": "user", "content": f"Number of Questions: {target_count - 1}, Topic: {topic}"},
             {"role": "assistant", "content": example_str_1},
 
-            {"role": "user", "content": f"""Use the below provided text as information base to prepare the {target_count} questions
-        -------------------------------------------------------------------------
-        {NCERT_text}
-        -------------------------------------------------------------------------
-        Number of Questions: {target_count}, Topic: {current_topic}"""},
+            {"role": "user", "content": f"Number of Questions: {target_count}, Topic: {topic}"},
             {"role": "assistant", "content": example_str_2},
 
-            {"role": "user", "content": f"""Use the below provided text as information base to prepare the {target_count + 1} questions
-        -------------------------------------------------------------------------
-        {NCERT_text}
-        -------------------------------------------------------------------------
-        Number of Questions: {target_count + 1}, Topic: {current_topic}"""},
+            {"role": "user", "content": f"Number of Questions: {target_count + 1}, Topic: {topic}"},
             {"role": "assistant", "content": example_str_3},
 
-            # Now adding context by referring to past responses
-            {"role": "user", "content": f"""Use the below provided text as information base to prepare the {target_count} questions
+            # The sampled NCERT text changes on every request, so it goes last
+            {"role": "user", "content": f"""Use the below provided text as information base to prepare the {request_count} questions
         -------------------------------------------------------------------------
-        {NCERT_text}
+        {ncert_text}
         -------------------------------------------------------------------------
-        Number of Questions: {target_count}, Topic: {current_topic}"""},
+        Number of Questions: {request_count}, Topic: {topic}{distinct}"""},
         ]
 
-        try:
-            response = openai.ChatCompletion.create(
-                model=config.GPT_MODEL,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000
-            )
+    def _escalate_invalid(self, generated, messages, content, topic, target_count, stronger_models):
+        """Keep the questions that pass validation; regenerate the rest on the next model of the cascade"""
+        valid, rejected = [], []
+        for q in generated:
+            problems = question_problems(q, self.subject)
+            if not problems:
+                valid.append(q)
+            elif len(problems) < 3:  # a flawed question rather than a preamble or stray line
+                rejected.append((q, problems))
 
-            if self.token_tracker:
-                self.token_tracker.update(response)
+        for model in stronger_models:
+            missing = target_count - len(valid)
+            if missing <= 0 or not self.llm.escalation_allowed(f"generate_questions/{topic}"):
+                break
+            logger.info(f"{missing} of {target_count} questions for {topic} failed validation, escalating to {model}")
+            metrics.MODEL_ESCALATIONS.inc(node="generate_questions", model=model)
+            failures = "\n\n".join(f"{q}\n[Problems: {'; '.join(problems)}]" for q, problems in rejected[-missing:])
+            retry_messages = messages + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": f"""These questions do not follow the required format:
+        -------------------------------------------------------------------------
+        {failures or "Too few questions were written."}
+        -------------------------------------------------------------------------
+        Write {missing} complete questions on {topic}, each with four options (A, B, C, D), the answer and an explanation. Return only the new questions.
+        Number of Questions: {missing}, Topic: {topic}"""}
+            ]
+            try:
+                response = self.llm.chat_completion(
+                    retry_messages,
+                    model=model,
+                    temperature=0.7,
+                    max_tokens=2000,
+                    node="escalate_questions",
+                    topic=topic,
+                    subject=self.subject
+                )
+            except Exception as e:
+                logger.error(f"Error escalating questions for {topic} to {model}: {e}")
+                continue
+            for q in response.choices[0].message.content.split('\n\n'):
+                problems = question_problems(q, self.subject)
+                if not problems and len(valid) < target_count:
+                    valid.append(q)
+                elif problems and len(problems) < 3:
+                    rejected.append((q, problems))
 
-            generated = response.choices[0].message.content.split('\n\n')
-            logger.info(f"Generated {len(generated)} questions for {current_topic}")
+        missing = target_count - len(valid)
+        if missing > 0 and rejected:
+            # Better a flawed question than an empty slot in the paper
+            logger.warning(f"{missing} questions for {topic} still fail validation, keeping {min(missing, len(rejected))} of them")
+            valid += [q for q, _ in rejected[-missing:]]
+        return valid
 
-            return {
-                "questions": {**state.get("questions", {}), current_topic: generated},
-                "remaining_topics": state["remaining_topics"][1:],
-                "detected_topics": state["detected_topics"]
-            }
-        except Exception as e:
-            logger.error(f"Error generating questions for {current_topic}: {e}")
-            # Continue with remaining topics rather than failing completely
-            return {
-                "questions": {**state.get("questions", {}), current_topic: []},
-                "remaining_topics": state["remaining_topics"][1:],
-                "detected_topics": state["detected_topics"]
-            }
+    def _replace_copies(self, generated, messages, content, topic):
+        """Regenerate only the questions that nearly copy a PYQ or an earlier paper"""
+        flagged = set(self.novelty_index.flag_duplicates(generated))
+        if flagged:
+            logger.info(f"{len(flagged)} of {len(generated)} questions for {topic} copy known questions, regenerating them")
+            metrics.DUPLICATE_QUESTIONS.inc(len(flagged), subject=self.subject, topic=topic)
+            copies = "\n\n".join(generated[i] for i in sorted(flagged))
+            retry_messages = messages + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": f"""These questions are too close to existing exam questions:
+        -------------------------------------------------------------------------
+        {copies}
+        -------------------------------------------------------------------------
+        Write {len(flagged)} new questions on {topic} that test different ideas, in the same format. Return only the new questions."""}
+            ]
+            try:
+                response = self.llm.chat_completion(
+                    retry_messages,
+                    temperature=0.9,
+                    max_tokens=2000,
+                    node="regenerate_duplicates",
+                    topic=topic,
+                    subject=self.subject
+                )
+                replacements = [q for q in response.choices[0].message.content.split('\n\n')
+                                if not self.novelty_index.is_duplicate(q)]
+            except Exception as e:
+                logger.error(f"Error regenerating duplicate questions for {topic}: {e}")
+                replacements = []
+            replacements = replacements[:len(flagged)]
+            if len(replacements) < len(flagged):
+                # Better a close question than an empty slot in the paper
+                logger.warning(f"Only {len(replacements)} of {len(flagged)} replacements for {topic} are novel, keeping the rest")
+                replacements += [generated[i] for i in sorted(flagged)][len(replacements):]
+            generated = [q for i, q in enumerate(generated) if i not in flagged] + replacements
+
+        self.novelty_index.add(generated, source="generated")
+        return generated
@@ -0,0 +1,63 @@
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.dedup import deduplicate, jaccard, tokenize
+
+
+def load_corpus_questions(pattern: str = "processed_papers/*.json"):
+    texts = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            texts.extend(q["question"] for q in json.load(f) if "question" in q)
+    return texts
+
+
+def perturbed(texts, copies: int, seed: int = 0):
+    """Corpus plus word-dropped variants, repeated and shuffled, to mimic overlapping retrieval sources"""
+    rng = random.Random(seed)
+    out = list(texts)
+    for text in texts:
+        words = text.split()
+        if len(words) > 8:
+            i = rng.randrange(len(words))
+            out.append(" ".join(words[:i] + words[i + 1:]))
+    out = out * copies
+    rng.shuffle(out)
+    return out
+
+
+def brute_force(texts, threshold=0.7):
+    kept, kept_tokens = [], []
+    for text in texts:
+        tokens = tokenize(text)
+        if any(jaccard(tokens, other) > threshold for other in kept_tokens):
+            continue
+        kept.append(text)
+        kept_tokens.append(tokens)
+    return kept
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare LSH dedup with the brute-force Jaccard scan")
+    parser.add_argument("--copies", type=int, default=2)
+    parser.add_argument("--skip-brute-force", action="store_true")
+    args = parser.parse_args()
+
+    texts = perturbed(load_corpus_questions(), args.copies)
+    start = time.perf_counter()
+    fast = deduplicate(texts)
+    fast_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(texts)} candidates -> {len(fast)} kept, LSH dedup {fast_ms:.1f} ms")
+
+    if not args.skip_brute_force:
+        start = time.perf_counter()
+        slow = brute_force(texts)
+        slow_ms = (time.perf_counter() - start) * 1000
+        print(f"brute force {slow_ms:.1f} ms, identical result: {fast == slow}")
@@ -0,0 +1,144 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# Allow `python benchmarks/bench_vector_search.py` as well as `python -m benchmarks.bench_vector_search`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from benchmarks.bench_dedup import load_corpus_questions
+from utils.token_tracker import _percentile
+
+
+def embed(texts: List[str], source: str, batch_size: int = 256) -> np.ndarray:
+    """Embed texts with the configured OpenAI model, or with the fake server's offline embedding"""
+    if source == "fake":
+        from benchmarks.fake_openai import FakeOpenAIServer
+        fake = FakeOpenAIServer()
+        return np.array([fake.embedding(text) for text in texts], dtype=np.float32)
+
+    from utils.llm_client import _openai
+    openai = _openai()
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        response = openai.Embedding.create(input=texts[i:i + batch_size], model=config.EMBEDDING_MODEL)
+        vectors.extend(item["embedding"] for item in sorted(response["data"], key=lambda d: d["index"]))
+    return np.array(vectors, dtype=np.float32)
+
+
+def corpus_dataset(source: str, queries: int, seed: int = 0):
+    """The processed_papers questions, queried with word-dropped variants of some of them"""
+    texts = load_corpus_questions()
+    rng = random.Random(seed)
+    picked = [rng.choice(texts) for _ in range(queries)]
+    variants = []
+    for text in picked:
+        words = text.split()
+        i = rng.randrange(len(words)) if len(words) > 1 else 0
+        variants.append(" ".join(words[:i] + words[i + 1:]) or text)
+    return embed(texts, source), embed(variants, source)
+
+
+def synthetic_dataset(size: int, dim: int, queries: int, seed: int = 0):
+    """Unit vectors around size/50 cluster centres, which is closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, size // 50), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centres), size + queries)
+    vectors = centres[labels] + 0.6 * rng.standard_normal((size + queries, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors[:size], vectors[size:]
+
+
+def exact_distances(vectors: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Brute-force distance of each query's k-th nearest vector, in Chroma's definition of the space"""
+    if space == "l2":
+        distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :]
+    elif space == "cosine":
+        normed = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        distances = 1 - (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normed.T
+    else:
+        distances = 1 - queries @ vectors.T
+    k = min(k, distances.shape[1])
+    return np.partition(distances, k - 1, axis=1)[:, k - 1]
+
+
+def run_grid(name: str, vectors: np.ndarray, queries: np.ndarray, k: int, space: str,
+             max_neighbors: List[int], ef_construction: List[int], ef_search: List[int]) -> List[Dict]:
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    # A result counts as a hit when it is no farther than the exact k-th neighbour, so
+    # duplicate questions (equal distances, different ids) do not read as misses
+    kth = exact_distances(vectors, queries, k, space)
+    tolerance = 1e-4
+    ids = [str(i) for i in range(len(vectors))]
+    batch = client.get_max_batch_size()
+    rows = []
+
+    # ef_search is part of the grid rather than changed with modify(): an index that is
+    # already loaded keeps searching with the ef it was loaded with
+    for m, ef_c, ef_s in itertools.product(max_neighbors, ef_construction, ef_search):
+        collection_name = f"bench-{name}-{m}-{ef_c}-{ef_s}".replace("_", "-")
+        collection = client.create_collection(
+            collection_name, embedding_function=None,
+            configuration={"hnsw": {"space": space, "max_neighbors": m, "ef_construction": ef_c, "ef_search": ef_s}})
+        start = time.perf_counter()
+        for i in range(0, len(vectors), batch):
+            collection.add(ids=ids[i:i + batch], embeddings=vectors[i:i + batch])
+        build_s = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for query, limit in zip(queries, kth):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query], n_results=k, include=["distances"])
+            latencies.append(time.perf_counter() - start)
+            hits += sum(1 for d in result["distances"][0] if d <= limit + tolerance)
+        client.delete_collection(collection_name)
+
+        rows.append({
+            "dataset": name, "size": len(vectors), "space": space, "max_neighbors": m,
+            "ef_construction": ef_c, "ef_search": ef_s, "build_seconds": round(build_s, 2),
+            f"recall@{k}": round(hits / (len(queries) * k), 4),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        })
+        print(rows[-1], flush=True)
+    return rows
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    defaults = config.CHROMA_HNSW
+    parser = argparse.ArgumentParser(description="Recall@k against exact search and query latency of Chroma HNSW settings")
+    parser.add_argument("--embeddings", choices=["fake", "openai"], default="fake",
+                        help="embed the corpus offline (fake) or with config.EMBEDDING_MODEL")
+    parser.add_argument("--sizes", type=_ints, default=[10_000, 50_000], help="synthetic corpus sizes; 0 to skip")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--space", default=defaults.get("space", "l2"), choices=["l2", "cosine", "ip"])
+    parser.add_argument("--max-neighbors", type=_ints, default=[defaults.get("max_neighbors", 16)])
+    parser.add_argument("--ef-construction", type=_ints, default=[defaults.get("ef_construction", 100)])
+    parser.add_argument("--ef-search", type=_ints, default=sorted({10, 50, defaults.get("ef_search", 100)}))
+    parser.add_argument("--output", help="write all rows to this JSON file")
+    args = parser.parse_args()
+
+    grid = (args.k, args.space, args.max_neighbors, args.ef_construction, args.ef_search)
+    rows = run_grid("processed_papers", *corpus_dataset(args.embeddings, args.queries), *grid)
+    for size in args.sizes:
+        if size > 0:
+            rows += run_grid(f"synthetic_{size}", *synthetic_dataset(size, args.dim, args.queries), *grid)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class FakeOpenAIServer:
+    """Local stand-in for the OpenAI chat completions and embeddings endpoints.
+
+    Latency, token counts and error rates are configurable so benchmarks can run
+    without network access and with reproducible load.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.02, tail_rate=0.0, tail_latency=2.0,
+                 error_rate=0.0, rate_limit_rate=0.0, completion_tokens=None, embedding_dim=1536, seed=0,
+                 prompt_cache=True, malformed_rate=0.0, malformed_models=("gpt-4.1-nano",)):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.completion_tokens = completion_tokens
+        self.embedding_dim = embedding_dim
+        self.prompt_cache = prompt_cache
+        # Share of questions from the weaker models written without their answer line
+        self.malformed_rate = malformed_rate
+        self.malformed_models = malformed_models
+        self._cached_prefixes = set()
+        self.random = random.Random(seed)
+        self.stats = {"chat": 0, "embeddings": 0, "errors": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def api_base(self) -> str:
+        return f"http://{self.host}:{self._server.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        handler = type("FakeOpenAIHandler", (_FakeOpenAIHandler,), {"fake": self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True).start()
+        logger.info(f"Fake OpenAI server listening on {self.api_base}")
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _roll(self) -> Dict:
+        """Decide the delay and outcome of one request"""
+        with self._lock:
+            delay = max(0.0, self.random.gauss(self.latency, self.jitter))
+            if self.random.random() < self.tail_rate:
+                delay += self.tail_latency
+            outcome = "ok"
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                outcome = "rate_limited"
+            elif roll < self.rate_limit_rate + self.error_rate:
+                outcome = "error"
+        return {"delay": delay, "outcome": outcome}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def cached_tokens(self, prompt_text: str) -> int:
+        """Mimic OpenAI prompt caching: prompts of 1024+ tokens reuse the longest previously seen
+        prefix, in 128-token steps (about 4 characters per token here)"""
+        if not self.prompt_cache or len(prompt_text) < 4096:
+            return 0
+        boundaries = range(4096, len(prompt_text) + 1, 512)
+        digests = [hashlib.blake2b(prompt_text[:end].encode("utf-8"), digest_size=16).digest() for end in boundaries]
+        with self._lock:
+            hit = max((end for end, digest in zip(boundaries, digests) if digest in self._cached_prefixes), default=0)
+            self._cached_prefixes.update(digests)
+        return self.count_tokens(prompt_text[:hit]) if hit else 0
+
+    def chat_response(self, request: Dict) -> Dict:
+        messages = request.get("messages", [])
+        prompt_text = "\n".join(str(m.get("content") or "") for m in messages)
+        system_text = messages[0].get("content", "") if messages else ""
+        last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        malformed = self.malformed_rate if request.get("model") in self.malformed_models else 0.0
+
+        if "case study" in system_text.lower():
+            content = self._case_study(last_user, malformed)
+        else:
+            match = re.search(r"Number of Questions:\s*(\d+)", last_user) or re.search(r"Generate (\d+)", last_user)
+            count = int(match.group(1)) if match else 5
+            topic_match = re.search(r"Topic:\s*([^\n]+)", last_user)
+            words = re.findall(r"[a-z]{4,}", prompt_text.lower()) or ["management"]
+            content = "\n\n".join(self._question(topic_match.group(1).strip() if topic_match else "the topic", i, words,
+                                                 malformed) for i in range(count))
+
+        completion_tokens = self.completion_tokens or self.count_tokens(content)
+        if request.get("max_tokens"):
+            completion_tokens = min(completion_tokens, request["max_tokens"])
+        prompt_tokens = self.count_tokens(prompt_text)
+        cached = self.cached_tokens(prompt_text)
+        return {
+            "id": f"chatcmpl-fake-{self.random.randrange(10 ** 9)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached}}
+        }
+
+    def _question(self, topic: str, index: int, words: List[str], malformed: float = 0.0) -> str:
+        """One question in the repo's format; wording is drawn from the prompt so questions differ"""
+        with self._lock:
+            answer = "ABCD"[self.random.randrange(4)]
+            stem, *options = (" ".join(self.random.choice(words) for _ in range(n)) for n in (14, 5, 5, 5, 5))
+            answer_line = "" if self.random.random() < malformed else f"Answer: {answer}\n"
+        return (f"Question: {index + 1}. In the context of {topic}, {stem}?\n"
+                f"A. {options[0]}\n"
+                f"B. {options[1]}\n"
+                f"C. {options[2]}\n"
+                f"D. {options[3]}\n"
+                f"{answer_line}"
+                f"Explanation: Option {answer} matches the NCERT description of {topic}.")
+
+    def _case_study(self, request_text: str, malformed: float = 0.0) -> str:
+        match = re.search(r"with (\d+) questions", request_text)
+        count = int(match.group(1)) if match else 5
+        topic_match = re.search(r"case study on (.+?) with", request_text)
+        topic = topic_match.group(1).strip() if topic_match else "the topic"
+        words = re.findall(r"[a-z]{4,}", request_text.lower()) or ["business"]
+        questions = "\n\n".join(self._question(topic, i, words, malformed).replace("Question: ", "") for i in range(count))
+        return (f"CASE STUDY: A firm facing {topic}\n\n"
+                f"{' '.join(['A mid-sized company reviews how it handles ' + topic + '.'] * 12)}\n\n"
+                f"QUESTIONS:\n\n{questions}")
+
+    def embedding(self, text: str) -> List[float]:
+        """Deterministic bag-of-words embedding so similar texts land close together"""
+        vector = [0.0] * self.embedding_dim
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.embedding_dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embeddings_response(self, request: Dict) -> Dict:
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = [{"object": "embedding", "index": i, "embedding": self.embedding(str(text))}
+                for i, text in enumerate(inputs)]
+        tokens = sum(self.count_tokens(str(text)) for text in inputs)
+        return {"object": "list", "data": data, "model": request.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    fake: FakeOpenAIServer = None
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+            return
+
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/chat/completions"):
+            kind, build = "chat", self.fake.chat_response
+        elif path.endswith("/embeddings"):
+            kind, build = "embeddings", self.fake.embeddings_response
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}", "type": "invalid_request_error"}})
+            return
+
+        roll = self.fake._roll()
+        time.sleep(roll["delay"])
+        if roll["outcome"] == "rate_limited":
+            self.fake._count("rate_limited")
+            self._send_json(429, {"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_error"}})
+            return
+        if roll["outcome"] == "error":
+            self.fake._count("errors")
+            self._send_json(500, {"error": {"message": "Internal server error (fake)", "type": "server_error"}})
+            return
+
+        self.fake._count(kind)
+        self._send_json(200, build(request))
+
+    def log_message(self, format, *args):
+        logger.debug("fake openai: " + format % args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake OpenAI API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="share of requests that get --tail-latency added")
+    parser.add_argument("--tail-latency", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=None)
+    parser.add_argument("--no-prompt-cache", action="store_true", help="never report cached prompt tokens")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeOpenAIServer(port=args.port, latency=args.latency, jitter=args.jitter, tail_rate=args.tail_rate,
+                              tail_latency=args.tail_latency, error_rate=args.error_rate,
+                              rate_limit_rate=args.rate_limit_rate, completion_tokens=args.completion_tokens,
+                              prompt_cache=not args.no_prompt_cache).start()
+    print(f"export OPENAI_API_BASE={server.api_base}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
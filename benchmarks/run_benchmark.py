@@ -0,0 +1,230 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+# Allow `python benchmarks/run_benchmark.py` as well as `python -m benchmarks.run_benchmark`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from benchmarks.fake_openai import FakeOpenAIServer
+from utils.llm_client import HEDGE_POLICY, cascade_models
+from utils.token_tracker import _percentile
+
+logger = logging.getLogger(__name__)
+
+
+def _latency_stats(values: List[float]) -> Dict:
+    return {
+        "count": len(values),
+        "p50": round(_percentile(values, 50), 4),
+        "p95": round(_percentile(values, 95), 4),
+        "max": round(max(values), 4) if values else 0.0
+    }
+
+
+def count_questions(paper: Dict) -> int:
+    """Count generated questions in a paper, including case-study questions"""
+    total = 0
+    for topic, questions in paper.items():
+        if topic == "case_studies":
+            total += sum(str(case.get("questions", "")).count("Answer:") for case in questions or [])
+        elif isinstance(questions, list):
+            total += sum(1 for q in questions if str(q).strip())
+    return total
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+class BenchmarkRunner:
+    """Drive main.main and the agents against a FakeOpenAIServer and collect throughput numbers"""
+
+    def __init__(self, server: FakeOpenAIServer, work_dir: str, corpus_path: str = "processed_papers/1.json"):
+        self.server = server
+        self.work_dir = work_dir
+        self.corpus_path = corpus_path
+
+    def run_papers(self, subjects: List[str], papers_per_subject: int) -> Dict:
+        import main
+
+        paper_latencies = []
+        node_latencies = defaultdict(list)
+        total_tokens = 0
+        total_cost = 0.0
+        prompt_tokens = 0
+        cached_tokens = 0
+        total_questions = 0
+        start = time.perf_counter()
+
+        for subject in subjects:
+            for i in range(papers_per_subject):
+                output_path = os.path.join(self.work_dir, f"{subject.lower().replace(' ', '_')}_{i}.json")
+                paper_start = time.perf_counter()
+                paper = main.main(self.corpus_path, output_path, subject)
+                paper_latencies.append(time.perf_counter() - paper_start)
+                total_questions += count_questions(paper)
+
+                usage_path = f"{os.path.splitext(output_path)[0]}_usage.json"
+                if os.path.exists(usage_path):
+                    with open(usage_path, encoding="utf-8") as f:
+                        usage = json.load(f)
+                    total_tokens += usage["totals"]["prompt_tokens"] + usage["totals"]["completion_tokens"]
+                    prompt_tokens += usage["totals"]["prompt_tokens"]
+                    total_cost += usage["totals"].get("cost", 0.0)
+                    cached_tokens += usage["totals"].get("cached_prompt_tokens", 0)
+                    for call in usage["calls"]:
+                        if call.get("latency") is not None:
+                            node_latencies[call.get("node") or "unknown"].append(call["latency"])
+
+        elapsed = time.perf_counter() - start
+        papers = len(paper_latencies)
+        return {
+            "papers": papers,
+            "seconds": round(elapsed, 3),
+            "papers_per_minute": round(papers / elapsed * 60, 2) if elapsed else 0.0,
+            "paper_latency": _latency_stats(paper_latencies),
+            "node_latency": {node: _latency_stats(values) for node, values in sorted(node_latencies.items())},
+            "questions": total_questions,
+            "tokens": total_tokens,
+            "tokens_per_question": round(total_tokens / total_questions, 1) if total_questions else 0.0,
+            "prompt_cache_hit_rate": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0,
+            "cost_per_paper": round(total_cost / papers, 6) if papers else 0.0
+        }
+
+    def run_agents(self, subject: str, iterations: int) -> Dict:
+        from agents.question_agent import QuestionAgent
+        from agents.case_q_agent import CaseQuestionAgent
+        from agents.distribution_agent import DistributionAgent
+        from utils.token_tracker import TokenTracker
+
+        tracker = TokenTracker()
+        distribution = DistributionAgent(subject).analyze_distribution({"detected_topics": [], "total_questions": 50})
+        topics = list(distribution["distribution"].keys())
+        question_agent = QuestionAgent(subject, tracker)
+        case_agent = CaseQuestionAgent(subject, tracker)
+
+        results = {}
+        timings = []
+        for i in range(iterations):
+            topic = topics[i % len(topics)]
+            state = {
+                "remaining_topics": [topic],
+                "distribution": distribution["distribution"],
+                "context": {},
+                "questions": {},
+                "detected_topics": topics
+            }
+            start = time.perf_counter()
+            question_agent.generate_questions(state)
+            timings.append(time.perf_counter() - start)
+        results["QuestionAgent.generate_questions"] = _latency_stats(timings)
+
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            case_agent.generate_case_studies({"context": {}})
+            timings.append(time.perf_counter() - start)
+        results["CaseQuestionAgent.generate_case_studies"] = _latency_stats(timings)
+        return results
+
+
+def compare_to_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """List throughput regressions beyond the tolerance (as a fraction of the baseline)"""
+    failures = []
+    current, previous = report["papers"], baseline.get("papers", {})
+    if previous.get("papers_per_minute") and \
+            current["papers_per_minute"] < previous["papers_per_minute"] * (1 - tolerance):
+        failures.append(f"papers/min dropped {previous['papers_per_minute']} -> {current['papers_per_minute']}")
+    if previous.get("tokens_per_question") and \
+            current["tokens_per_question"] > previous["tokens_per_question"] * (1 + tolerance):
+        failures.append(f"tokens/question rose {previous['tokens_per_question']} -> {current['tokens_per_question']}")
+    for node, stats in current["node_latency"].items():
+        before = previous.get("node_latency", {}).get(node)
+        if before and before["p95"] and stats["p95"] > before["p95"] * (1 + tolerance):
+            failures.append(f"p95 latency of {node} rose {before['p95']} -> {stats['p95']}")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark against a fake OpenAI server")
+    parser.add_argument("--subjects", nargs="+", default=["Business Studies", "Economics"])
+    parser.add_argument("--papers", type=int, default=2, help="papers per subject")
+    parser.add_argument("--agent-iterations", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--tail-rate", type=float, default=0.0)
+    parser.add_argument("--tail-latency", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=None)
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="share of questions from the cheapest cascade model missing their answer")
+    parser.add_argument("--hedge", action="store_true", help="hedge slow chat completions (config.LLM_HEDGE)")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    server = FakeOpenAIServer(latency=args.latency, jitter=args.jitter, tail_rate=args.tail_rate,
+                              tail_latency=args.tail_latency, error_rate=args.error_rate,
+                              rate_limit_rate=args.rate_limit_rate,
+                              completion_tokens=args.completion_tokens, malformed_rate=args.malformed_rate,
+                              malformed_models=tuple(cascade_models()[:1])).start()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        config.OPENAI_API_BASE = server.api_base
+        config.OPENAI_API_KEY = config.OPENAI_API_KEY or "sk-benchmark"
+        os.environ.setdefault("OPENAI_API_KEY", config.OPENAI_API_KEY)
+        # Nothing the fake server generates may reach the real indexes, caches or queues
+        config.CHROMA_DB_PATH = os.path.join(work_dir, "chroma")
+        config.NUMPY_INDEX_PATH = os.path.join(work_dir, "vector_index")
+        config.NOVELTY_INDEX_PATH = os.path.join(work_dir, "novelty_index.db")
+        config.TOPIC_CACHE_DIR = os.path.join(work_dir, "topic_cache")
+        config.BATCH_JOB_DIR = os.path.join(work_dir, "batch_jobs")
+        config.POOL_PATH = os.path.join(work_dir, "question_pool.db")
+        config.QUEUE_PATH = os.path.join(work_dir, "jobs.db")
+        config.LLM_RETRY_BACKOFF = 0.01
+        config.LLM_HEDGE = args.hedge
+        config.METRICS_PORT, config.METRICS_TEXTFILE = 0, None
+
+        runner = BenchmarkRunner(server, work_dir)
+        papers = runner.run_papers(args.subjects, args.papers)
+        logging.getLogger().setLevel(logging.WARNING)
+        agents = runner.run_agents(args.subjects[0], args.agent_iterations)
+    server.stop()
+
+    report = {
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "papers": papers,
+        "agents": agents,
+        "server": server.stats,
+        "hedging": HEDGE_POLICY.stats() if args.hedge else None,
+        "peak_rss_mb": peak_rss_mb()
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures = compare_to_baseline(report, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION: {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,12 +4,139 @@ from dotenv import load_dotenv
 load_dotenv()
 # API Keys and Models
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE")  # e.g. the local fake server used by benchmarks/
 EMBEDDING_MODEL = "text-embedding-3-small"
 GPT_MODEL = "gpt-4o-mini"
 
+# Model cascade for QuestionAgent and CaseQuestionAgent, cheapest first: a topic is generated on
+# the first model and only the questions failing local format checks (utils/question_validator)
+# are regenerated on the next, e.g. MODEL_CASCADE=gpt-4.1-nano,gpt-4o-mini. Opt-in: unset (or one
+# model), everything is generated on GPT_MODEL
+MODEL_CASCADE = [m.strip() for m in os.getenv("MODEL_CASCADE", "").split(",") if m.strip()]
+
+# USD per 1M tokens, used by TokenTracker for cost estimates
+MODEL_PRICING = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gpt-3.5-turbo": {"input": 0.50, "cached_input": 0.50, "output": 1.50},
+    "text-embedding-3-small": {"input": 0.02, "cached_input": 0.02, "output": 0.0},
+    "text-embedding-ada-002": {"input": 0.10, "cached_input": 0.10, "output": 0.0},
+}
+
+# Retries for transient OpenAI errors (rate limits, timeouts, 5xx)
+LLM_MAX_RETRIES = 2
+LLM_RETRY_BACKOFF = 2.0  # seconds, doubled on every retry
+
+# Hedged requests (LLM_HEDGE=1): a call still running after the LLM_HEDGE_PERCENTILE latency of the
+# last LLM_HEDGE_WINDOW calls to its model is sent again and the first answer wins. Duplicates are
+# capped at LLM_HEDGE_MAX_RATE of calls and LLM_HEDGE_MAX_COST of the spend
+LLM_HEDGE = os.getenv("LLM_HEDGE", "").lower() not in ("", "0", "false")
+LLM_HEDGE_PERCENTILE = 95
+LLM_HEDGE_WINDOW = 200
+LLM_HEDGE_MIN_SAMPLES = 20  # no hedging until a model has this many latencies
+LLM_HEDGE_MIN_DELAY = 0.5  # seconds; never hedge sooner than this
+LLM_HEDGE_MAX_RATE = 0.1
+LLM_HEDGE_MAX_COST = 0.1
+
+# Spending limits per paper, and per batch run (workflow.batch_planner) or queue worker process
+# (workflow.job_queue) on top of its papers' own; None disables a limit
+PAPER_BUDGET = {"max_tokens": 400_000, "max_cost": 0.25, "max_seconds": 1800}
+BATCH_BUDGET = {"max_tokens": None, "max_cost": None, "max_seconds": None}
+BUDGET_LOW_WATER = 0.25  # share of a budget left at which generation starts degrading
+BUDGET_FALLBACK_MODEL = "gpt-4.1-nano"  # cheaper model used once a budget runs low
+
+# Metrics exporter (disabled unless one of these is set)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+
+# Per-node profiling (PAPER_PROFILE=1): stack samples and tracemalloc diffs per workflow node and
+# topic, written as <paper>.profile.folded (flamegraph input) and <paper>.profile.json
+PROFILE = os.getenv("PAPER_PROFILE", "").lower() not in ("", "0", "false")
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_MEMORY = os.getenv("PAPER_PROFILE_MEMORY", "sizes")  # "" off, "sizes", or "sites" (slow snapshot diffs)
+PROFILE_TRACEMALLOC_FRAMES = 1
+PROFILE_TOP_ALLOCATIONS = 10
+
 # Database Settings
 CHROMA_DB_PATH = "./bs_question_db"
-COLLECTION_NAME = "business_studies"
+COLLECTION_NAME = "business_studies"  # questions with no subject; a subject's own collection is its slug
+CORPUS_SUBJECT = "Business Studies"  # subject of the processed_papers corpus
+# "chroma" (PersistentClient at CHROMA_DB_PATH) or "numpy" (memory-mapped exact search at NUMPY_INDEX_PATH)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+NUMPY_INDEX_PATH = "./vector_index"
+# Hybrid retrieval: BM25 over the corpus and PYQs fused with vector results (reciprocal rank
+# fusion); used alone while the embedding API fails
+HYBRID_RETRIEVAL = True
+HYBRID_CANDIDATES = 20  # results taken from each side before fusing
+HYBRID_RRF_K = 60
+HYBRID_LEXICAL_WEIGHT = 1.0
+HYBRID_VECTOR_COOLDOWN = 60  # seconds to skip vector search after it fails
+
+# TopicExtractor: "local" clusters every corpus question's embedding with k-means (cached per
+# corpus in TOPIC_CACHE_DIR), "llm" asks the chat model about a sample of the questions
+TOPIC_DISCOVERY = "local"
+TOPIC_CLUSTERS = 10
+TOPIC_CACHE_DIR = "./.topic_cache"
+# Tag corpus questions with their syllabus topic (nearest topic centroid) when a corpus is loaded.
+# Collections built before tagging have no topic metadata until they are recreated
+TOPIC_TAGGING = True
+# HNSW index of the question collection (Chroma's defaults). space, max_neighbors (M) and
+# ef_construction only take effect when the collection is created; ef_search is applied to
+# an existing collection on open. Tune with python -m benchmarks.bench_vector_search
+CHROMA_HNSW = {"space": "l2", "max_neighbors": 16, "ef_construction": 100, "ef_search": 100}
+
+# Case studies run alongside topic generation on this many threads
+CASE_STUDY_WORKERS = 4
+# PYQ case studies shown to CaseQuestionAgent: at most this many, within this many prompt tokens
+CASE_STUDY_EXAMPLES = 2
+CASE_STUDY_EXAMPLE_TOKENS = 1500
+
+# Novelty check: generated questions too close to a PYQ or an earlier paper are regenerated
+NOVELTY_CHECK = True
+NOVELTY_INDEX_PATH = "./novelty_index.db"
+NOVELTY_THRESHOLD = 0.7  # word-set Jaccard similarity above which a question counts as a copy
+
+# Paper generation service (python service.py)
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+SERVICE_WORKERS = 2  # papers generated at the same time
+SERVICE_CORPUS_PATH = "processed_papers/1.json"
+SERVICE_OUTPUT_DIR = "./outputs/service"
+SERVICE_MAX_JOBS = 1000  # finished jobs kept in memory for GET /papers/<id>
+# Serve "source": "pool" requests from POOL_PATH; off, no pool is opened and no refills run
+SERVICE_POOL = os.getenv("SERVICE_POOL", "").lower() not in ("", "0", "false")
+
+# Durable job queue for bulk generation (python -m workflow.job_queue)
+QUEUE_PATH = os.getenv("QUEUE_PATH", "./jobs.db")
+QUEUE_LEASE_SECONDS = 600  # extended by worker heartbeats every third of this
+QUEUE_MAX_ATTEMPTS = 3  # then the job moves to the dead-letter queue
+QUEUE_RETRY_BACKOFF = 30.0  # seconds before the first retry, doubling after each failure
+
+# Topic-major batch mode (python -m workflow.batch_planner): questions per call are
+# limited to BATCH_COMPLETION_TOKENS / BATCH_TOKENS_PER_QUESTION
+BATCH_COMPLETION_TOKENS = 12000
+BATCH_TOKENS_PER_QUESTION = 250
+BATCH_TOPUP_ROUNDS = 1  # extra calls for a topic when duplicates leave it short
+BATCH_TOPIC_WORKERS = 4
+
+# Offline batch jobs (python -m workflow.batch_planner --offline): each round of requests is one
+# JSONL job sent through BATCH_JOB_BACKEND, "openai" (the Batch API, billed at BATCH_JOB_PRICE_FACTOR
+# of the normal price) or "local" (a file-based stand-in answering through the chat endpoint)
+BATCH_JOB_BACKEND = os.getenv("BATCH_JOB_BACKEND", "openai")
+BATCH_JOB_DIR = "./batch_jobs"  # request files, and the local backend's jobs
+BATCH_JOB_COMPLETION_WINDOW = "24h"
+BATCH_JOB_POLL_SECONDS = 60
+BATCH_JOB_TIMEOUT = 26 * 3600  # give up on (and cancel) a job after this many seconds
+BATCH_JOB_PRICE_FACTOR = 0.5
+
+# Pre-generated question pool (python -m data.question_pool)
+POOL_PATH = os.getenv("POOL_PATH", "./question_pool.db")
+POOL_MAX_USES = 1  # papers a pooled question may appear in
+POOL_LOW_WATER_PAPERS = 3  # refill a topic when it holds fewer than this many papers' worth
+POOL_REFILL_PAPERS = 10  # papers' worth generated per refill
+POOL_CASE_STUDIES_PER_PAPER = 2
 
 # Default Topics (used as fallback)
 DEFAULT_TOPIC_BST = {
@@ -0,0 +1,164 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+import config
+from data.vector_store import collection_name, corpus_documents, matches_where
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or that the this to was which with "
+    "following statement statements given correct option options choose".split()
+)
+
+
+def terms(text: str) -> List[str]:
+    return [t for t in _WORD.findall(str(text).lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+def _empty_results() -> Dict:
+    return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+
+class _Partition:
+    """One collection's BM25 statistics and postings"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List] = defaultdict(list)  # term -> [(row, term frequency)]
+        self.known = set()  # document texts, so re-adding a corpus is a no-op
+
+
+class LexicalIndex:
+    """In-process BM25 over question texts, partitioned like the vector collections.
+
+    Needs no network and no embeddings, so retrieval keeps working while the embedding
+    API is down; a few thousand questions index in milliseconds.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._partitions: Dict[str, _Partition] = defaultdict(_Partition)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, documents: List[str], metadatas: List[Dict], ids: List[str]) -> int:
+        """Index documents into a collection; texts already indexed there are skipped"""
+        added = 0
+        with self._lock:
+            part = self._partitions[name]
+            for document, metadata, doc_id in zip(documents, metadatas, ids):
+                if document in part.known:
+                    continue
+                row = len(part.ids)
+                words = terms(document)
+                for term, count in Counter(words).items():
+                    part.postings[term].append((row, count))
+                part.ids.append(doc_id)
+                part.documents.append(document)
+                part.metadatas.append(metadata)
+                part.lengths.append(len(words))
+                part.known.add(document)
+                added += 1
+        return added
+
+    def add_corpus(self, corpus: List[Dict], subject: str) -> int:
+        return self.add(collection_name(subject), *corpus_documents(corpus, subject))
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return len(self._partitions[name].ids) if name in self._partitions else 0
+
+    def search(self, query_text: str, n_results: int = 5, subject: str = None, where: Dict = None) -> Dict:
+        """Top BM25 matches in Chroma's result layout; "distances" holds negated scores"""
+        with self._lock:
+            part = self._partitions.get(collection_name(subject))
+            if part is None or not part.ids:
+                return _empty_results()
+            total = len(part.ids)
+            avg_length = sum(part.lengths) / total or 1.0
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(terms(query_text)):
+                postings = part.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for row, tf in postings:
+                    norm = self.k1 * (1 - self.b + self.b * part.lengths[row] / avg_length)
+                    scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            if where:
+                scores = {row: score for row, score in scores.items()
+                          if matches_where(part.metadatas[row] or {}, where)}
+            top = sorted(scores, key=scores.get, reverse=True)[:n_results]
+            return {"ids": [[part.ids[r] for r in top]], "documents": [[part.documents[r] for r in top]],
+                    "metadatas": [[part.metadatas[r] for r in top]], "distances": [[-scores[r] for r in top]]}
+
+
+class HybridStore:
+    """Vector store wrapper that fuses its results with a BM25 lexical index.
+
+    Both rankings are combined by reciprocal rank fusion. When the vector search fails
+    (embedding API down or rate limited) the lexical results are returned alone, and the
+    vector side is skipped for config.HYBRID_VECTOR_COOLDOWN seconds so queries do not
+    keep paying for the failing call.
+    """
+
+    def __init__(self, vector_store, lexical_index: LexicalIndex = None):
+        self.vector_store = vector_store
+        self.lexical = lexical_index or LexicalIndex()
+        self._vector_down_until = 0.0
+
+    def get_or_create_collection(self, *args, **kwargs):
+        return self.vector_store.get_or_create_collection(*args, **kwargs)
+
+    def initialize_from_corpus(self, corpus: List[Dict], subject: str = None) -> None:
+        """Index the corpus lexically, then in the vector store (whose errors still propagate)"""
+        added = self.lexical.add_corpus(corpus, subject or config.CORPUS_SUBJECT)
+        logger.info(f"Added {added} documents to the lexical index")
+        self.vector_store.initialize_from_corpus(corpus, subject)
+
+    def add_records(self, records: List[Dict], subject: str) -> int:
+        """Index extra questions (e.g. a subject's PYQs) for lexical retrieval only"""
+        return self.lexical.add_corpus(records, subject)
+
+    def _vector_results(self, query_text, n_results, subject, where):
+        if time.monotonic() < self._vector_down_until:
+            return None
+        try:
+            return self.vector_store.search(query_text, n_results, subject, where)
+        except Exception as e:
+            if isinstance(e, FileNotFoundError) or "does not exist" in str(e):
+                return None
+            self._vector_down_until = time.monotonic() + config.HYBRID_VECTOR_COOLDOWN
+            logger.warning(f"Vector search failed, using lexical retrieval only for "
+                           f"{config.HYBRID_VECTOR_COOLDOWN}s: {e}")
+            return None
+
+    def query_collection(self, query_text, n_results=5, subject: str = None, where: Dict = None):
+        """Fused vector and lexical matches; lexical alone if the vector side is unavailable"""
+        candidates = max(n_results, config.HYBRID_CANDIDATES)
+        lexical = self.lexical.search(query_text, candidates, subject, where)
+        vector = self._vector_results(query_text, candidates, subject, where)
+        if not vector or not vector.get("documents") or not vector["documents"][0]:
+            return {key: [values[0][:n_results]] for key, values in lexical.items()}
+
+        # Reciprocal rank fusion, keyed on the document text so both sides agree on identity
+        fused: Dict[str, float] = defaultdict(float)
+        entries = {}
+        for results, weight in ((vector, 1.0), (lexical, config.HYBRID_LEXICAL_WEIGHT)):
+            for rank, (doc_id, document, metadata) in enumerate(zip(results["ids"][0], results["documents"][0],
+                                                                      results["metadatas"][0])):
+                fused[document] += weight / (config.HYBRID_RRF_K + rank + 1)
+                entries.setdefault(document, (doc_id, metadata))
+        top = sorted(fused, key=fused.get, reverse=True)[:n_results]
+        return {"ids": [[entries[d][0] for d in top]], "documents": [top],
+                "metadatas": [[entries[d][1] for d in top]], "distances": [[-fused[d] for d in top]]}
@@ -0,0 +1,108 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, List
+import config
+from utils.dedup import NearDuplicateIndex
+
+logger = logging.getLogger(__name__)
+
+_SKIP_LINE = re.compile(r"^\s*(answer|correct answer|explanation|solution)\s*[:\-]", re.IGNORECASE)
+_LABEL = re.compile(r"^\s*(question\s*\d*\s*[:.]|\d+\s*[.)]|\(?[a-d1-4]\)|[a-d]\.)\s*", re.IGNORECASE)
+
+
+def question_text(text: str) -> str:
+    """Question stem and options only, without labels, answers or explanations"""
+    lines = []
+    for line in str(text).splitlines():
+        if _SKIP_LINE.match(line):
+            continue
+        lines.append(_LABEL.sub("", line))
+    return " ".join(lines)
+
+
+class NoveltyIndex:
+    """Persistent index of known questions (PYQs, mocks and earlier generated papers).
+
+    Questions are stored in SQLite; a MinHash LSH index over them is kept in memory,
+    so checking a new question costs a signature plus a few bucket lookups.
+    """
+
+    def __init__(self, subject: str, path: str = None, threshold: float = None, min_words: int = 5):
+        self.subject = subject
+        self.path = path or config.NOVELTY_INDEX_PATH
+        self.threshold = config.NOVELTY_THRESHOLD if threshold is None else threshold
+        self.min_words = min_words
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY,
+            subject TEXT NOT NULL,
+            source TEXT NOT NULL,
+            text TEXT NOT NULL,
+            added_at REAL NOT NULL,
+            UNIQUE(subject, text))""")
+        self._conn.commit()
+        self._index = NearDuplicateIndex(self.threshold)
+        self._load()
+
+    def _load(self) -> None:
+        start = time.perf_counter()
+        rows = self._conn.execute("SELECT id, text FROM questions WHERE subject = ?", (self.subject,)).fetchall()
+        self._index.add_many(dict(rows))
+        logger.info(f"Loaded {len(rows)} known {self.subject} questions into the novelty index "
+                    f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def __len__(self):
+        return len(self._index)
+
+    def count(self, source: str = None) -> int:
+        query, params = "SELECT COUNT(*) FROM questions WHERE subject = ?", [self.subject]
+        if source:
+            query += " AND source = ?"
+            params.append(source)
+        return self._conn.execute(query, params).fetchone()[0]
+
+    def _checkable(self, text: str) -> bool:
+        return len(text.split()) >= self.min_words
+
+    def add(self, texts: Iterable[str], source: str) -> int:
+        """Store questions and index them; returns how many were new"""
+        cleaned = [question_text(t) for t in texts]
+        cleaned = [t for t in cleaned if self._checkable(t)]
+        added = {}
+        with self._lock:
+            for text in cleaned:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO questions (subject, source, text, added_at) VALUES (?, ?, ?, ?)",
+                    (self.subject, source, text, time.time()))
+                if cursor.rowcount:
+                    added[cursor.lastrowid] = text
+            self._conn.commit()
+            self._index.add_many(added)
+        return len(added)
+
+    def seed(self, texts: Iterable[str], source: str) -> int:
+        """Add a reference corpus (e.g. PYQs) once; later calls are no-ops"""
+        if self.count(source):
+            return 0
+        added = self.add(texts, source)
+        logger.info(f"Seeded novelty index with {added} {source} questions for {self.subject}")
+        return added
+
+    def is_duplicate(self, text: str) -> bool:
+        """True if the question nearly copies a known question"""
+        cleaned = question_text(text)
+        if not self._checkable(cleaned):
+            return False
+        with self._lock:
+            return bool(self._index.query(cleaned))
+
+    def flag_duplicates(self, texts: List[str]) -> List[int]:
+        """Indices of the texts that nearly copy a known question"""
+        return [i for i, text in enumerate(texts) if self.is_duplicate(text)]
+
+    def close(self) -> None:
+        self._conn.close()
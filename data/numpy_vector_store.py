@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List
+import numpy as np
+import config
+from data.vector_store import collection_name, corpus_documents, matches_where
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def embed_texts(texts: List[str], batch_size: int = 256) -> np.ndarray:
+    """Unit-normalized float32 embeddings of texts with config.EMBEDDING_MODEL"""
+    from utils.llm_client import _openai
+    openai = _openai()
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        response = openai.Embedding.create(input=texts[i:i + batch_size], model=config.EMBEDDING_MODEL)
+        vectors.extend(item["embedding"] for item in sorted(response["data"], key=lambda d: d["index"]))
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class StaleIndex(FileNotFoundError):
+    """A collection built with another embedding model; treated as missing so it gets rebuilt"""
+
+
+class NumpyVectorStore:
+    """Exact-search vector store over a memory-mapped float32 matrix.
+
+    A drop-in for VectorStore when the corpus is a few thousand questions. Each collection
+    is `<name>.json` (ids, documents, metadatas) pointing at a `<name>.<version>.f32` matrix
+    of unit-normalized embeddings, one row per document. The matrix is opened read-only with
+    np.memmap, so every process on the machine shares the same pages, and a batch of queries
+    is one matrix multiply. A rebuild writes a new matrix version before atomically replacing
+    the metadata, so readers always see a matching pair and pick it up on their next query.
+    """
+
+    def __init__(self, index_path=None, query_cache_size: int = 256):
+        self.index_path = index_path or config.NUMPY_INDEX_PATH
+        self.query_cache_size = query_cache_size
+        self._collections: Dict[str, Dict] = {}
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.index_path, exist_ok=True)
+
+    def _paths(self, name: str):
+        """Unversioned matrix path (indexes written before matrices were versioned) and metadata path"""
+        base = os.path.join(self.index_path, name)
+        return f"{base}.f32", f"{base}.json"
+
+    def _matrix_path(self, name: str, meta: Dict) -> str:
+        if meta.get("matrix"):
+            return os.path.join(self.index_path, meta["matrix"])
+        return self._paths(name)[0]
+
+    def embed(self, texts: List[str], batch_size: int = 256) -> np.ndarray:
+        return embed_texts(texts, batch_size)
+
+    def _embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Query embeddings, reusing recent ones (topic names are queried over and over)"""
+        with self._lock:
+            found = {}
+            for text in texts:
+                if text in self._query_cache:
+                    self._query_cache.move_to_end(text)
+                    found[text] = self._query_cache[text]
+        missing = [t for t in dict.fromkeys(texts) if t not in found]
+        if missing:
+            found.update(zip(missing, self.embed(missing)))
+            with self._lock:
+                for text in missing:
+                    self._query_cache[text] = found[text]
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return np.stack([found[t] for t in texts])
+
+    def _load(self, name: str):
+        """The collection's (matrix, meta), reopened when its metadata file has been replaced"""
+        try:
+            return self._open(name)
+        except StaleIndex:
+            raise
+        except FileNotFoundError:
+            # A rebuild may have removed the matrix between reading the old metadata and mapping it
+            return self._open(name)
+
+    def _open(self, name: str):
+        _, meta_path = self._paths(name)
+        try:
+            stat = os.stat(meta_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No vector index for collection {name} in {self.index_path}")
+        # os.replace gives the file a new inode, so a rebuild is seen even within the mtime resolution
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._collections.get(name)
+            if cached and cached["signature"] == signature:
+                return cached["matrix"], cached["meta"]
+
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["count"] and meta.get("model") != config.EMBEDDING_MODEL:
+                logger.warning(f"Vector index {name} was built with {meta.get('model')}, config asks for "
+                               f"{config.EMBEDDING_MODEL}; it will be rebuilt")
+                raise StaleIndex(f"Vector index {name} was built with {meta.get('model')}")
+            if meta["count"]:
+                matrix = np.memmap(self._matrix_path(name, meta), dtype=np.float32, mode="r",
+                                   shape=(meta["count"], meta["dim"]))
+            else:
+                matrix = np.zeros((0, meta.get("dim") or 1), dtype=np.float32)
+            self._collections[name] = {"signature": signature, "matrix": matrix, "meta": meta, "rows": {}}
+            logger.info(f"Opened vector index {name}: {meta['count']} x {meta['dim']}")
+            return matrix, meta
+
+    def _rows(self, name: str, meta: Dict, where: Dict = None):
+        """Row numbers whose metadata match `where` (None for all rows), cached per loaded index"""
+        if not where:
+            return None
+        key = json.dumps(where, sort_keys=True)
+        with self._lock:
+            cached = self._collections.get(name)
+            rows = cached["rows"].get(key) if cached and cached["meta"] is meta else None
+        if rows is None:
+            rows = np.array([i for i, m in enumerate(meta["metadatas"]) if matches_where(m or {}, where)],
+                            dtype=np.int64)
+            with self._lock:
+                cached = self._collections.get(name)
+                if cached and cached["meta"] is meta:
+                    cached["rows"][key] = rows
+        return rows
+
+    def count(self, name=config.COLLECTION_NAME) -> int:
+        try:
+            return self._load(name)[1]["count"]
+        except FileNotFoundError:
+            return 0
+
+    def write_collection(self, name: str, embeddings: np.ndarray, documents: List[str],
+                         metadatas: List[Dict], ids: List[str]) -> None:
+        """Replace a collection: a new matrix version first, then the metadata that points at it"""
+        _, meta_path = self._paths(name)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        matrix_file = f"{name}.{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.f32"
+        suffix = f".{os.getpid()}.tmp"
+        embeddings.tofile(os.path.join(self.index_path, matrix_file))
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({"model": config.EMBEDDING_MODEL, "matrix": matrix_file, "count": len(ids),
+                       "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 and len(ids) else 0,
+                       "ids": ids, "documents": documents, "metadatas": metadatas}, f)
+        os.replace(meta_path + suffix, meta_path)
+        with self._lock:
+            self._collections.pop(name, None)
+        self._remove_old_matrices(name, matrix_file)
+
+    def _remove_old_matrices(self, name: str, current: str) -> None:
+        """Delete the collection's superseded matrices; readers that still map one keep their pages"""
+        for file_name in os.listdir(self.index_path):
+            if file_name != current and file_name.startswith(f"{name}.") and file_name.endswith(".f32"):
+                try:
+                    os.remove(os.path.join(self.index_path, file_name))
+                except OSError as e:
+                    logger.debug(f"Could not remove old vector matrix {file_name}: {e}")
+
+    def get_or_create_collection(self, name=config.COLLECTION_NAME, force_recreate=False):
+        """Same contract as VectorStore: returns the collection's name, emptied if force_recreate"""
+        if force_recreate or not os.path.exists(self._paths(name)[1]):
+            self.write_collection(name, np.zeros((0, 0), dtype=np.float32), [], [], [])
+            logger.info(f"Created empty vector index: {name}")
+        return name
+
+    def initialize_from_corpus(self, corpus: List[Dict], subject: str = None) -> None:
+        """Embed the corpus questions into the subject's index unless it already holds documents"""
+        subject = subject or config.CORPUS_SUBJECT
+        name = collection_name(subject)
+        existing = self.count(name)
+        if existing > 0:
+            logger.info(f"Collection already contains {existing} documents")
+            return
+
+        documents, metadatas, ids = corpus_documents(corpus, subject)
+        if not documents:
+            logger.warning("No valid documents to add to vector store")
+            return
+        try:
+            self.write_collection(name, self.embed(documents), documents, metadatas, ids)
+            logger.info(f"Total added {len(documents)} documents to vector store")
+        except Exception as e:
+            logger.error(f"Error initializing vector store: {e}")
+            raise
+
+    def search_many(self, query_texts: List[str], n_results=5, subject: str = None, where: Dict = None) -> Dict:
+        """Top-k for several queries with one matrix multiply, in Chroma's result layout; errors are raised"""
+        name = collection_name(subject)
+        matrix, meta = self._load(name)
+        rows = self._rows(name, meta, where)
+        if rows is not None:
+            matrix = matrix[rows]
+        k = min(n_results, len(matrix))
+        if k == 0:
+            return {"ids": [[] for _ in query_texts], "documents": [[] for _ in query_texts],
+                    "metadatas": [[] for _ in query_texts], "distances": [[] for _ in query_texts]}
+        queries = self._embed_queries(query_texts)
+        with metrics.VECTOR_QUERY_LATENCY.time(collection=name):
+            scores = queries @ matrix.T
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+            scores = np.take_along_axis(scores, top, axis=1)
+        if rows is not None:
+            top = rows[top]
+
+        return {
+            "ids": [[meta["ids"][i] for i in row] for row in top],
+            "documents": [[meta["documents"][i] for i in row] for row in top],
+            "metadatas": [[meta["metadatas"][i] for i in row] for row in top],
+            "distances": [[float(1 - s) for s in row] for row in scores],
+        }
+
+    def search(self, query_text, n_results=5, subject: str = None, where: Dict = None) -> Dict:
+        return self.search_many([query_text], n_results, subject, where)
+
+    def query_many(self, query_texts: List[str], n_results=5, subject: str = None, where: Dict = None) -> Dict:
+        """search_many, with errors logged and empty results returned"""
+        try:
+            return self.search_many(query_texts, n_results, subject, where)
+        except Exception as e:
+            if isinstance(e, FileNotFoundError):
+                # Nothing has been indexed for this subject: no examples rather than another subject's
+                logger.debug(f"No {collection_name(subject)} collection to query")
+            else:
+                logger.error(f"Error querying collection {collection_name(subject)}: {e}")
+            return {"ids": [[] for _ in query_texts], "documents": [[] for _ in query_texts],
+                    "metadatas": [[] for _ in query_texts], "distances": [[] for _ in query_texts]}
+
+    def query_collection(self, query_text, n_results=5, subject: str = None, where: Dict = None):
+        """Query a subject's collection, optionally only documents whose metadata match `where`"""
+        return self.query_many([query_text], n_results, subject, where)
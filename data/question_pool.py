@@ -0,0 +1,325 @@
+import argparse
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+import config
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+CASE_STUDY = "case_study"
+
+
+def question_type(text: str) -> str:
+    """Rough question type from its wording, used to index the pool"""
+    lowered = text.lower()
+    if "assertion" in lowered and "reason" in lowered:
+        return "assertion_reason"
+    if "list i" in lowered or "match the" in lowered:
+        return "match"
+    if re.search(r"statement\s*(i|1|\()", lowered):
+        return "statement"
+    return "mcq"
+
+
+class QuestionPool:
+    """Pre-generated questions in SQLite, indexed by subject, topic, type and usage count.
+
+    Papers are assembled from the least-used questions of each topic, so a paper
+    costs a few indexed queries instead of LLM calls. A question is served to at
+    most config.POOL_MAX_USES papers.
+    """
+
+    def __init__(self, path: str = None, max_uses: int = None):
+        self.path = path or config.POOL_PATH
+        self.max_uses = max_uses or config.POOL_MAX_USES
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS pool_questions (
+            id INTEGER PRIMARY KEY,
+            subject TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            qtype TEXT NOT NULL,
+            text TEXT NOT NULL,
+            used_count INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            last_used_at REAL,
+            UNIQUE(subject, text))""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pool_lookup ON pool_questions (subject, topic, used_count, qtype)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pool_type ON pool_questions (subject, qtype, used_count)")
+        self._conn.commit()
+
+    def add(self, subject: str, topic: str, questions: Iterable[str], qtype: str = None) -> int:
+        """Store questions; returns how many were new"""
+        now = time.time()
+        rows = [(subject, topic, qtype or question_type(q), q, now) for q in questions if q and q.strip()]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO pool_questions (subject, topic, qtype, text, created_at) "
+                                   "VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def add_case_studies(self, subject: str, case_studies: Iterable[Dict]) -> int:
+        added = 0
+        for case_study in case_studies:
+            if case_study:
+                added += self.add(subject, case_study["topic"], [json.dumps(case_study)], qtype=CASE_STUDY)
+        return added
+
+    def available(self, subject: str, topic: str = None, qtype: str = None) -> int:
+        """Questions that can still be served"""
+        query, params = "SELECT COUNT(*) FROM pool_questions WHERE subject = ? AND used_count < ?", [subject, self.max_uses]
+        if topic is not None:
+            query += " AND topic = ?"
+            params.append(topic)
+        if qtype is not None:
+            query += " AND qtype = ?"
+            params.append(qtype)
+        else:
+            query += " AND qtype != ?"
+            params.append(CASE_STUDY)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def covers(self, subject: str, distribution: Dict[str, int], case_studies: int = 0) -> bool:
+        """True if a paper with this distribution can be assembled right now"""
+        if case_studies and self.available(subject, qtype=CASE_STUDY) < case_studies:
+            return False
+        return all(self.available(subject, topic) >= quota for topic, quota in distribution.items())
+
+    def _take(self, where: str, params: List, limit: int) -> List[Tuple[int, str]]:
+        rows = self._conn.execute(
+            f"SELECT id, text FROM pool_questions WHERE {where} AND used_count < ? "
+            f"ORDER BY used_count, random() LIMIT ?", [*params, self.max_uses, limit]).fetchall()
+        return rows
+
+    def assemble(self, subject: str, distribution: Dict[str, int],
+                 case_studies: int = 0) -> Tuple[Dict[str, List], Dict[str, int]]:
+        """Build a paper from the pool and mark its questions used.
+
+        Returns the paper and the shortfall per topic (empty when the pool covered everything).
+        A paper with a shortfall is returned for inspection only: none of its questions are marked used.
+        """
+        start = time.perf_counter()
+        paper, shortfall, used_ids = {}, {}, []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for topic, quota in distribution.items():
+                    rows = self._take("subject = ? AND topic = ? AND qtype != ?", [subject, topic, CASE_STUDY], quota)
+                    paper[topic] = [text for _, text in rows]
+                    used_ids += [row_id for row_id, _ in rows]
+                    if len(rows) < quota:
+                        shortfall[topic] = quota - len(rows)
+                if case_studies:
+                    rows = self._take("subject = ? AND qtype = ?", [subject, CASE_STUDY], case_studies)
+                    paper["case_studies"] = [json.loads(text) for _, text in rows]
+                    used_ids += [row_id for row_id, _ in rows]
+                    if len(rows) < case_studies:
+                        shortfall["case_studies"] = case_studies - len(rows)
+                if not shortfall:
+                    self._conn.executemany("UPDATE pool_questions SET used_count = used_count + 1, last_used_at = ? "
+                                           "WHERE id = ?", [(time.time(), row_id) for row_id in used_ids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(f"Assembled a {subject} paper from the pool in {(time.perf_counter() - start) * 1000:.1f} ms"
+                    + (f", short by {shortfall}" if shortfall else ""))
+        return paper, shortfall
+
+    def low_topics(self, subject: str, distribution: Dict[str, int], papers: int = None) -> Dict[str, int]:
+        """Topics holding fewer than `papers` (default config.POOL_LOW_WATER_PAPERS) papers' worth of questions"""
+        papers = papers or config.POOL_LOW_WATER_PAPERS
+        low = {}
+        for topic, quota in distribution.items():
+            count = self.available(subject, topic)
+            metrics.POOL_AVAILABLE.set(count, subject=subject, topic=topic)
+            if count < quota * papers:
+                low[topic] = quota
+        return low
+
+    def stats(self, subject: str = None) -> Dict:
+        query = ("SELECT subject, topic, qtype, COUNT(*), SUM(used_count < ?) FROM pool_questions "
+                 + ("WHERE subject = ? " if subject else "") + "GROUP BY subject, topic, qtype")
+        params = [self.max_uses] + ([subject] if subject else [])
+        stats = {}
+        with self._lock:
+            for subj, topic, qtype, total, available in self._conn.execute(query, params).fetchall():
+                stats.setdefault(subj, {}).setdefault(topic, {})[qtype] = {"total": total, "available": available}
+        return stats
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class PoolRefiller:
+    """Fills the pool with the existing agents, on demand or from a background thread.
+
+    Topics are generated topic-major through BatchPlanner, config.POOL_REFILL_PAPERS
+    papers' worth at a time; case studies through CaseQuestionAgent.
+    """
+
+    def __init__(self, pool: QuestionPool, resources=None, corpus_path: str = None, token_tracker=None):
+        from workflow.resources import PaperResources
+        from utils.token_tracker import TokenTracker
+
+        self.pool = pool
+        self.resources = resources or PaperResources()
+        self.corpus_path = corpus_path or config.SERVICE_CORPUS_PATH
+        self.token_tracker = token_tracker or TokenTracker()
+        self._pending = queue.Queue()
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def fill_topic(self, subject: str, topic: str, quota: int, papers: int = None) -> int:
+        from agents.question_agent import QuestionAgent
+        from workflow.batch_planner import BatchPlanner
+        from utils.budget import Budget
+
+        papers = papers or config.POOL_REFILL_PAPERS
+        # A refill may spend what its papers would have been allowed one by one, as a batch does
+        limits = {key: (value * papers if value and key != "max_seconds" else value)
+                  for key, value in config.PAPER_BUDGET.items()}
+        budget = Budget.from_config(f"pool:{subject}:{topic}", limits, low_water=config.BUDGET_LOW_WATER)
+        planner = BatchPlanner(subject, self.corpus_path, self.token_tracker, budget, resources=self.resources)
+        self.resources.corpus(self.corpus_path)
+        novelty_index = self.resources.novelty_index(subject, self.corpus_path) if config.NOVELTY_CHECK else None
+        question_agent = QuestionAgent(subject, self.token_tracker, budget=budget, novelty_index=novelty_index)
+        per_paper = planner.generate_topic(question_agent, topic, quota, papers)
+        added = self.pool.add(subject, topic, [q for questions in per_paper for q in questions])
+        logger.info(f"Added {added} {subject} questions on {topic} to the pool")
+        return added
+
+    def fill_case_studies(self, subject: str, count: int) -> int:
+        from agents.case_q_agent import CaseQuestionAgent
+
+        agent = CaseQuestionAgent(subject, self.token_tracker)
+        topics = [topic for _ in range(count) for topic in agent.select_topics()][:count]
+        with ThreadPoolExecutor(max_workers=config.CASE_STUDY_WORKERS) as executor:
+            case_studies = list(executor.map(agent.generate_case_study, topics))
+        added = self.pool.add_case_studies(subject, case_studies)
+        logger.info(f"Added {added} {subject} case studies to the pool")
+        return added
+
+    def fill(self, subject: str, distribution: Dict[str, int], papers: int = None, case_studies: int = 0) -> int:
+        """Fill every topic of a distribution (and optionally case studies) in parallel"""
+        with ThreadPoolExecutor(max_workers=config.BATCH_TOPIC_WORKERS) as executor:
+            futures = [executor.submit(self.fill_topic, subject, topic, quota, papers)
+                       for topic, quota in distribution.items()]
+            if case_studies:
+                futures.append(executor.submit(self.fill_case_studies, subject, case_studies))
+            return sum(future.result() for future in futures)
+
+    # Background refills
+
+    def request(self, subject: str, topic: str, quota: int) -> bool:
+        """Queue a refill unless one for the same topic is already pending"""
+        key = (subject, topic)
+        with self._queued_lock:
+            if key in self._queued:
+                return False
+            self._queued.add(key)
+        self._pending.put((subject, topic, quota))
+        metrics.QUEUE_DEPTH.set(self._pending.qsize(), queue="pool_refills")
+        return True
+
+    def start(self) -> "PoolRefiller":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="pool-refill", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                subject, topic, quota = self._pending.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                if topic == CASE_STUDY:
+                    self.fill_case_studies(subject, quota * config.POOL_REFILL_PAPERS)
+                else:
+                    self.fill_topic(subject, topic, quota)
+            except Exception as e:
+                logger.error(f"Error refilling the pool for {subject} / {topic}: {e}")
+            finally:
+                with self._queued_lock:
+                    self._queued.discard((subject, topic))
+                metrics.QUEUE_DEPTH.set(self._pending.qsize(), queue="pool_refills")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+def request_refills(pool: QuestionPool, refiller: PoolRefiller, subject: str, distribution: Dict[str, int],
+                    case_studies: int = 0) -> None:
+    """Queue refills for every topic (and case studies) below the low-water mark"""
+    for topic, quota in pool.low_topics(subject, distribution).items():
+        refiller.request(subject, topic, quota)
+    if case_studies and pool.available(subject, qtype=CASE_STUDY) < case_studies * config.POOL_LOW_WATER_PAPERS:
+        refiller.request(subject, CASE_STUDY, case_studies)
+
+
+def assemble_paper(pool: QuestionPool, subject: str, distribution: Dict[str, int], case_studies: int = None,
+                   refiller: PoolRefiller = None) -> Tuple[Dict[str, List], Dict[str, int]]:
+    """Assemble a paper from the pool, then queue refills for topics below the low-water mark"""
+    case_studies = config.POOL_CASE_STUDIES_PER_PAPER if case_studies is None else case_studies
+    paper, shortfall = pool.assemble(subject, distribution, case_studies)
+    if refiller:
+        request_refills(pool, refiller, subject, distribution, case_studies)
+    return paper, shortfall
+
+
+if __name__ == "__main__":
+    from utils.logging_utils import setup_logger
+    from agents.distribution_agent import DistributionAgent
+    setup_logger()
+
+    parser = argparse.ArgumentParser(description="Fill the question pool and assemble papers from it")
+    parser.add_argument("--pool", default=config.POOL_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    fill = commands.add_parser("fill", help="generate questions into the pool")
+    fill.add_argument("--subject", required=True)
+    fill.add_argument("--papers", type=int, default=config.POOL_REFILL_PAPERS, help="papers' worth per topic")
+    fill.add_argument("--case-studies", type=int, default=4)
+    assemble = commands.add_parser("assemble", help="write a paper assembled from the pool")
+    assemble.add_argument("--subject", required=True)
+    assemble.add_argument("--output", required=True)
+    stats = commands.add_parser("stats")
+    stats.add_argument("--subject", default=None)
+    args = parser.parse_args()
+
+    pool = QuestionPool(args.pool)
+    if args.command == "stats":
+        print(json.dumps(pool.stats(args.subject), indent=2))
+    else:
+        distribution = dict(DistributionAgent(args.subject).analyze_distribution(
+            {"total_questions": None, "detected_topics": list(DistributionAgent.default_topics(args.subject))}
+        )["distribution"])
+        refiller = PoolRefiller(pool)
+        try:
+            if args.command == "fill":
+                print(f"Added {refiller.fill(args.subject, distribution, args.papers, args.case_studies)} items")
+            else:
+                paper, shortfall = assemble_paper(pool, args.subject, distribution)
+                if shortfall:
+                    raise SystemExit(f"Pool is short by {shortfall}; nothing written, run fill first")
+                with open(args.output, "w", encoding="utf-8") as f:
+                    json.dump(paper, f, indent=2)
+                print(f"Wrote {args.output}")
+        finally:
+            refiller.resources.close()
+    pool.close()
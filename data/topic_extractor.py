@@ -1,45 +1,258 @@
-import logging
+import argparse
+import hashlib
 import json
+import logging
+import math
+import os
+import re
+from collections import Counter
 from typing import List, Dict
-import openai
+import numpy as np
 import config
 from utils.token_tracker import TokenTracker
+from utils.llm_client import LLMClient
 
 logger = logging.getLogger(__name__)
 
+
+# Words of the question's framing rather than its subject, left out of cluster names
+_QUESTION_WORDS = frozenset(
+    "what which who whom how why when where can could does do not true false about identify "
+    "sequence steps involved point view column ii iii iv assertion reason explanation both "
+    "one two three none all above below among refers known called means".split()
+)
+
+
+# Part of the topic cache key, so a change in how clusters are named invalidates cached names
+_NAMING_VERSION = "central-phrase"
+
+
+# Never the first or last word of a cluster name
+_FUNCTION_WORDS = frozenset(
+    "between into its his her their them they has have had than such these those under over also "
+    "very more most less some any each other same whose whom upon within without through".split()
+)
+
+
+_JOINING_WORDS = frozenset("of and in for to".split())
+
+
+def _content_word(word: str) -> bool:
+    from data.lexical_index import terms
+    return bool(terms(word)) and word not in _QUESTION_WORDS and word not in _FUNCTION_WORDS and not word.isdigit()
+
+
+def _central_phrase(examples: List[str], max_words: int = 8) -> str:
+    """The 2-4 word phrase most shared by a cluster's central questions (joined by "of", "and"...,
+    as in "span of control"); if none recurs, the start of the most central question"""
+    phrases = Counter()
+    for text in examples:
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        found = set()
+        for n in (2, 3, 4):
+            for i in range(len(words) - n + 1):
+                gram = words[i:i + n]
+                if all(_content_word(w) or 0 < j < n - 1 and w in _JOINING_WORDS for j, w in enumerate(gram)):
+                    found.add(" ".join(gram))
+        phrases.update(found)
+    recurring = [p for p, count in phrases.items() if count >= 2]
+    if recurring:
+        # Shared by the most central questions, then the most content words in the fewest words
+        best = max(recurring, key=lambda p: (phrases[p], sum(map(_content_word, p.split())), -len(p.split()), p))
+        return best.title()
+    if not examples:
+        return ""
+    # Drop the numbering and "Question:" label the generators and PYQ files put in front
+    opening = re.sub(r"^\W*(?:question\s*)?(?:\d+\s*[.):]\s*)?", "", examples[0].strip(), flags=re.IGNORECASE)
+    words = opening.split()
+    return " ".join(words[:max_words]) + (" ..." if len(words) > max_words else "")
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 50, seed: int = 0):
+    """Spherical k-means on unit vectors (k-means++ seeding); returns (labels, centroids)"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    k = max(1, min(k, n))
+
+    centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(n)]
+    closest = 1 - vectors @ centroids[0]
+    for i in range(1, k):
+        weights = np.maximum(closest, 0) ** 2
+        total = weights.sum()
+        pick = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centroids[i] = vectors[pick]
+        closest = np.minimum(closest, 1 - vectors @ centroids[i])
+
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # An emptied cluster keeps its old centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+    return labels, centroids
+
+
+def tfidf_vectors(texts: List[str], max_terms: int = 5000) -> np.ndarray:
+    """Unit-normalized TF-IDF rows over the corpus vocabulary, used when embeddings are unavailable"""
+    from data.lexical_index import terms
+
+    docs = [Counter(terms(text)) for text in texts]
+    df = Counter(term for doc in docs for term in doc)
+    vocab = {term: i for i, (term, _) in enumerate(df.most_common(max_terms))}
+    matrix = np.zeros((len(texts), max(1, len(vocab))), dtype=np.float32)
+    for row, doc in enumerate(docs):
+        for term, tf in doc.items():
+            if term in vocab:
+                matrix[row, vocab[term]] = (1 + math.log(tf)) * math.log(len(texts) / df[term])
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
 class TopicExtractor:
-    def __init__(self, token_tracker=None):
+    def __init__(self, token_tracker=None, subject=None, mode=None):
         self.token_tracker = token_tracker or TokenTracker()
-        
+        self.llm = LLMClient(self.token_tracker)
+        self.subject = subject or config.CORPUS_SUBJECT
+        self.mode = mode or config.TOPIC_DISCOVERY
+
+    def default_topics(self) -> List[str]:
+        from agents.distribution_agent import DistributionAgent
+        return list(DistributionAgent.default_topics(self.subject).keys())
+
     def extract_topics(self, corpus: List[Dict]) -> List[str]:
         """Automatically detect topics from question corpus"""
         questions = [q["question"] for q in corpus if "question" in q]
         if not questions:
             logger.warning("No questions found in corpus")
-            return config.DEFAULT_TOPICS
-        
+            return self.default_topics()
+
+        if self.mode == "local":
+            try:
+                return [cluster["name"] for cluster in self.discover_topics(questions)]
+            except Exception as e:
+                logger.error(f"Error discovering topics: {e}")
+                logger.info("Using default topics instead")
+                return self.default_topics()
+
+        # An even sample of the corpus rather than its first pages
+        sample = questions[::max(1, len(questions) // 20)][:20]
         prompt = f"""
-        Analyze these Business Studies questions and extract main topics:
-        {questions[:20]}  # Limiting to prevent token limits
-        
+        Analyze these {self.subject} questions and extract main topics:
+        {sample}
+
         Return as JSON array of topic names (maximum 10 topics)
         """
-        
+
         try:
-            response = openai.ChatCompletion.create(
-                model=config.GPT_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
+            response = self.llm.chat_completion(
+                [{"role": "user", "content": prompt}],
+                temperature=0.3,
+                node="extract_topics"
             )
-            
-            if self.token_tracker:
-                self.token_tracker.update(response)
-                
+
             response_text = response.choices[0].message.content
-            topics = json.loads(response_text)["topics"]
+            # The model may wrap the array in a code fence or in {"topics": [...]}
+            parsed = json.loads(re.sub(r"^```(?:json)?|```$", "", response_text.strip()).strip())
+            topics = parsed.get("topics", []) if isinstance(parsed, dict) else parsed
+            topics = [str(t) for t in topics if str(t).strip()]
+            if not topics:
+                raise ValueError(f"no topics in response: {response_text[:200]}")
             logger.info(f"Extracted {len(topics)} topics: {topics}")
             return topics
         except Exception as e:
             logger.error(f"Error extracting topics: {e}")
             logger.info("Using default topics instead")
-            return config.DEFAULT_TOPICS
+            return self.default_topics()
+
+    def _cache_path(self, questions: List[str], k: int, source: str) -> str:
+        digest = hashlib.sha256()
+        for text in [_NAMING_VERSION, source, str(k)] + questions:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\0")
+        return os.path.join(config.TOPIC_CACHE_DIR, f"{digest.hexdigest()[:32]}.json")
+
+    def _load_cached(self, path: str):
+        try:
+            with open(path, encoding="utf-8") as f:
+                clusters = json.load(f)
+            logger.info(f"Using cached topics from {path}")
+            return clusters
+        except (OSError, ValueError):
+            return None
+
+    def discover_topics(self, questions: List[str], k: int = None) -> List[Dict]:
+        """Cluster every question's embedding with k-means; clusters are named by their central examples.
+
+        A cluster's name is the phrase its most central questions share, or else the opening
+        of its most central question. Returns [{"name", "size", "examples"}], largest first,
+        cached per corpus and k in config.TOPIC_CACHE_DIR. Falls back to TF-IDF vectors if
+        embeddings cannot be fetched.
+        """
+        from data.numpy_vector_store import embed_texts
+
+        k = k or config.TOPIC_CLUSTERS
+        path = self._cache_path(questions, k, config.EMBEDDING_MODEL)
+        clusters = self._load_cached(path)
+        if clusters is not None:
+            return clusters
+
+        try:
+            vectors = embed_texts(questions)
+        except Exception as e:
+            logger.warning(f"Embeddings unavailable ({e}); clustering TF-IDF vectors instead")
+            path = self._cache_path(questions, k, "tfidf")
+            clusters = self._load_cached(path)
+            if clusters is not None:
+                return clusters
+            vectors = tfidf_vectors(questions)
+
+        labels, centroids = kmeans(vectors, k)
+        clusters = self._name_clusters(questions, vectors, labels, centroids)
+        os.makedirs(config.TOPIC_CACHE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(clusters, f, indent=2)
+        logger.info(f"Discovered {len(clusters)} topics from {len(questions)} questions: "
+                    f"{[c['name'] for c in clusters]}")
+        return clusters
+
+    @staticmethod
+    def _name_clusters(questions, vectors, labels, centroids, examples: int = 5) -> List[Dict]:
+        """Name each cluster after its questions nearest the centroid, which are kept as its examples"""
+        clusters, used = [], Counter()
+        for c in range(len(centroids)):
+            members = np.flatnonzero(labels == c)
+            if len(members) == 0:
+                continue
+            central = [questions[i] for i in members[np.argsort(-(vectors[members] @ centroids[c]))[:examples]]]
+            name = _central_phrase(central) or f"Topic {c + 1}"
+            used[name] += 1
+            if used[name] > 1:
+                name = f"{name} ({used[name]})"
+            clusters.append({"name": name, "size": int(len(members)), "examples": central})
+        return sorted(clusters, key=lambda cluster: -cluster["size"])
+
+if __name__ == "__main__":
+    import glob
+    from utils.logging_utils import setup_logger
+    setup_logger()
+
+    parser = argparse.ArgumentParser(description="Discover topics in a question corpus by clustering")
+    parser.add_argument("--corpus", default="processed_papers/*.json", help="corpus file or glob")
+    parser.add_argument("--subject", default=config.CORPUS_SUBJECT)
+    parser.add_argument("--k", type=int, default=None)
+    args = parser.parse_args()
+
+    corpus = []
+    for path in sorted(glob.glob(args.corpus)):
+        with open(path, encoding="utf-8") as f:
+            corpus.extend(json.load(f))
+    extractor = TopicExtractor(subject=args.subject, mode="local")
+    questions = [q["question"] for q in corpus if "question" in q]
+    for cluster in extractor.discover_topics(questions, args.k):
+        print(f"{cluster['size']:4d}  {cluster['name']}")
+        print(f"      e.g. {cluster['examples'][0][:100]!r}")
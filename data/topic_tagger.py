@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List
+import numpy as np
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class TopicTagger:
+    """Labels corpus questions with their syllabus topic by nearest topic centroid.
+
+    A topic's centroid is the mean embedding of its name and of the PYQs tagged with it.
+    Every question is embedded once and tagged with one matrix multiply, so a corpus
+    costs a single batch of embedding calls and no chat calls. Tags are cached per
+    corpus hash in config.TOPIC_CACHE_DIR.
+    """
+
+    def __init__(self, subject: str = None, pyq_records: List[Dict] = None):
+        from agents.distribution_agent import DistributionAgent
+
+        self.subject = subject or config.CORPUS_SUBJECT
+        self.topics = list(DistributionAgent.default_topics(self.subject).keys())
+        self.pyq_records = pyq_records or []
+
+    def _topic_documents(self) -> List[List[str]]:
+        """Per syllabus topic: its name plus the PYQs whose topic matches it"""
+        documents = [[topic] for topic in self.topics]
+        for record in self.pyq_records:
+            pyq_topic = str(record.get("topic", "")).lower().strip()
+            if not pyq_topic:
+                continue
+            for i, topic in enumerate(self.topics):
+                name = topic.lower().strip()
+                # Same loose match ContextAgent uses for the topic-wise PYQ files
+                if name in pyq_topic or pyq_topic in name:
+                    documents[i].append(record["question"])
+                    break
+        return documents
+
+    def _cache_path(self, questions: List[str], topic_documents: List[List[str]]) -> str:
+        """Keyed by everything the tags depend on, including the PYQs behind each topic's centroid"""
+        digest = hashlib.sha256()
+        for text in [config.EMBEDDING_MODEL, self.subject] + self.topics + questions:
+            digest.update(text.encode("utf-8"))
+            digest.update(b"\0")
+        for documents in topic_documents:
+            for text in documents:
+                digest.update(str(text).encode("utf-8"))
+                digest.update(b"\0")
+            digest.update(b"\1")
+        return os.path.join(config.TOPIC_CACHE_DIR, f"tags-{digest.hexdigest()[:32]}.json")
+
+    def _centroids(self, topic_documents: List[List[str]], vectors: np.ndarray) -> np.ndarray:
+        centroids, start = [], 0
+        for documents in topic_documents:
+            mean = vectors[start:start + len(documents)].mean(axis=0)
+            centroids.append(mean / max(np.linalg.norm(mean), 1e-12))
+            start += len(documents)
+        return np.stack(centroids)
+
+    def assign(self, questions: List[str]) -> List[Dict]:
+        """{"topic", "score"} for each question, score being the cosine similarity to the topic centroid"""
+        from data.numpy_vector_store import embed_texts
+        from data.topic_extractor import tfidf_vectors
+
+        if not questions or not self.topics:
+            return [{"topic": None, "score": 0.0} for _ in questions]
+        topic_documents = self._topic_documents()
+        path = self._cache_path(questions, topic_documents)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        flat = [text for documents in topic_documents for text in documents]
+        try:
+            vectors = embed_texts(flat + questions)
+        except Exception as e:
+            logger.warning(f"Embeddings unavailable ({e}); tagging topics with TF-IDF vectors instead")
+            vectors = tfidf_vectors(flat + questions)
+            path = None  # a TF-IDF tagging is not worth keeping once embeddings are back
+
+        centroids = self._centroids(topic_documents, vectors[:len(flat)])
+        similarity = vectors[len(flat):] @ centroids.T
+        best = similarity.argmax(axis=1)
+        tags = [{"topic": self.topics[t], "score": round(float(similarity[i, t]), 4)} for i, t in enumerate(best)]
+
+        if path:
+            os.makedirs(config.TOPIC_CACHE_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(tags, f)
+        return tags
+
+    def tag(self, corpus: List[Dict]) -> List[Dict]:
+        """Copies of the corpus records with "topic" set; records that already have one keep it"""
+        untagged = [i for i, q in enumerate(corpus) if "question" in q and not q.get("topic")]
+        tags = self.assign([corpus[i]["question"] for i in untagged])
+        tagged = list(corpus)
+        for i, tag in zip(untagged, tags):
+            if tag["topic"]:
+                tagged[i] = {**corpus[i], "topic": tag["topic"], "topic_score": tag["score"]}
+        logger.info(f"Tagged {len(untagged)} {self.subject} corpus questions with syllabus topics")
+        return tagged
@@ -1,29 +1,94 @@
 import logging
+import re
 from typing import List, Dict
-from chromadb import PersistentClient
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
 import config
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
+
+def collection_name(subject: str = None) -> str:
+    """Collection holding one subject's questions ("Business Studies" -> "business_studies")"""
+    if not subject:
+        return config.COLLECTION_NAME
+    return re.sub(r"[^a-z0-9]+", "_", subject.lower()).strip("_")
+
+
+def corpus_documents(corpus: List[Dict], subject: str):
+    """(documents, metadatas, ids) of the corpus records that have a question, as every index stores them"""
+    documents, metadatas, ids = [], [], []
+    for i, q in enumerate(corpus):
+        if "question" not in q:
+            continue
+        documents.append(q["question"])
+        metadata = {"type": q.get("question_type", "unknown"), "subject": subject}
+        if q.get("topic"):
+            metadata["topic"] = q["topic"]
+        if q.get("topic_score") is not None:
+            metadata["topic_score"] = float(q["topic_score"])
+        if "explanation" in q:
+            metadata["explanation"] = q["explanation"]
+        metadatas.append(metadata)
+        ids.append(str(q.get("question_number", i)))
+    return documents, metadatas, ids
+
+
+def matches_where(metadata: Dict, where: Dict) -> bool:
+    """Equality on every field of `where`; a {"$in": [...]} value matches any of the listed values"""
+    for key, wanted in where.items():
+        value = metadata.get(key)
+        if isinstance(wanted, dict) and "$in" in wanted:
+            if value not in wanted["$in"]:
+                return False
+        elif value != wanted:
+            return False
+    return True
+
+
+def chroma_where(where: Dict = None):
+    """A {"field": value, ...} filter in Chroma's syntax, which wants several fields wrapped in $and"""
+    if not where or len(where) == 1 or any(key.startswith("$") for key in where):
+        return where or None
+    return {"$and": [{key: value} for key, value in where.items()]}
+
+
 class VectorStore:
-    def __init__(self, db_path=config.CHROMA_DB_PATH):
-        self.client = PersistentClient(path=db_path)
-        self.embedding_fn = self._initialize_embedding_function()
-        
+    def __init__(self, db_path=None):
+        self.db_path = db_path or config.CHROMA_DB_PATH
+        self._client = None
+        self._embedding_fn = None
+
+    @property
+    def client(self):
+        """Open the Chroma client on first use"""
+        if self._client is None:
+            from chromadb import PersistentClient
+            self._client = PersistentClient(path=self.db_path)
+        return self._client
+
+    @property
+    def embedding_fn(self):
+        """Create the embedding function on first use"""
+        if self._embedding_fn is None:
+            self._embedding_fn = self._initialize_embedding_function()
+        return self._embedding_fn
+
     def _initialize_embedding_function(self):
         """Initialize the embedding function with proper error handling"""
+        from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
         try:
             return OpenAIEmbeddingFunction(
                 api_key=config.OPENAI_API_KEY, 
-                model_name=config.EMBEDDING_MODEL
+                model_name=config.EMBEDDING_MODEL,
+                api_base=config.OPENAI_API_BASE
             )
         except Exception as e:
             logger.error(f"Error initializing embedding function: {e}")
             logger.info("Falling back to text-embedding-ada-002")
             return OpenAIEmbeddingFunction(
                 api_key=config.OPENAI_API_KEY, 
-                model_name="text-embedding-ada-002"
+                model_name="text-embedding-ada-002",
+                api_base=config.OPENAI_API_BASE
             )
     
     def get_or_create_collection(self, name=config.COLLECTION_NAME, force_recreate=False):
@@ -39,8 +104,10 @@ class VectorStore:
             
             collection = self.client.get_or_create_collection(
                 name=name,
+                configuration={"hnsw": dict(config.CHROMA_HNSW)},
                 embedding_function=self.embedding_fn
             )
+            self._apply_search_ef(collection)
             logger.info(f"Successfully accessed collection: {name}")
             return collection
         except Exception as e:
@@ -52,6 +119,7 @@ class VectorStore:
                     self.client.delete_collection(name)
                     collection = self.client.create_collection(
                         name=name,
+                        configuration={"hnsw": dict(config.CHROMA_HNSW)},
                         embedding_function=self.embedding_fn
                     )
                     logger.info(f"Successfully recreated collection: {name}")
@@ -63,35 +131,35 @@ class VectorStore:
                 logger.error(f"Unexpected error with collection: {e}")
                 raise
     
-    def initialize_from_corpus(self, corpus: List[Dict]) -> None:
-        """Initialize and populate the vector store with corpus data"""
+    @staticmethod
+    def _apply_search_ef(collection) -> None:
+        """Bring an existing collection's ef_search in line with config; the other HNSW settings need a rebuild"""
+        wanted = config.CHROMA_HNSW.get("ef_search")
+        try:
+            current = (collection.configuration or {}).get("hnsw") or {}
+            if wanted and current.get("ef_search") != wanted:
+                collection.modify(configuration={"hnsw": {"ef_search": wanted}})
+                logger.info(f"Set ef_search of {collection.name} to {wanted}")
+            for key in ("space", "max_neighbors", "ef_construction"):
+                if key in config.CHROMA_HNSW and key in current and current[key] != config.CHROMA_HNSW[key]:
+                    logger.warning(f"{collection.name} was built with {key}={current[key]}, config asks for "
+                                   f"{config.CHROMA_HNSW[key]}; recreate the collection to apply it")
+        except Exception as e:
+            logger.warning(f"Could not apply HNSW search settings: {e}")
+
+    def initialize_from_corpus(self, corpus: List[Dict], subject: str = None) -> None:
+        """Initialize and populate the subject's collection with corpus data"""
+        subject = subject or config.CORPUS_SUBJECT
         try:
             # Get or recreate collection to handle dimension issues
-            collection = self.get_or_create_collection()
+            collection = self.get_or_create_collection(collection_name(subject))
             
             # Check if collection already has documents
             if collection.count() > 0:
                 logger.info(f"Collection already contains {collection.count()} documents")
                 return
             
-            # Prepare data for insertion
-            documents = []
-            metadatas = []
-            ids = []
-            
-            for i, q in enumerate(corpus):
-                if "question" not in q:
-                    continue
-                    
-                documents.append(q["question"])
-                
-                metadata = {"type": q.get("question_type", "unknown")}
-                if "explanation" in q:
-                    metadata["explanation"] = q["explanation"]
-                metadatas.append(metadata)
-                
-                question_id = str(q.get("question_number", i))
-                ids.append(question_id)
+            documents, metadatas, ids = corpus_documents(corpus, subject)
             
             if not documents:
                 logger.warning("No valid documents to add to vector store")
@@ -113,23 +181,30 @@ class VectorStore:
             logger.error(f"Error initializing vector store: {e}")
             raise
     
-    def query_collection(self, query_text, n_results=5):
-        """Query the collection with proper error handling"""
-        try:
-            collection = self.client.get_collection(
-                name=config.COLLECTION_NAME,
-                embedding_function=self.embedding_fn
-            )
-            
-            results = collection.query(
+    def search(self, query_text, n_results=5, subject: str = None, where: Dict = None):
+        """Like query_collection, but errors (embedding API down, missing collection) are raised"""
+        name = collection_name(subject)
+        collection = self.client.get_collection(
+            name=name,
+            embedding_function=self.embedding_fn
+        )
+        with metrics.VECTOR_QUERY_LATENCY.time(collection=name):
+            return collection.query(
                 query_texts=[query_text],
                 n_results=n_results,
-                include=["metadatas", "documents"]
+                where=chroma_where(where),
+                include=["metadatas", "documents", "distances"]
             )
-            
-            return results
+
+    def query_collection(self, query_text, n_results=5, subject: str = None, where: Dict = None):
+        """Query a subject's collection, optionally only documents whose metadata match `where`"""
+        try:
+            return self.search(query_text, n_results, subject, where)
         except Exception as e:
-            logger.error(f"Error querying collection: {e}")
+            if "does not exist" in str(e):
+                # Nothing has been indexed for this subject: no examples rather than another subject's
+                logger.debug(f"No {collection_name(subject)} collection to query")
+            else:
+                logger.error(f"Error querying collection {collection_name(subject)}: {e}")
             # Return empty results structure
             return {"ids": [[]], "documents": [[]], "metadatas": [[]]}
-
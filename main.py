@@ -1,19 +1,20 @@
 # =====================
 import logging
-import json
-import openai
+import os
 import config
 import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from utils.logging_utils import setup_logger
 from utils.token_tracker import TokenTracker
-from data.vector_store import VectorStore
-from data.topic_extractor import TopicExtractor
-from agents.distribution_agent import DistributionAgent
-from agents.context_agent import ContextAgent
-from agents.question_agent import QuestionAgent
-from workflow.graph_builder import WorkflowBuilder
-from agents.case_q_agent import CaseQuestionAgent
+from utils.budget import Budget
+from utils.paper_sink import PaperSink
+from utils.profiler import NodeProfiler
+from utils import metrics
+
+# openai, chromadb, langgraph and the agents are imported inside main() so that
+# importing this module (CLI start-up, batch workers) stays cheap. Run
+# `python -m utils.import_profiler main` to see where start-up time goes.
 
 # Setup logger
 logger = setup_logger()
@@ -29,94 +30,143 @@ def print_progress(message, current, total=None):
         sys.stdout.write(f"\r{message}")
     sys.stdout.flush()
 
-def main(corpus_path: str, output_path: str, subject, total_questions: int = 50):
-    """Run the complete workflow"""
+class PaperIncomplete(Exception):
+    """Raised by main(raise_on_failure=True) when topics failed or came from the fallback path"""
+
+    def __init__(self, failed_topics, paper):
+        super().__init__(f"{len(failed_topics)} topics failed or fell back: {', '.join(map(str, failed_topics))}")
+        self.failed_topics = failed_topics
+        self.paper = paper
+
+
+def main(corpus_path: str, output_path: str, subject, total_questions: int = None, batch_budget: Budget = None,
+         distribution_overrides: dict = None, resources=None, raise_on_failure: bool = False):
+    """Run the complete workflow; spending is limited by config.PAPER_BUDGET and the optional batch budget.
+
+    total_questions resizes the subject's distribution; None keeps it as configured.
+    Pass a PaperResources to reuse a warm vector store, context agents and novelty indexes
+    across papers; otherwise they are built for this paper and released at the end.
+    The paper is always saved. With raise_on_failure, PaperIncomplete is raised afterwards if
+    any topic got no questions or was generated by the fallback path (e.g. during an API
+    outage), so callers such as queue workers can retry instead of shipping placeholders.
+    """
+    from utils.llm_client import LLMClient
+    from agents.distribution_agent import DistributionAgent
+    from agents.question_agent import QuestionAgent
+    from agents.case_q_agent import CaseQuestionAgent
+    from workflow.graph_builder import WorkflowBuilder
+    from workflow.resources import PaperResources
+
     # Initialize components
-    openai.api_key = config.OPENAI_API_KEY
+    metrics.start_exporter_from_config()
     token_tracker = TokenTracker()
-    vector_store = VectorStore()
+    budget = Budget.from_config(f"paper:{os.path.basename(output_path)}", config.PAPER_BUDGET,
+                                parent=batch_budget, low_water=config.BUDGET_LOW_WATER)
+    llm = LLMClient(token_tracker, budget=budget)
+    owns_resources = resources is None
+    resources = resources or PaperResources()
+    sink = None
+    case_executor = None
+    profiler = NodeProfiler() if config.PROFILE else None
     # topic_extractor = TopicExtractor(token_tracker)
     
     # Initialize final_paper to a default value
     final_paper = {}
+    result = {}
+    failed_topics = []
     
     try:
+        # Each topic is appended to <output>.partial.jsonl as soon as it is generated
+        sink = PaperSink(output_path)
+
         # Load question papers
-        logger.info(f"Loading corpus from {corpus_path}")
-        try:
-            with open(corpus_path, encoding="utf-8") as f:
-                corpus = json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading corpus: {e}")
-            logger.info("Using empty corpus instead")
-            corpus = []
+        resources.corpus(corpus_path)
         
         # Preprocess data
-        if subject == "Business Studies":
-            detected_topics = config.DEFAULT_TOPIC_BST.keys()
-        elif subject == "Maths-Core":
-            detected_topics = config.DEFAULT_TOPIC_MATH.keys()
-        elif subject == "Maths-Applied":
-            detected_topics = config.DEFAULT_TOPIC_MAPP.keys()
-        elif subject == "General Aptitude":
-            detected_topics = config.DEFAULT_TOPIC_GENAP.keys()
-        elif subject == "English":
-            detected_topics = config.DEFAULT_TOPIC_ENG.keys()
-        elif subject == "Accountancy":
-            detected_topics = config.DEFAULT_TOPIC_ACCT.keys()
-        else:  # Economics
-            detected_topics = config.DEFAULT_TOPIC_ECO.keys()
-        
-        # Handle potential ChromaDB dimension issues
-        try:
-            vector_store.initialize_from_corpus(corpus)
-        except Exception as e:
-            logger.error(f"Error in vector store initialization: {e}")
-            logger.info("Attempting to recreate collection...")
-            try:
-                vector_store.get_or_create_collection(force_recreate=True)  # Changed to True
-                vector_store.initialize_from_corpus(corpus)
-            except Exception as inner_e:
-                logger.error(f"Failed to recover from vector store error: {inner_e}")
-                # Consider a more graceful degradation here
+        detected_topics = DistributionAgent.default_topics(subject).keys()
         
         # Initialize agents
-        distribution_agent = DistributionAgent(subject, vector_store)  # Pass vector_store if needed
-        context_agent = ContextAgent(subject, vector_store)
-        question_agent = QuestionAgent(subject, token_tracker)
+        distribution_agent = DistributionAgent(subject, resources.vector_store)  # Pass vector_store if needed
+        context_agent = resources.context_agent(subject)
+        novelty_index = resources.novelty_index(subject, corpus_path) if config.NOVELTY_CHECK else None
+        question_agent = QuestionAgent(subject, token_tracker, budget=budget, novelty_index=novelty_index)
+
+        # Case studies only need their topic's NCERT text and context, so each one starts
+        # as soon as that context is retrieved and runs alongside topic generation
+        case_question_agent = CaseQuestionAgent(subject, token_tracker, budget=budget)
+        generate_case_study = case_question_agent.generate_case_study
+        if profiler:
+            generate_case_study = profiler.wrap("case_study", generate_case_study, topic_of=lambda topic, context: topic)
+        case_topics = case_question_agent.select_topics()
+        case_executor = ThreadPoolExecutor(max_workers=config.CASE_STUDY_WORKERS, thread_name_prefix="case-study")
+        case_futures = {}
+
+        def start_case_studies(state, force=False):
+            for topic in case_topics:
+                if topic in case_futures:
+                    continue
+                context = state.get("context", {}).get(topic)
+                # Topics outside this paper's distribution will never get context; don't wait for them
+                not_in_paper = "distribution" in state and topic not in state.get("remaining_topics", [])
+                if context is not None or not_in_paper or force:
+                    logger.info(f"Starting case study on {topic}")
+                    case_futures[topic] = case_executor.submit(generate_case_study, topic, context)
         
         # Create workflow
-        workflow_builder = WorkflowBuilder(distribution_agent, context_agent, question_agent)
+        workflow_builder = WorkflowBuilder(distribution_agent, context_agent, question_agent, profiler=profiler)
         app = workflow_builder.create_workflow()
         
         inputs = {
             "total_questions": total_questions,
             "detected_topics": detected_topics,
+            "distribution_overrides": distribution_overrides or {},
             "context": {},
             "questions": {},
             "remaining_topics": []
         }
         
         logger.info("Starting workflow execution")
+        if profiler:
+            # Started once imports and resources are loaded, so tracemalloc only tracks the nodes' own allocations
+            profiler.start()
         
         try:
-            # Execute workflow
-            result = app.invoke(inputs)
+            # Execute workflow, starting case studies as topic contexts become available
+            for result in app.stream(inputs, stream_mode="values"):
+                start_case_studies(result)
+                for topic, questions in result.get("questions", {}).items():
+                    if topic not in final_paper:
+                        final_paper[topic] = questions
+                        sink.write(topic, questions)
             
             # Extract questions from the final state
             if isinstance(result, dict) and "questions" in result:
                 final_paper = result["questions"]
+                # QuestionAgent leaves a failed topic empty and moves on
+                failed_topics = [topic for topic, count in result.get("distribution", {}).items()
+                                 if count and not final_paper.get(topic)]
                 logger.info(f"Workflow completed successfully with {len(final_paper)} topics")
             else:
                 logger.warning(f"Unexpected result format: {type(result)}")
                 final_paper = {topic: [] for topic in detected_topics}
+                failed_topics = list(detected_topics)
+                for topic in detected_topics:
+                    sink.write(topic, [])
                 
         except Exception as e:
             logger.error(f"Error during workflow execution: {e}")
+            # The fallback regenerates the paper from scratch; topics already streamed must not be saved with it
+            final_paper = {}
+            sink.discard()
             
             logger.info("Using fallback question generation")
+            # Fallback questions ignore the distribution and overrides, so every topic counts as failed
+            failed_topics = list(detected_topics)
             # Fallback to direct question generation without the workflow
             for i, topic in enumerate(detected_topics):
+                if budget.exhausted():
+                    budget.record_cut("fallback_topics", f"skipped {len(detected_topics) - i} remaining topics")
+                    break
                 print_progress(f"Generating fallback questions", i+1, len(detected_topics))
                 logger.info(f"Generating fallback questions for topic {i+1}/{len(detected_topics)}: {topic}")
                 try:
@@ -145,54 +195,90 @@ def main(corpus_path: str, output_path: str, subject, total_questions: int = 50)
                             num_questions = min(config.DEFAULT_TOPIC_ECO[topic], 3)  # Cap at 3 for fallback
                     
                     prompt = f"Generate {num_questions} {subject} exam MCQ questions for the CUET exam about {topic}. Format each question clearly with 4 options (A, B, C, D) and include the correct answer."
-                    response = openai.ChatCompletion.create(
-                        model=config.GPT_MODEL,
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=0.7
+                    response = llm.chat_completion(
+                        [{"role": "user", "content": prompt}],
+                        temperature=0.7,
+                        node="fallback",
+                        topic=topic,
+                        subject=subject
                     )
                     
-                    token_tracker.update(response)
-                    
                     generated = response.choices[0].message.content.split('\n\n')
                     final_paper[topic] = generated
                     logger.info(f"Generated {len(generated)} fallback questions for {topic}")
 
                 except Exception as gen_error:
                     logger.error(f"Error in fallback generation for {topic}: {gen_error}")
+                    metrics.TOPIC_FAILURES.inc(subject=subject, topic=topic, stage="fallback")
                     final_paper[topic] = [f"Example question about {topic}"]
+                sink.write(topic, final_paper[topic])
             
             # Clear the progress bar after completion
             print_progress("", 0, 1)
             sys.stdout.write("\r" + " " * 80 + "\r")  # Clear the line
             sys.stdout.flush()
 
-        case_question_agent = CaseQuestionAgent(subject, token_tracker)
+        final_paper["case_studies"] = []
         try:
-            logger.info("Generating case studies...")
-            case_studies = case_question_agent.generate_case_studies({"context": result.get("context", {})})
-
-            # Add case studies to the final paper
-            final_paper["case_studies"] = case_studies
-            logger.info(f"Added {len(case_studies)} case studies to the final paper")
+            start_case_studies(result if isinstance(result, dict) else {}, force=True)
         except Exception as case_error:
-            logger.error(f"Error generating case studies: {case_error}")
-            final_paper["case_studies"] = []
+            logger.error(f"Error starting case studies: {case_error}")
+        # One failed case study must not cost the paper the others
+        for topic in case_topics:
+            future = case_futures.get(topic)
+            if future is None:
+                continue
+            if future.exception() is not None:
+                logger.error(f"Error generating case study on {topic}: {future.exception()}")
+                metrics.TOPIC_FAILURES.inc(subject=subject, topic=topic, stage="case_study")
+            elif future.result():
+                final_paper["case_studies"].append(future.result())
+        logger.info(f"Added {len(final_paper['case_studies'])} case studies to the final paper")
+        sink.write("case_studies", final_paper["case_studies"])
 
         # Save output
         logger.info(f"Saving generated paper to {output_path}")
         logger.info(f"OpenAI Token Usage: {token_tracker.get_stats()}")
         
         try:
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(final_paper, f, indent=2)
+            sink.finalize()
+            metrics.PAPERS_GENERATED.inc(subject=subject)
         except Exception as e:
             logger.error(f"Error saving output: {e}")
-            
+        if budget.cuts:
+            logger.warning(f"Budget cuts for this paper: {budget.cuts}")
+        token_tracker.export_summary(f"{os.path.splitext(output_path)[0]}_usage.json",
+                                     extra={"budget": budget.report(), "failed_topics": failed_topics})
+        if failed_topics:
+            logger.warning(f"{len(failed_topics)} topics failed or fell back: {failed_topics}")
+            if raise_on_failure:
+                raise PaperIncomplete(failed_topics, final_paper)
+
         return final_paper
+    except PaperIncomplete:
+        raise
     except Exception as e:
         logger.error(f"Critical error in main execution: {e}")
+        if raise_on_failure:
+            raise
         # Return empty result rather than raising
         return final_paper
+    finally:
+        if case_executor:
+            # Case studies still running after an error would keep spending: queued ones are
+            # cancelled, running ones fail at their next call
+            case_executor.shutdown(wait=False, cancel_futures=True)
+            budget.close("the paper has ended")
+        if sink:
+            sink.close()
+        if profiler:
+            profiler.stop()
+            try:
+                profiler.write(os.path.splitext(output_path)[0])
+            except Exception as e:
+                logger.error(f"Error writing profile: {e}")
+        if owns_resources:
+            resources.close()
 
 if __name__ == "__main__":
     corpus_path = "processed_papers/1.json"
@@ -0,0 +1,416 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import config
+from utils.logging_utils import setup_logger
+from utils import metrics
+
+# Long-running paper generation service. The vector store, PYQ/NCERT data, novelty
+# indexes and OpenAI client stay loaded between requests, so a paper costs roughly
+# its LLM time instead of a process start plus setup.
+#
+#   POST /papers        {"subject": "Economics", "total_questions": 50, "distribution": {"Money and Banking": 8}}
+#                       -> 202 {"job_id": ..., "status": "queued"}; add "wait": <seconds> to block until done.
+#                       With "source": "pool" (and config.SERVICE_POOL) the paper is assembled from the question
+#                       pool when it can cover the distribution (200, done at once) and generated otherwise.
+#                       A paper with failed topics ends "partial" (or "failed" if none succeeded), with the
+#                       topics in failed_topics.
+#   GET  /papers/<id>   job status, plus the paper once done; ?wait=<seconds> long-polls
+#   GET  /papers        recent jobs without their papers
+#   GET  /health, GET /metrics
+
+logger = setup_logger()
+
+SUBJECTS = ['Business Studies', 'Economics', 'Maths-Core', 'Maths-Applied', 'General Aptitude', 'English', 'Accountancy']
+MAX_BODY_BYTES = 1 << 20
+MAX_WAIT_SECONDS = 600
+
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class PaperJob:
+    """One paper request and, once finished, its result"""
+
+    def __init__(self, subject: str, total_questions: int, distribution_overrides: Dict[str, int],
+                 source: str = "generate"):
+        self.id = uuid.uuid4().hex
+        self.subject = subject
+        self.source = source
+        self.total_questions = total_questions
+        self.distribution_overrides = distribution_overrides
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.output_path = None
+        self.result = None
+        self.usage = None
+        self.error = None
+        self.failed_topics = []
+        self.done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "partial", "failed")
+
+    def to_dict(self, include_result: bool = True) -> Dict:
+        job = {
+            "job_id": self.id,
+            "status": self.status,
+            "source": self.source,
+            "subject": self.subject,
+            "total_questions": self.total_questions,
+            "distribution_overrides": self.distribution_overrides,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_seconds": round((self.started_at or time.time()) - self.created_at, 3),
+            "run_seconds": round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+            "error": self.error,
+            "failed_topics": self.failed_topics
+        }
+        if include_result and self.finished:
+            job["output_path"] = self.output_path
+            job["usage"] = self.usage
+            job["result"] = self.result
+        return job
+
+
+class GenerationService:
+    """Asyncio HTTP front end that runs main.main on worker threads with shared, warm resources"""
+
+    def __init__(self, host: str = None, port: int = None, workers: int = None, corpus_path: str = None,
+                 output_dir: str = None, pool: bool = None):
+        from workflow.resources import PaperResources
+        from data.question_pool import QuestionPool, PoolRefiller
+
+        self.host = host or config.SERVICE_HOST
+        self.port = config.SERVICE_PORT if port is None else port
+        self.corpus_path = corpus_path or config.SERVICE_CORPUS_PATH
+        self.output_dir = output_dir or config.SERVICE_OUTPUT_DIR
+        self.resources = PaperResources()
+        self.pool, self.refiller = None, None
+        if config.SERVICE_POOL if pool is None else pool:
+            # The refiller spends on LLM calls in the background, so it only runs when the pool is served
+            self.pool = QuestionPool()
+            self.refiller = PoolRefiller(self.pool, self.resources, self.corpus_path).start()
+        self.jobs: Dict[str, PaperJob] = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.SERVICE_WORKERS, thread_name_prefix="paper")
+        self._server = None
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def warm(self, subjects=SUBJECTS) -> None:
+        """Import the pipeline and load the vector store, PYQ/NCERT data and novelty indexes"""
+        start = time.perf_counter()
+        import main  # noqa: F401  imports the pipeline modules used by every job
+        from utils.llm_client import _openai
+        _openai()
+        self.resources.warm(list(subjects), self.corpus_path, novelty_check=config.NOVELTY_CHECK)
+        logger.info(f"Service warm-up took {time.perf_counter() - start:.1f}s")
+
+    async def start(self) -> "GenerationService":
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Paper generation service listening on http://{self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self) -> None:
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.refiller:
+            self.refiller.stop()
+        self.resources.close()
+        if self.pool:
+            self.pool.close()
+
+    # Jobs
+
+    def submit(self, payload: Dict) -> PaperJob:
+        subject = payload.get("subject")
+        if subject not in SUBJECTS:
+            raise RequestError(400, f"subject must be one of {SUBJECTS}")
+
+        # Resizes the subject's distribution; omitted, the distribution is used as configured
+        total_questions = payload.get("total_questions", payload.get("count"))
+        if total_questions is not None and (not isinstance(total_questions, int) or not 0 < total_questions <= 500):
+            raise RequestError(400, "total_questions must be an integer between 1 and 500")
+
+        overrides = payload.get("distribution") or {}
+        if not isinstance(overrides, dict) or not all(
+                isinstance(topic, str) and isinstance(count, int) and count >= 0 for topic, count in overrides.items()):
+            raise RequestError(400, "distribution must map topic names to non-negative integers")
+        from agents.distribution_agent import DistributionAgent
+        unknown = sorted(set(overrides) - set(DistributionAgent.default_topics(subject)))
+        if unknown:
+            raise RequestError(400, f"unknown {subject} topics in distribution: {unknown}")
+
+        source = payload.get("source", "generate")
+        if source not in ("generate", "pool"):
+            raise RequestError(400, 'source must be "generate" or "pool"')
+        if source == "pool" and self.pool is None:
+            raise RequestError(400, "the question pool is not enabled on this service (SERVICE_POOL)")
+
+        job = PaperJob(subject, total_questions, overrides, source)
+        self.jobs[job.id] = job
+        self._evict_finished()
+        if source == "pool" and self._assemble_from_pool(job):
+            return job
+        metrics.QUEUE_DEPTH.inc(queue="service")
+        asyncio.get_running_loop().create_task(self._run(job))
+        logger.info(f"Accepted job {job.id}: {subject}, {total_questions or 'default'} questions")
+        return job
+
+    def _assemble_from_pool(self, job: PaperJob) -> bool:
+        """Serve the job from the question pool; False (after queueing refills) if the pool cannot cover it"""
+        from agents.distribution_agent import DistributionAgent
+        from data.question_pool import assemble_paper, request_refills
+
+        distribution = DistributionAgent(job.subject).analyze_distribution({
+            "total_questions": job.total_questions,
+            "detected_topics": list(DistributionAgent.default_topics(job.subject)),
+            "distribution_overrides": job.distribution_overrides
+        })["distribution"]
+        case_studies = config.POOL_CASE_STUDIES_PER_PAPER
+        if not self.pool.covers(job.subject, distribution, case_studies):
+            request_refills(self.pool, self.refiller, job.subject, distribution, case_studies)
+            logger.info(f"Pool cannot cover job {job.id} yet; generating it instead")
+            return False
+
+        started_at = time.time()
+        paper, shortfall = assemble_paper(self.pool, job.subject, distribution, case_studies, refiller=self.refiller)
+        if shortfall:
+            # Another job took the last questions since covers(); nothing was marked used
+            logger.info(f"Pool fell short for job {job.id} by {shortfall}; generating it instead")
+            return False
+        job.started_at, job.result = started_at, paper
+        job.output_path = os.path.join(self.output_dir, f"{job.id}.json")
+        try:
+            with open(job.output_path, "w", encoding="utf-8") as f:
+                json.dump(job.result, f, indent=2)
+            metrics.PAPERS_GENERATED.inc(subject=job.subject)
+        except Exception as e:
+            logger.error(f"Error saving pooled paper for job {job.id}: {e}")
+        job.status = "done"
+        job.finished_at = time.time()
+        job.done.set()
+        return True
+
+    async def _run(self, job: PaperJob) -> None:
+        try:
+            job.result, job.usage = await asyncio.get_running_loop().run_in_executor(self.executor, self._generate, job)
+            if job.failed_topics:
+                # The paper is saved, but some topics are empty or hold fallback placeholders
+                succeeded = [topic for topic, questions in job.result.items()
+                             if topic != "case_studies" and questions and topic not in job.failed_topics]
+                job.status = "partial" if succeeded else "failed"
+                job.error = f"{len(job.failed_topics)} topics failed or fell back: {', '.join(job.failed_topics)}"
+            else:
+                job.status = "done"
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            if job.started_at is None:
+                metrics.QUEUE_DEPTH.dec(queue="service")
+            job.finished_at = time.time()
+            job.done.set()
+            logger.info(f"Job {job.id} {job.status} in {job.finished_at - job.created_at:.1f}s")
+
+    def _generate(self, job: PaperJob) -> Tuple[Dict, Optional[Dict]]:
+        """Runs on a worker thread"""
+        import main
+
+        metrics.QUEUE_DEPTH.dec(queue="service")
+        job.status = "running"
+        job.started_at = time.time()
+        job.output_path = os.path.join(self.output_dir, f"{job.id}.json")
+        try:
+            paper = main.main(self.corpus_path, job.output_path, job.subject, job.total_questions,
+                              distribution_overrides=job.distribution_overrides, resources=self.resources,
+                              raise_on_failure=True)
+        except main.PaperIncomplete as e:
+            paper, job.failed_topics = e.paper, [str(topic) for topic in e.failed_topics]
+        return paper, self._usage(job)
+
+    @staticmethod
+    def _usage(job: PaperJob) -> Optional[Dict]:
+        """Totals, budget and failed topics from the job's usage summary"""
+        usage_path = f"{os.path.splitext(job.output_path)[0]}_usage.json"
+        try:
+            with open(usage_path, encoding="utf-8") as f:
+                summary = json.load(f)
+            return {key: summary.get(key) for key in ("totals", "budget", "failed_topics")}
+        except Exception as e:
+            logger.warning(f"No usage summary for job {job.id}: {e}")
+            return None
+
+    def _evict_finished(self) -> None:
+        """Forget the oldest finished jobs beyond config.SERVICE_MAX_JOBS"""
+        excess = len(self.jobs) - config.SERVICE_MAX_JOBS
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished][:max(0, excess)]:
+            del self.jobs[job_id]
+
+    @staticmethod
+    async def _wait(job: PaperJob, seconds) -> None:
+        try:
+            seconds = min(float(seconds), MAX_WAIT_SECONDS)
+        except (TypeError, ValueError):
+            raise RequestError(400, "wait must be a number of seconds")
+        if seconds > 0 and not job.finished:
+            try:
+                await asyncio.wait_for(job.done.wait(), seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    # HTTP
+
+    async def _route(self, method: str, target: str, body: bytes):
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if path == "/health":
+            counts = {}
+            for job in list(self.jobs.values()):
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return 200, {"status": "ok", "jobs": counts}
+        if path == "/metrics":
+            return 200, metrics.REGISTRY.render()
+
+        if path == "/papers":
+            if method == "GET":
+                return 200, {"jobs": [job.to_dict(include_result=False) for job in list(self.jobs.values())]}
+            if method != "POST":
+                raise RequestError(405, "Use GET or POST")
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                raise RequestError(400, f"Invalid JSON body: {e}")
+            if not isinstance(payload, dict):
+                raise RequestError(400, "Body must be a JSON object")
+            job = self.submit(payload)
+            if payload.get("wait"):
+                await self._wait(job, payload["wait"])
+            return (200 if job.finished else 202), job.to_dict()
+
+        if path.startswith("/papers/"):
+            if method != "GET":
+                raise RequestError(405, "Use GET")
+            job = self.jobs.get(path[len("/papers/"):])
+            if job is None:
+                raise RequestError(404, "Unknown job id")
+            if "wait" in query:
+                await self._wait(job, query["wait"])
+            return 200, job.to_dict()
+
+        raise RequestError(404, f"No route for {path}")
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise RequestError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool) -> None:
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, payload = await self._route(method, target, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    logger.error(f"Error handling request: {e}")
+                    status, payload = 500, {"error": "Internal server error"}
+
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(args) -> None:
+    service = GenerationService(host=args.host, port=args.port, workers=args.workers, corpus_path=args.corpus)
+    if args.warm:
+        await asyncio.get_running_loop().run_in_executor(None, service.warm, args.warm)
+    await service.start()
+    try:
+        await service.serve_forever()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock paper generation over HTTP")
+    parser.add_argument("--host", default=config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVICE_WORKERS, help="papers generated at the same time")
+    parser.add_argument("--corpus", default=config.SERVICE_CORPUS_PATH)
+    parser.add_argument("--warm", nargs="*", default=SUBJECTS, help="subjects to preload before accepting requests")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        logging.getLogger(__name__).info("Shutting down")
@@ -0,0 +1,84 @@
+import json
+from types import SimpleNamespace
+
+import config
+from utils.token_tracker import TokenTracker
+from workflow.batch_planner import BatchPlanner
+
+
+def question(n):
+    words = " ".join(f"w{n}x{i}" for i in range(12))  # no words shared between questions
+    return f"Question {n}: {words}?"
+
+
+class FakeContextAgent:
+    def __init__(self, fail_on=()):
+        self.fail_on = fail_on
+
+    def retrieve_context(self, state):
+        topic = state["remaining_topics"][0]
+        if topic in self.fail_on:
+            raise RuntimeError("vector store down")
+        return {"context": {topic: {"examples": [], "explanations": []}}}
+
+
+class FakeQuestionAgent:
+    """Answers every call with the same few questions plus new ones, like a model that repeats itself"""
+
+    novelty_index = None
+
+    def __init__(self):
+        self.calls = 0
+        self.llm = SimpleNamespace(chat_completion=self.chat_completion)
+
+    def build_messages(self, *args, **kwargs):
+        return [{"role": "user", "content": "x"}]
+
+    def ncert_text(self, topic, count):
+        return ""
+
+    def chat_completion(self, messages, **kwargs):
+        self.calls += 1
+        fresh = [question(100 * self.calls + i) for i in range(2)]
+        repeats = [question(1), question(2)]
+        content = "\n\n".join(repeats + fresh if self.calls == 1 else fresh + repeats)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def planner(context_agent):
+    resources = SimpleNamespace(context_agent=lambda subject: context_agent)
+    return BatchPlanner("Economics", token_tracker=TokenTracker(), resources=resources)
+
+
+def test_questions_repeated_across_calls_reach_one_paper_only(monkeypatch):
+    monkeypatch.setattr(config, "BATCH_COMPLETION_TOKENS", 2 * config.BATCH_TOKENS_PER_QUESTION)
+    agent = FakeQuestionAgent()
+
+    per_paper = planner(FakeContextAgent()).generate_topic(agent, "Money and Banking", quota=4, papers=3)
+
+    questions = [q for paper in per_paper for q in paper]
+    assert agent.calls > 1
+    assert len(questions) == len(set(questions)) == 12
+    assert sum(q.startswith("Question 1:") for q in questions) == 1
+
+
+def test_a_failing_topic_does_not_abort_the_batch(monkeypatch, tmp_path):
+    import agents.question_agent
+    import agents.case_q_agent
+
+    agent = FakeQuestionAgent()
+    monkeypatch.setattr(config, "NOVELTY_CHECK", False)
+    monkeypatch.setattr(agents.question_agent, "QuestionAgent", lambda *args, **kwargs: agent)
+    monkeypatch.setattr(agents.case_q_agent, "CaseQuestionAgent", lambda *args, **kwargs: SimpleNamespace(
+        generate_case_studies=lambda state: []))
+    batch = planner(FakeContextAgent(fail_on=("Introduction",)))
+    batch.resources.corpus = lambda path: []
+    monkeypatch.setattr(batch, "plan", lambda *args: {"Money and Banking": 2, "Introduction": 2})
+
+    paths = batch.run([str(tmp_path / "a.json"), str(tmp_path / "b.json")])
+
+    assert batch.failed_topics == ["Introduction"]
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            paper = json.load(f)
+        assert len(paper["Money and Banking"]) == 2 and "Introduction" not in paper
@@ -0,0 +1,86 @@
+import config
+from agents.case_q_agent import CaseQuestionAgent
+
+
+def example(title, words, topic="Planning"):
+    return {"title": title, "text": "planning " * words, "questions": "", "topic": topic}
+
+
+def test_examples_longer_than_the_budget_are_skipped(monkeypatch):
+    monkeypatch.setattr(config, "CASE_STUDY_EXAMPLE_TOKENS", 300)
+    monkeypatch.setattr(config, "CASE_STUDY_EXAMPLES", 3)
+    agent = CaseQuestionAgent("Business Studies")
+    agent._chapters = {"Planning": [{"content": "planning"}]}
+    agent.example_case_studies = [example("huge", 2000), example("short", 100), example("medium", 120, topic="Staffing")]
+
+    selected = agent._select_examples("Planning")
+
+    assert [e["title"] for e in selected] == ["short"]  # huge alone is over budget, medium no longer fits
+
+
+def test_no_examples_when_none_fits(monkeypatch):
+    monkeypatch.setattr(config, "CASE_STUDY_EXAMPLE_TOKENS", 10)
+    agent = CaseQuestionAgent("Business Studies")
+    agent._chapters = {"Planning": [{"content": "planning"}]}
+    agent.example_case_studies = [example("huge", 2000)]
+
+    assert agent._select_examples("Planning") == []
+
+
+class FakeLLM:
+    """chat_completion answering with a fixed response and recording the models asked"""
+
+    def __init__(self, content, budget=None):
+        self.content = content
+        self.budget = budget
+        self.models = []
+
+    def chat_completion(self, messages, model=None, **kwargs):
+        from types import SimpleNamespace
+        self.models.append(model)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+    def escalation_allowed(self, where):
+        from utils.llm_client import LLMClient
+        return LLMClient.escalation_allowed(self, where)
+
+
+def pyq_shaped_case_study(agent):
+    """A response written exactly like the agent's PYQ examples"""
+    example = next(e for e in agent.example_case_studies if len(e["questions"].split("\n\n")) >= 5)
+    questions = "\n\n".join(example["questions"].split("\n\n")[:5])
+    return f"CASE STUDY: {example['title']}\n\n{'The firm grows. ' * 20}{example['text']}\n\nQUESTIONS:\n\n{questions}"
+
+
+def test_pyq_examples_pass_validation():
+    from utils.question_validator import question_problems, split_questions
+
+    agent = CaseQuestionAgent("Business Studies")
+    assert agent.example_case_studies
+    for example in agent.example_case_studies:
+        for question in split_questions(example["questions"]):
+            assert question_problems(question) == [], question
+
+
+def test_well_formed_case_study_stays_on_the_first_model(monkeypatch):
+    monkeypatch.setattr(config, "MODEL_CASCADE", ["gpt-4.1-nano", "gpt-4o-mini"])
+    agent = CaseQuestionAgent("Business Studies")
+    agent.llm = FakeLLM(pyq_shaped_case_study(agent))
+
+    case_study = agent._generate_single_case_study("Planning", "", {})
+
+    assert case_study and agent.llm.models == ["gpt-4.1-nano"]
+
+
+def test_no_escalation_once_the_budget_is_low(monkeypatch):
+    from utils.budget import Budget
+    monkeypatch.setattr(config, "MODEL_CASCADE", ["gpt-4.1-nano", "gpt-4o-mini"])
+    budget = Budget("paper", max_tokens=1000, low_water=0.25)
+    budget.charge(900, 0.0)
+    agent = CaseQuestionAgent("Business Studies")
+    agent.llm = FakeLLM("no layout at all", budget=budget)
+
+    agent._generate_single_case_study("Planning", "", {})
+
+    assert agent.llm.models == ["gpt-4.1-nano"] and "escalation" in [cut["what"] for cut in budget.cuts]
+
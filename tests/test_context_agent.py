@@ -0,0 +1,52 @@
+from agents.context_agent import ContextAgent
+from data.vector_store import corpus_documents, matches_where
+
+
+class FakeStore:
+    """query_collection over in-memory metadata, counting the (embedding) queries"""
+
+    def __init__(self, metadatas):
+        self.metadatas = metadatas
+        self.queries = 0
+
+    def query_collection(self, query_text, n_results=5, subject=None, where=None):
+        self.queries += 1
+        hits = [m for m in self.metadatas if not where or matches_where(m, where)][:n_results]
+        return {"documents": [[m["text"] for m in hits]], "metadatas": [hits]}
+
+
+def test_untagged_collection_is_queried_once_per_topic():
+    store = FakeStore([{"text": "q1", "explanation": "e1"}, {"text": "q2"}])
+    agent = ContextAgent("Economics", store)
+
+    assert agent._retrieve_from_vector_store("Money and Banking") == ["q1", "q2"]
+    assert agent._retrieve_explanations("Money and Banking") == ["e1"]
+    assert store.queries == 2  # the filtered query and its unfiltered fallback
+
+    agent._retrieve_from_vector_store("Market Equilibrium")
+    agent._retrieve_explanations("Market Equilibrium")
+    assert store.queries == 3  # the collection is known to be untagged
+
+
+def test_tagged_collection_uses_the_filtered_query():
+    store = FakeStore([{"text": "q1", "topic": "Money and Banking"}, {"text": "q2", "topic": "Introduction"}])
+    agent = ContextAgent("Economics", store)
+
+    assert agent._retrieve_from_vector_store("Money and Banking") == ["q1"]
+    agent._retrieve_explanations("Money and Banking")
+    assert store.queries == 1
+
+
+def test_corpus_documents_keeps_the_topic_score():
+    _, metadatas, _ = corpus_documents([{"question": "q", "topic": "Money and Banking", "topic_score": 0.61}],
+                                       "Economics")
+    assert metadatas[0]["topic"] == "Money and Banking" and metadatas[0]["topic_score"] == 0.61
+
+
+def test_empty_results_are_not_cached():
+    store = FakeStore([])
+    agent = ContextAgent("Economics", store)
+
+    assert agent._retrieve_from_vector_store("Money and Banking") == []
+    store.metadatas = [{"text": "q1", "topic": "Money and Banking"}]  # the store is back
+    assert agent._retrieve_from_vector_store("Money and Banking") == ["q1"]
@@ -0,0 +1,18 @@
+from utils.dedup import NearDuplicateIndex, deduplicate
+
+A = "What is the main objective of financial management in a company"
+B = "Which principle of management was given by Henri Fayol for unity of command"
+
+
+def test_deduplicate_drops_near_duplicates_within_a_call():
+    assert deduplicate([A, B, A + " ?", A.upper()]) == [A, B]
+
+
+def test_index_remembers_texts_kept_by_earlier_calls():
+    index = NearDuplicateIndex(0.7)
+
+    assert index.deduplicate([A]) == [0]
+    assert index.deduplicate([B]) == [0]
+    assert index.deduplicate([A]) == []
+    assert index.deduplicate([B, "An unrelated question about the balance of payments"]) == [1]
+    assert len(index) == 3
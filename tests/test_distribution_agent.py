@@ -0,0 +1,30 @@
+import pytest
+
+from agents.distribution_agent import DistributionAgent
+from service import GenerationService, RequestError
+
+
+def test_scale_keeps_proportions_and_total():
+    scaled = DistributionAgent.scale({"a": 10, "b": 20, "c": 20}, 100)
+    assert scaled == {"a": 20, "b": 40, "c": 40}
+    assert sum(DistributionAgent.scale({"a": 3, "b": 3, "c": 3}, 10).values()) == 10
+
+
+def test_scale_keeps_overrides_and_drops_empty_topics():
+    scaled = DistributionAgent.scale({"a": 8, "b": 10, "c": 1}, 10, fixed={"a": 8})
+    assert scaled == {"a": 8, "b": 2}
+
+
+def test_distribution_follows_total_questions():
+    agent = DistributionAgent("Economics")
+    state = {"detected_topics": list(DistributionAgent.default_topics("Economics"))}
+    configured = agent.analyze_distribution({**state, "total_questions": None})["distribution"]
+    assert sum(agent.analyze_distribution({**state, "total_questions": 20})["distribution"].values()) == 20
+    assert agent.analyze_distribution(state)["distribution"] == configured
+
+
+def test_service_rejects_unknown_override_topics():
+    service = GenerationService.__new__(GenerationService)
+    with pytest.raises(RequestError) as error:
+        service.submit({"subject": "Economics", "distribution": {"Mony and Banking": 8}})
+    assert error.value.status == 400
@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+from main import PaperIncomplete
+from workflow.job_queue import QueueWorker, SQLiteJobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), lease_seconds=60, max_attempts=2, retry_backoff=0)
+    yield queue
+    queue.close()
+
+
+def status_of(queue, job_id):
+    return queue._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def test_lease_prefers_subjects_and_respects_steal(queue):
+    queue.enqueue("Economics", {"n": 1})
+    bst = queue.enqueue("Business Studies", {"n": 2})
+
+    job = queue.lease("w1", ["Business Studies"])
+    assert job.id == bst and job.attempts == 1
+    assert queue.lease("w2", ["Business Studies"], steal=False) is None
+    assert queue.lease("w2", ["Business Studies"]).subject == "Economics"
+    assert queue.lease("w3") is None
+
+
+def test_complete_needs_the_lease(queue):
+    queue.enqueue("Economics", {})
+    job = queue.lease("w1")
+    assert queue.complete(job, {"questions": 50})
+    assert status_of(queue, job.id) == "done"
+    assert not queue.complete(job)
+
+
+def test_failure_retries_then_dead_letters(queue):
+    job_id = queue.enqueue("Economics", {"output_path": "x.json"})
+
+    assert queue.fail(queue.lease("w1"), "boom") == "queued"
+    job = queue.lease("w1")
+    assert job.id == job_id and job.attempts == 2
+    assert queue.fail(job, "boom again") == "dead"
+    assert queue.lease("w1") is None
+
+    dead = queue.dead_letters()
+    assert [d["id"] for d in dead] == [job_id]
+    assert dead[0]["last_error"] == "boom again"
+    assert queue.requeue_dead() == 1
+    assert queue.lease("w1").attempts == 1
+
+
+def test_non_retryable_failure_goes_straight_to_dead_letters(queue):
+    queue.enqueue("Economics", {})
+    assert queue.fail(queue.lease("w1"), "bad payload", retry=False) == "dead"
+
+
+def test_retry_waits_for_backoff(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), max_attempts=3, retry_backoff=30)
+    queue.enqueue("Economics", {})
+    queue.fail(queue.lease("w1"), "boom")
+    assert queue.lease("w1") is None
+    queue.close()
+
+
+def test_expired_lease_is_reclaimed(queue):
+    job_id = queue.enqueue("Economics", {})
+    stale = queue.lease("w1", lease_seconds=0.01)
+    time.sleep(0.05)
+
+    job = queue.lease("w2")
+    assert job.id == job_id and job.lease_owner == "w2"
+    assert not queue.heartbeat(stale)
+    assert queue.fail(stale, "late") == "lost"
+    assert queue.heartbeat(job)
+
+
+def test_expired_lease_on_last_attempt_dead_letters(queue):
+    queue.enqueue("Economics", {})
+    queue.fail(queue.lease("w1"), "boom")
+    queue.lease("w1", lease_seconds=0.01)
+    time.sleep(0.05)
+
+    assert queue.lease("w2") is None
+    assert queue.dead_letters()[0]["last_error"] == "lease expired on final attempt"
+
+
+class _Resources:
+    def warm_subjects(self):
+        return []
+
+
+class _Worker(QueueWorker):
+    def __init__(self, queue, outcome):
+        super().__init__(queue, worker_id="w", resources=_Resources())
+        self.outcome = outcome
+
+    def execute(self, job):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+def test_worker_completes_a_full_paper(queue):
+    job_id = queue.enqueue("Economics", {})
+    assert _Worker(queue, {"questions": 50}).run_once()
+    assert status_of(queue, job_id) == "done"
+
+
+def test_worker_retries_a_paper_with_fallback_topics(queue):
+    job_id = queue.enqueue("Economics", {})
+    worker = _Worker(queue, PaperIncomplete(["Money and Banking"], {"Money and Banking": ["placeholder"]}))
+
+    assert worker.run_once()
+    assert status_of(queue, job_id) == "queued"
+    assert worker.run_once()
+    assert status_of(queue, job_id) == "dead"
+    assert "Money and Banking" in queue.dead_letters()[0]["last_error"]
+    assert not worker.run_once()
+
+
+def test_worker_fails_a_paper_without_questions(queue):
+    job_id = queue.enqueue("Economics", {})
+    _Worker(queue, {"questions": 0}).run_once()
+    assert status_of(queue, job_id) == "queued"
+
+
+def test_enqueue_rejects_unknown_override_topics(queue):
+    with pytest.raises(ValueError, match="Not A Topic"):
+        queue.enqueue("Economics", {"distribution": {"Not A Topic": 3}})
+    with pytest.raises(ValueError):
+        queue.enqueue_many([{"subject": "Economics", "payload": {}},
+                            {"subject": "Economics", "payload": {"distribution": {"Money and Banking": -1}}}])
+
+    assert queue.lease("w1") is None  # nothing was enqueued
+    assert queue.enqueue("Economics", {"distribution": {"Money and Banking": 6}})
@@ -0,0 +1,58 @@
+import threading
+import time
+
+import config
+from utils.llm_client import HedgePolicy, LLMClient, _openai
+from utils.token_tracker import TokenTracker
+
+
+class _Usage:
+    prompt_tokens = 10
+    completion_tokens = 5
+    prompt_tokens_details = None
+
+
+class _Response:
+    usage = _Usage()
+    model = "gpt-4o-mini"
+
+
+def test_hedge_records_a_loser_that_finished_with_the_winner(monkeypatch):
+    openai = _openai()
+    both_sent = threading.Barrier(2)
+
+    def create(**params):
+        both_sent.wait(timeout=5)  # primary and duplicate return together
+        return _Response()
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr(config, "LLM_HEDGE_MIN_DELAY", 0.01)
+    policy = HedgePolicy(min_samples=1, max_rate=1.0, max_cost=1.0)
+    policy.observe("gpt-4o-mini", 0.0)
+    tracker = TokenTracker()
+
+    LLMClient(tracker, hedge=policy).chat_completion([{"role": "user", "content": "x"}], node="n")
+    deadline = time.monotonic() + 2
+    while len(tracker.calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert [call.get("hedge") for call in tracker.calls] == [None, "loser"]
+    assert policy.stats()["hedged"] == 1 and policy.stats()["duplicate_cost"] > 0
+
+
+def test_cache_hits_count_calls_served_from_the_prompt_cache():
+    class Details:
+        cached_tokens = 8
+
+    class CachedUsage(_Usage):
+        prompt_tokens_details = Details()
+
+    class CachedResponse(_Response):
+        usage = CachedUsage()
+
+    tracker = TokenTracker()
+    tracker.update(_Response())
+    tracker.update(CachedResponse())
+
+    totals = tracker.summary()["totals"]
+    assert totals["cache_hits"] == 1 and totals["cached_prompt_tokens"] == 8
@@ -0,0 +1,71 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import agents.case_q_agent
+import agents.question_agent
+import config
+import main
+import workflow.graph_builder
+from agents.distribution_agent import DistributionAgent
+from utils.budget import BudgetExceeded
+
+
+class FakeResources:
+    vector_store = None
+
+    def corpus(self, path):
+        return []
+
+    def context_agent(self, subject):
+        return None
+
+    def novelty_index(self, subject, corpus_path):
+        return None
+
+    def close(self):
+        pass
+
+
+def fake_workflow(monkeypatch, stream):
+    app = SimpleNamespace(stream=stream)
+    monkeypatch.setattr(workflow.graph_builder, "WorkflowBuilder",
+                        lambda *args, **kwargs: SimpleNamespace(create_workflow=lambda: app))
+    monkeypatch.setattr(agents.question_agent, "QuestionAgent", lambda *args, **kwargs: None)
+
+
+def fake_case_agent(monkeypatch, generate):
+    agent = SimpleNamespace(select_topics=lambda: ["Planning", "Staffing"], generate_case_study=generate)
+    monkeypatch.setattr(agents.case_q_agent, "CaseQuestionAgent", lambda *args, **kwargs: agent)
+
+
+def test_one_failed_case_study_keeps_the_others(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "NOVELTY_CHECK", False)
+    topics = list(DistributionAgent.default_topics("Business Studies"))
+    final_state = {"distribution": {topic: 1 for topic in topics},
+                   "questions": {topic: [f"question on {topic}"] for topic in topics}}
+    fake_workflow(monkeypatch, lambda inputs, stream_mode: iter([final_state]))
+
+    def generate(topic, context):
+        if topic == "Planning":
+            raise RuntimeError("model unavailable")
+        return {"topic": topic, "content": "case"}
+
+    fake_case_agent(monkeypatch, generate)
+    output = tmp_path / "paper.json"
+
+    paper = main.main("corpus.json", str(output), "Business Studies", resources=FakeResources())
+
+    assert paper["case_studies"] == [{"topic": "Staffing", "content": "case"}]
+    assert json.loads(output.read_text())["case_studies"] == paper["case_studies"]
+
+
+def test_a_closed_budget_refuses_later_calls():
+    budget = main.Budget("paper", max_tokens=1000)
+    budget.check()
+
+    budget.close("the paper has ended")
+
+    with pytest.raises(BudgetExceeded, match="closed"):
+        budget.check()
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+
+import config
+from data.numpy_vector_store import NumpyVectorStore
+from data.vector_store import collection_name
+
+
+def unit_rows(count, dim=4, seed=0):
+    rows = np.random.RandomState(seed).rand(count, dim).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def write(store, name, count, seed=0):
+    store.write_collection(name, unit_rows(count, seed=seed), [f"doc {i}" for i in range(count)],
+                           [{"topic": "t"} for _ in range(count)], [str(i) for i in range(count)])
+
+
+def test_rebuild_is_seen_even_with_an_unchanged_mtime(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    write(store, "qs", 3)
+    meta_path = store._paths("qs")[1]
+    mtime = os.stat(meta_path).st_mtime_ns
+    assert store.count("qs") == 3
+
+    write(NumpyVectorStore(str(tmp_path)), "qs", 5, seed=1)  # another process rebuilds it
+    os.utime(meta_path, ns=(mtime, mtime))
+
+    matrix, meta = store._load("qs")
+    assert meta["count"] == 5 and matrix.shape == (5, 4)
+    assert np.allclose(matrix, unit_rows(5, seed=1))
+    assert [f for f in os.listdir(tmp_path) if f.endswith(".f32")] == [meta["matrix"]]
+
+
+def test_index_from_another_embedding_model_is_rebuilt(tmp_path, monkeypatch):
+    store = NumpyVectorStore(str(tmp_path))
+    name = collection_name("Economics")
+    write(store, name, 3)
+    monkeypatch.setattr(config, "EMBEDDING_MODEL", "another-embedding-model")
+    monkeypatch.setattr(store, "embed", lambda texts, batch_size=256: unit_rows(len(texts), seed=2))
+
+    assert store.count(name) == 0
+    store.initialize_from_corpus([{"question": "q1"}, {"question": "q2"}], subject="Economics")
+
+    matrix, meta = store._load(name)
+    assert meta["model"] == "another-embedding-model" and matrix.shape == (2, 4)
@@ -0,0 +1,24 @@
+import json
+
+import main
+from utils.paper_sink import PaperSink
+
+
+def test_discard_drops_streamed_topics(tmp_path):
+    output = tmp_path / "paper.json"
+    sink = PaperSink(str(output))
+    sink.write("Planning", ["workflow question"])
+    sink.write("Staffing", ["workflow question"])
+
+    sink.discard()
+    sink.write("Planning", ["fallback question"])
+    sink.finalize()
+
+    assert json.loads(output.read_text()) == {"Planning": ["fallback question"]}
+
+
+def test_unwritable_output_is_handled_by_main(tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+
+    assert main.main("missing_corpus.json", str(blocker / "paper.json"), "Economics") == {}
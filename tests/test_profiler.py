@@ -0,0 +1,46 @@
+import threading
+
+import pytest
+
+from utils.profiler import NodeProfiler
+
+
+@pytest.fixture
+def profiler():
+    profiler = NodeProfiler(interval=60, memory="sizes").start()
+    yield profiler
+    profiler.stop()
+
+
+def test_section_alone_measures_memory(profiler):
+    with profiler.section("case_study", "Banking"):
+        data = bytearray(2_000_000)
+
+    stats = profiler.summary()["sections"]["case_study[Banking]"]
+    assert stats["memory_calls"] == 1 and stats["overlapped_calls"] == 0
+    assert stats["peak_bytes"] >= 2_000_000
+    del data
+
+
+def test_overlapping_sections_do_not_report_memory(profiler):
+    started, release = threading.Event(), threading.Event()
+
+    def other():
+        with profiler.section("case_study", "Banking"):
+            started.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    started.wait(5)
+    with profiler.section("case_study", "Insurance"):
+        data = bytearray(2_000_000)
+    release.set()
+    thread.join()
+
+    sections = profiler.summary()["sections"]
+    for label in ("case_study[Banking]", "case_study[Insurance]"):
+        stats = sections[label]
+        assert stats["calls"] == 1 and stats["memory_calls"] == 0 and stats["overlapped_calls"] == 1
+        assert stats["peak_bytes"] == 0 and stats["allocated_bytes"] == 0
+    del data
@@ -0,0 +1,28 @@
+import pytest
+
+from data.question_pool import QuestionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = QuestionPool(str(tmp_path / "pool.db"), max_uses=1)
+    pool.add("Economics", "Money", [f"Money question {i}" for i in range(3)])
+    pool.add("Economics", "Banking", ["Banking question"])
+    yield pool
+    pool.close()
+
+
+def test_assemble_marks_questions_used(pool):
+    paper, shortfall = pool.assemble("Economics", {"Money": 2, "Banking": 1})
+
+    assert shortfall == {} and len(paper["Money"]) == 2
+    assert pool.available("Economics", "Money") == 1
+    assert pool.available("Economics", "Banking") == 0
+
+
+def test_assemble_with_a_shortfall_marks_nothing_used(pool):
+    paper, shortfall = pool.assemble("Economics", {"Money": 2, "Banking": 2})
+
+    assert shortfall == {"Banking": 1} and paper["Banking"] == ["Banking question"]
+    assert pool.available("Economics", "Money") == 3
+    assert pool.available("Economics", "Banking") == 1
@@ -0,0 +1,18 @@
+import config
+from workflow.resources import PaperResources
+
+CORPUS = [{"question": "Which function of management ensures that actual performance matches the planned standards"}]
+
+
+def test_only_the_corpus_subject_is_seeded_with_the_corpus(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "NOVELTY_INDEX_PATH", str(tmp_path / "novelty.db"))
+    monkeypatch.setattr(config, "CORPUS_SUBJECT", "Business Studies")
+    resources = PaperResources()
+    monkeypatch.setattr(resources, "corpus", lambda path: CORPUS)
+
+    business = resources.novelty_index("Business Studies", "corpus.json")
+    accountancy = resources.novelty_index("Accountancy", "corpus.json")
+
+    assert business.count("corpus:corpus.json") == 1
+    assert accountancy.count("corpus:corpus.json") == 0
+    resources.close()
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+import main
+from service import GenerationService, RequestError
+
+
+def run_job(monkeypatch, tmp_path, fake_main):
+    monkeypatch.setattr(main, "main", fake_main)
+    service = GenerationService(port=0, workers=1, output_dir=str(tmp_path), pool=False)
+
+    async def submit_and_wait():
+        job = service.submit({"subject": "Economics"})
+        await asyncio.wait_for(job.done.wait(), 5)
+        return job
+
+    try:
+        return asyncio.run(submit_and_wait())
+    finally:
+        service.executor.shutdown()
+
+
+def test_paper_with_failed_topics_is_partial(monkeypatch, tmp_path):
+    def fake_main(*args, **kwargs):
+        assert kwargs["raise_on_failure"]
+        raise main.PaperIncomplete(["Introduction"], {"Money and Banking": ["q"], "Introduction": [],
+                                                      "case_studies": []})
+
+    job = run_job(monkeypatch, tmp_path, fake_main)
+    assert job.status == "partial" and job.to_dict()["failed_topics"] == ["Introduction"]
+
+
+def test_fallback_paper_is_failed(monkeypatch, tmp_path):
+    def fake_main(*args, **kwargs):
+        paper = {"Introduction": ["Example question about Introduction"], "case_studies": [{"topic": "x"}]}
+        raise main.PaperIncomplete(["Introduction"], paper)
+
+    job = run_job(monkeypatch, tmp_path, fake_main)
+    assert job.status == "failed" and job.result["Introduction"]
+
+
+def test_complete_paper_is_done(monkeypatch, tmp_path):
+    job = run_job(monkeypatch, tmp_path, lambda *args, **kwargs: {"Introduction": ["q"], "case_studies": []})
+    assert job.status == "done" and job.failed_topics == []
+
+
+def test_pool_requests_are_rejected_without_a_pool(tmp_path):
+    service = GenerationService(port=0, output_dir=str(tmp_path), pool=False)
+    assert service.refiller is None
+    with pytest.raises(RequestError):
+        service.submit({"subject": "Economics", "source": "pool"})
+    service.executor.shutdown()
@@ -0,0 +1,11 @@
+from data.topic_tagger import TopicTagger
+
+
+def test_cache_key_changes_with_the_pyqs():
+    questions = ["What is the meaning of money supply"]
+    tagger = TopicTagger("Economics", [{"question": "Define money", "topic": "Money and Banking"}])
+    changed = TopicTagger("Economics", [{"question": "Define barter", "topic": "Money and Banking"}])
+
+    path = tagger._cache_path(questions, tagger._topic_documents())
+    assert path == TopicTagger("Economics", list(tagger.pyq_records))._cache_path(questions, tagger._topic_documents())
+    assert path != changed._cache_path(questions, changed._topic_documents())
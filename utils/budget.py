@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceeded(Exception):
+    """Raised when a call would run past a token, cost or wall-time limit"""
+
+
+class Budget:
+    """Token, dollar and wall-time limits for a paper or batch; a paper budget can charge a parent batch budget"""
+
+    def __init__(self, name: str, max_tokens: Optional[int] = None, max_cost: Optional[float] = None,
+                 max_seconds: Optional[float] = None, parent: "Budget" = None, low_water: float = 0.25):
+        self.name = name
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.max_seconds = max_seconds
+        self.parent = parent
+        self.low_water = low_water
+        self.tokens = 0
+        self.cost = 0.0
+        self.started = time.monotonic()
+        self.cuts = []
+        self.closed_reason: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, name: str, limits: Dict, parent: "Budget" = None, low_water: float = 0.25) -> "Budget":
+        return cls(name, limits.get("max_tokens"), limits.get("max_cost"), limits.get("max_seconds"),
+                   parent=parent, low_water=low_water)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def _own_fraction_left(self) -> float:
+        fractions = [1.0]
+        if self.max_tokens:
+            fractions.append(1 - self.tokens / self.max_tokens)
+        if self.max_cost:
+            fractions.append(1 - self.cost / self.max_cost)
+        if self.max_seconds:
+            fractions.append(1 - self.elapsed() / self.max_seconds)
+        return max(0.0, min(fractions))
+
+    def fraction_left(self) -> float:
+        """Smallest remaining share across all limits, including the parent budget"""
+        own = self._own_fraction_left()
+        return min(own, self.parent.fraction_left()) if self.parent else own
+
+    def tokens_left(self) -> Optional[int]:
+        """Tokens left before the tightest token limit, or None when tokens are unlimited"""
+        limits = []
+        if self.max_tokens:
+            limits.append(max(0, self.max_tokens - self.tokens))
+        if self.parent and self.parent.tokens_left() is not None:
+            limits.append(self.parent.tokens_left())
+        return min(limits) if limits else None
+
+    def is_low(self) -> bool:
+        return self.fraction_left() <= self.low_water
+
+    def exhausted(self) -> bool:
+        return self.fraction_left() <= 0.0
+
+    def close(self, reason: str) -> None:
+        """Refuse every later call, e.g. from threads still running for a paper that has ended"""
+        self.closed_reason = reason
+
+    def check(self) -> None:
+        """Raise BudgetExceeded if any limit, own or parent, has been reached or the budget was closed"""
+        if self.parent:
+            self.parent.check()
+        if self.closed_reason:
+            raise BudgetExceeded(f"Budget '{self.name}' closed: {self.closed_reason}")
+        if self._own_fraction_left() <= 0.0:
+            raise BudgetExceeded(f"Budget '{self.name}' exhausted ({self.describe()})")
+
+    def charge(self, tokens: int, cost: float) -> None:
+        with self._lock:
+            self.tokens += tokens
+            self.cost += cost
+        if self.parent:
+            self.parent.charge(tokens, cost)
+
+    def record_cut(self, what: str, detail: str, once: bool = False) -> None:
+        """Remember a degradation so it can be reported with the paper; with once, only its first occurrence"""
+        with self._lock:
+            if once and any(cut["what"] == what for cut in self.cuts):
+                return
+            self.cuts.append({"what": what, "detail": detail, "at_seconds": round(self.elapsed(), 2)})
+        logger.warning(f"Budget '{self.name}' low, cut {what}: {detail}")
+
+    def describe(self) -> str:
+        parts = [f"{self.tokens} tokens", f"${self.cost:.4f}", f"{self.elapsed():.0f}s"]
+        limits = [f"max_tokens={self.max_tokens}", f"max_cost={self.max_cost}", f"max_seconds={self.max_seconds}"]
+        return ", ".join(parts) + " of " + ", ".join(limits)
+
+    def report(self) -> Dict:
+        with self._lock:
+            cuts: List[Dict] = list(self.cuts)
+        return {
+            "name": self.name,
+            "limits": {"max_tokens": self.max_tokens, "max_cost": self.max_cost, "max_seconds": self.max_seconds},
+            "used": {"tokens": self.tokens, "cost": round(self.cost, 6), "seconds": round(self.elapsed(), 2)},
+            "fraction_left": round(self.fraction_left(), 3),
+            "cuts": cuts,
+            "parent": self.parent.name if self.parent else None
+        }
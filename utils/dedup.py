@@ -0,0 +1,166 @@
+import logging
+import zlib
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHIFT = np.uint64(32)
+_CHUNK_TOKENS = 2048  # tokens hashed per vectorized step, bounds memory to num_perm * chunk * 8 bytes
+
+
+def normalize(text: str) -> str:
+    """Collapse whitespace and lowercase, as used for all similarity checks"""
+    return " ".join(str(text).split()).lower()
+
+
+def tokenize(text: str) -> Set[str]:
+    """Word set of a normalized text"""
+    return set(normalize(text).split())
+
+
+def jaccard(tokens1: Set[str], tokens2: Set[str]) -> float:
+    union = len(tokens1 | tokens2)
+    return len(tokens1 & tokens2) / union if union > 0 else 0.0
+
+
+class MinHasher:
+    """Vectorized MinHash signatures over word sets.
+
+    Token hashes use CRC32 so signatures are stable across processes and can be stored.
+    Permutations are multiply-shift hashes, (a * x + b) >> 32 with 64-bit wrap-around.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self._a = (rng.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.randint(0, 1 << 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self._token_cache: Dict[str, int] = {}
+
+    def _token_hashes(self, tokens: Iterable[str]) -> List[int]:
+        cache = self._token_cache
+        hashes = []
+        for token in tokens:
+            value = cache.get(token)
+            if value is None:
+                value = zlib.crc32(token.encode("utf-8"))
+                if len(cache) < 1_000_000:
+                    cache[token] = value
+            hashes.append(value)
+        return hashes
+
+    def signatures(self, token_sets: List[Set[str]]) -> np.ndarray:
+        """MinHash signatures, shape (len(token_sets), num_perm), dtype uint32"""
+        result = np.full((len(token_sets), self.num_perm), _MAX_HASH, dtype=np.uint64)
+        start = 0
+        while start < len(token_sets):
+            # Group whole documents into chunks of roughly _CHUNK_TOKENS tokens
+            end, size = start, 0
+            while end < len(token_sets) and (size == 0 or size + len(token_sets[end]) <= _CHUNK_TOKENS):
+                size += len(token_sets[end])
+                end += 1
+            lengths = np.array([len(tokens) for tokens in token_sets[start:end]])
+            non_empty = np.flatnonzero(lengths)
+            if len(non_empty):
+                hashes = np.array([h for tokens in token_sets[start:end] for h in self._token_hashes(tokens)],
+                                  dtype=np.uint64)
+                permuted = self._a[:, None] * hashes[None, :]
+                permuted += self._b[:, None]
+                permuted >>= _SHIFT
+                offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[non_empty]
+                result[start + non_empty] = np.minimum.reduceat(permuted, offsets, axis=1).T
+            start = end
+        return result.astype(np.uint32)
+
+    def signature(self, tokens: Set[str]) -> np.ndarray:
+        return self.signatures([tokens])[0]
+
+
+class NearDuplicateIndex:
+    """MinHash LSH index that finds texts whose word-set Jaccard similarity exceeds a threshold.
+
+    LSH only proposes candidates (banding is tuned to catch pairs well below the
+    threshold); every candidate is confirmed with the exact Jaccard similarity, so
+    results match a brute-force comparison while the work stays close to linear.
+    """
+
+    def __init__(self, threshold: float = 0.7, num_perm: int = 128, bands: int = 32,
+                 hasher: Optional[MinHasher] = None):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = hasher or MinHasher(num_perm)
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._tokens: Dict[Hashable, Set[str]] = {}
+        self._kept = 0  # texts kept by deduplicate() over the index's life, numbering their keys
+        # Polynomial weights used to fold each band of a signature into one 64-bit key
+        self._band_weights = np.array([pow(1_000_003, i, 1 << 64) for i in range(self.rows)], dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """Fold signatures (n, num_perm) into band keys (n, bands)"""
+        banded = signatures.astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        with np.errstate(over="ignore"):
+            return (banded * self._band_weights).sum(axis=2, dtype=np.uint64)
+
+    def _candidates(self, keys: List[int]) -> Set[Hashable]:
+        found = set()
+        for buckets, key in zip(self._buckets, keys):
+            found.update(buckets.get(key, ()))
+        return found
+
+    def _insert(self, key: Hashable, tokens: Set[str], band_keys: List[int]) -> None:
+        self._tokens[key] = tokens
+        for buckets, band_key in zip(self._buckets, band_keys):
+            buckets[band_key].append(key)
+
+    def _matches(self, tokens: Set[str], candidates: Iterable[Hashable]) -> List[Hashable]:
+        return [c for c in candidates if jaccard(tokens, self._tokens[c]) > self.threshold]
+
+    def add(self, key: Hashable, text: str) -> None:
+        tokens = tokenize(text)
+        self._insert(key, tokens, self.band_keys(self.hasher.signatures([tokens]))[0].tolist())
+
+    def add_many(self, items: Dict[Hashable, str]) -> None:
+        keys = list(items)
+        token_sets = [tokenize(items[k]) for k in keys]
+        band_keys = self.band_keys(self.hasher.signatures(token_sets)).tolist()
+        for key, tokens, row in zip(keys, token_sets, band_keys):
+            self._insert(key, tokens, row)
+
+    def query(self, text: str) -> List[Hashable]:
+        """Keys of indexed texts that are near-duplicates of `text`"""
+        tokens = tokenize(text)
+        keys = self.band_keys(self.hasher.signatures([tokens]))[0].tolist()
+        return self._matches(tokens, self._candidates(keys))
+
+    def deduplicate(self, texts: List[str]) -> List[int]:
+        """Greedy in-order dedup: indices of texts that are not near-duplicates of an indexed or earlier kept text"""
+        token_sets = [tokenize(t) for t in texts]
+        band_keys = self.band_keys(self.hasher.signatures(token_sets)).tolist() if texts else []
+        kept = []
+        exact = set()
+        for i, (tokens, keys) in enumerate(zip(token_sets, band_keys)):
+            # Exact repeats are the common case when sources overlap; skip them without a bucket scan
+            frozen = frozenset(tokens)
+            if (tokens and frozen in exact) or self._matches(tokens, self._candidates(keys)):
+                continue
+            self._insert(("dedup", self._kept), tokens, keys)
+            self._kept += 1
+            exact.add(frozen)
+            kept.append(i)
+        return kept
+
+
+def deduplicate(texts: List[str], threshold: float = 0.7) -> List[str]:
+    """Drop texts that are more than `threshold` Jaccard-similar to an earlier kept text"""
+    if not texts:
+        return []
+    return [texts[i] for i in NearDuplicateIndex(threshold).deduplicate(texts)]
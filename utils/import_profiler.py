@@ -0,0 +1,73 @@
+import logging
+import subprocess
+import sys
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class ImportProfiler:
+    """Measure import cost of project modules using `python -X importtime`"""
+
+    def __init__(self, python=sys.executable):
+        self.python = python
+
+    def profile(self, module: str) -> List[Dict]:
+        """Import a module in a fresh interpreter and return per-module timings (microseconds)"""
+        result = subprocess.run(
+            [self.python, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            logger.error(f"Importing {module} failed: {result.stderr.strip().splitlines()[-1:]}")
+
+        timings = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            parts = line[len("import time:"):].split("|")
+            try:
+                self_us, cumulative_us = int(parts[0]), int(parts[1])
+            except ValueError:
+                continue  # header line
+            name = parts[2].rstrip()
+            timings.append({
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip())) // 2,
+                "self_us": self_us,
+                "cumulative_us": cumulative_us
+            })
+        return timings
+
+    def report(self, module: str, top: int = 15) -> str:
+        """Build a text report of the most expensive top-level imports"""
+        timings = self.profile(module)
+        if not timings:
+            return f"No import timings collected for {module}"
+
+        # importtime lists children before their parent, so the target's subtree is
+        # everything after the previous top-level entry
+        end = max((i for i, t in enumerate(timings) if t["module"] == module), default=len(timings) - 1)
+        start = max((i + 1 for i, t in enumerate(timings[:end]) if t["depth"] == 0), default=0)
+        total = timings[end]
+        subtree = timings[start:end + 1]
+        direct = [t for t in subtree if t["depth"] == 1]
+        heaviest = sorted(subtree, key=lambda t: t["self_us"], reverse=True)[:top]
+
+        lines = [f"Import profile for {module}: {total['cumulative_us'] / 1000:.1f} ms total", "",
+                 "Direct imports (cumulative):"]
+        for t in sorted(direct, key=lambda t: t["cumulative_us"], reverse=True)[:top]:
+            lines.append(f"  {t['cumulative_us'] / 1000:9.1f} ms  {t['module']}")
+        lines += ["", "Heaviest modules (self):"]
+        for t in heaviest:
+            lines.append(f"  {t['self_us'] / 1000:9.1f} ms  {t['module']}")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    modules = sys.argv[1:] or ["main"]
+    profiler = ImportProfiler()
+    for name in modules:
+        print(profiler.report(name))
+        print()
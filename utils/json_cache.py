@@ -0,0 +1,38 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Tuple
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+_cache: Dict[str, Tuple[float, Any]] = {}
+_lock = threading.Lock()
+
+
+def load_json(path: str) -> Any:
+    """Parsed JSON file, cached for the life of the process and reloaded when the file changes.
+
+    The returned object is shared between callers and must not be modified.
+    """
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        metrics.CACHE_LOOKUPS.inc(cache="json", result="hit")
+        return cached[1]
+
+    metrics.CACHE_LOOKUPS.inc(cache="json", result="miss")
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    with _lock:
+        _cache[path] = (mtime, data)
+    logger.debug(f"Loaded {path} into the JSON cache")
+    return data
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
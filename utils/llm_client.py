@@ -0,0 +1,296 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+import config
+from utils.token_tracker import TokenTracker, _percentile, cached_tokens
+from utils.budget import BudgetExceeded
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _openai():
+    """Import and configure the OpenAI SDK on first use"""
+    import openai
+    if config.OPENAI_API_KEY and not openai.api_key:
+        openai.api_key = config.OPENAI_API_KEY
+    if config.OPENAI_API_BASE:
+        openai.api_base = config.OPENAI_API_BASE
+    return openai
+
+
+def estimate_tokens(messages) -> int:
+    """Rough prompt size (about 4 characters per token) for budget checks"""
+    return sum(len(m.get("content") or "") for m in messages) // 4 + 4 * len(messages)
+
+
+def cascade_models():
+    """Models to generate on, cheapest first (config.MODEL_CASCADE, else just GPT_MODEL)"""
+    return list(config.MODEL_CASCADE) or [config.GPT_MODEL]
+
+
+def _in_thread(fn, *args) -> Future:
+    """Run fn on a daemon thread, carrying the caller's context (usage labels); a call that
+    is abandoned keeps its thread until the HTTP request returns"""
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=context.run, args=(run,), name="llm-hedge", daemon=True).start()
+    return future
+
+
+class HedgePolicy:
+    """When to send a duplicate of a slow chat completion.
+
+    A call still running after the config.LLM_HEDGE_PERCENTILE latency of the recent calls
+    to its model is hedged: the same request is sent again and whichever answers first is
+    used. The loser cannot be cancelled and is paid for, so hedges are limited to
+    config.LLM_HEDGE_MAX_RATE of recent calls and their tokens to config.LLM_HEDGE_MAX_COST
+    of the spend. One policy is shared by every client in the process.
+    """
+
+    def __init__(self, percentile=None, window=None, min_samples=None, max_rate=None, max_cost=None):
+        self.percentile = percentile or config.LLM_HEDGE_PERCENTILE
+        self.min_samples = min_samples or config.LLM_HEDGE_MIN_SAMPLES
+        self.max_rate = config.LLM_HEDGE_MAX_RATE if max_rate is None else max_rate
+        self.max_cost = config.LLM_HEDGE_MAX_COST if max_cost is None else max_cost
+        window = window or config.LLM_HEDGE_WINDOW
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._hedged = deque(maxlen=window)  # one entry per call: was it hedged
+        self.cost = 0.0
+        self.duplicate_cost = 0.0
+        self._lock = threading.Lock()
+
+    def delay(self, model: str):
+        """Seconds to wait before hedging a call to model; None while there are too few samples"""
+        with self._lock:
+            latencies = list(self._latencies[model])
+        if len(latencies) < self.min_samples:
+            return None
+        return max(config.LLM_HEDGE_MIN_DELAY, _percentile(latencies, self.percentile))
+
+    def observe(self, model: str, latency: float) -> None:
+        with self._lock:
+            self._latencies[model].append(latency)
+
+    def record_call(self, hedged: bool) -> None:
+        with self._lock:
+            self._hedged.append(hedged)
+
+    def allow(self) -> bool:
+        """Whether another hedge fits within the rate and cost caps; counts it if so"""
+        with self._lock:
+            calls = len(self._hedged) or 1
+            if (sum(self._hedged) + 1) / calls > self.max_rate:
+                return False
+            if self.cost and self.duplicate_cost / self.cost > self.max_cost:
+                return False
+            if self._hedged:
+                self._hedged[-1] = True  # only the share matters, not which call it was
+            return True
+
+    def charge(self, cost: float, duplicate: bool = False) -> None:
+        with self._lock:
+            self.cost += cost
+            if duplicate:
+                self.duplicate_cost += cost
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": len(self._hedged), "hedged": sum(self._hedged),
+                    "cost": round(self.cost, 6), "duplicate_cost": round(self.duplicate_cost, 6)}
+
+
+HEDGE_POLICY = HedgePolicy()
+
+
+class LLMClient:
+    """Thin wrapper around the OpenAI chat endpoint that times, retries and records every call"""
+
+    def __init__(self, token_tracker=None, budget=None, max_retries=None, retry_backoff=None, hedge=None):
+        self.token_tracker = token_tracker or TokenTracker()
+        self.budget = budget
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._hedge = hedge
+
+    @property
+    def hedge(self):
+        """The HedgePolicy in use, None when hedging is off"""
+        if self._hedge is not None:
+            return self._hedge or None
+        return HEDGE_POLICY if config.LLM_HEDGE else None
+
+    @property
+    def max_retries(self):
+        return config.LLM_MAX_RETRIES if self._max_retries is None else self._max_retries
+
+    @property
+    def retry_backoff(self):
+        return config.LLM_RETRY_BACKOFF if self._retry_backoff is None else self._retry_backoff
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        openai = _openai()
+        return isinstance(error, (openai.error.RateLimitError,
+                                  openai.error.APIConnectionError,
+                                  openai.error.ServiceUnavailableError,
+                                  openai.error.Timeout,
+                                  openai.error.APIError))
+
+    def chat_completion(self, messages, model=None, temperature=0.7, max_tokens=None, **labels):
+        """Create a chat completion; labels (node, topic, subject) are stored with the usage record"""
+        openai = _openai()
+
+        model = model or config.GPT_MODEL
+        model, max_tokens = self._apply_budget(messages, model, max_tokens, labels)
+        params = {"model": model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+
+        node = labels.get("node", "unknown")
+        retries = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                response = self._create(openai, params, node, labels)
+                break
+            except Exception as e:
+                if retries >= self.max_retries or not self._is_transient(e):
+                    metrics.LLM_REQUESTS.inc(model=model, node=node, status="error")
+                    raise
+                metrics.LLM_REQUESTS.inc(model=model, node=node, status="retry")
+                delay = self.retry_backoff * (2 ** retries)
+                retries += 1
+                logger.warning(f"Transient OpenAI error ({e}); retry {retries}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+        latency = time.perf_counter() - start
+        metrics.LLM_REQUESTS.inc(model=model, node=node, status="ok")
+        metrics.LLM_LATENCY.observe(latency, model=model, node=node)
+        self._record(response, model, latency, retries, labels)
+        return response
+
+    def _record(self, response, model, latency, retries, labels, duplicate=False):
+        """Count a response's tokens in the metrics, the token tracker, the budget and the hedge policy"""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+            metrics.LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+            metrics.LLM_TOKENS.inc(cached_tokens(usage), model=model, kind="cached_prompt")
+        if self.token_tracker:
+            if duplicate:
+                # Paid for but not waited on: no latency, so paper latency figures stay honest
+                self.token_tracker.update(response, model=model, latency=None, retries=0, **labels, hedge="loser")
+            else:
+                self.token_tracker.update(response, model=model, latency=latency, retries=retries, **labels)
+        if usage is not None:
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            cost = self.token_tracker.cost_of(model, prompt_tokens, completion_tokens, cached_tokens(usage))
+            if self.budget:
+                self.budget.charge(prompt_tokens + completion_tokens, cost)
+            if self.hedge:
+                self.hedge.charge(cost, duplicate)
+
+    def _timed_create(self, openai, params):
+        start = time.perf_counter()
+        response = openai.ChatCompletion.create(**params)
+        return response, time.perf_counter() - start
+
+    def _create(self, openai, params, node, labels):
+        """One request, hedged with a duplicate if it outlasts the policy's delay"""
+        policy = self.hedge
+        model = params["model"]
+        delay = policy.delay(model) if policy else None
+        if policy:
+            policy.record_call(False)
+        if delay is None:
+            response, latency = self._timed_create(openai, params)
+            if policy:
+                policy.observe(model, latency)
+            return response
+
+        primary = _in_thread(self._timed_create, openai, params)
+        done, _ = wait([primary], timeout=delay)
+        if done or not policy.allow():
+            if not done:
+                metrics.LLM_HEDGES.inc(model=model, node=node, outcome="capped")
+            response, latency = primary.result()
+            policy.observe(model, latency)
+            return response
+
+        metrics.LLM_HEDGES.inc(model=model, node=node, outcome="sent")
+        logger.debug(f"Hedging {node} call to {model} after {delay:.2f}s")
+        duplicate = _in_thread(self._timed_create, openai, params)
+        pending = {primary, duplicate}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                response, latency = future.result()
+                policy.observe(model, latency)
+                if future is duplicate:
+                    metrics.LLM_HEDGES.inc(model=model, node=node, outcome="won")
+                # The other call may still be running or may have finished in the same wait;
+                # either way its tokens are paid for (a finished future runs the callback at once)
+                loser = duplicate if future is primary else primary
+                loser.add_done_callback(lambda f: self._record_loser(f, model, labels))
+                return response
+        raise error
+
+    def _record_loser(self, future, model, labels):
+        """The slower of a hedged pair still used tokens; count them once it returns"""
+        if future.exception() is not None:
+            return
+        response, latency = future.result()
+        try:
+            self.hedge.observe(model, latency)
+            self._record(response, model, latency, 0, labels, duplicate=True)
+        except Exception as e:
+            logger.warning(f"Could not record the usage of a hedged duplicate: {e}")
+
+    def escalation_allowed(self, where: str) -> bool:
+        """False once the budget runs low: every call then goes to BUDGET_FALLBACK_MODEL, so an
+        escalation would only pay to ask the cheap model that just failed again"""
+        if self.budget and self.budget.is_low():
+            self.budget.record_cut("escalation", f"no model escalation from {where} on", once=True)
+            return False
+        return True
+
+    def _apply_budget(self, messages, model, max_tokens, labels):
+        """Refuse, downgrade or shorten a call according to the remaining budget"""
+        if not self.budget:
+            return model, max_tokens
+
+        self.budget.check()
+        where = "/".join(str(labels[k]) for k in ("node", "topic") if labels.get(k)) or "an unlabelled call"
+        if self.budget.is_low() and model != config.BUDGET_FALLBACK_MODEL:
+            self.budget.record_cut("model", f"{model} -> {config.BUDGET_FALLBACK_MODEL} from {where} on", once=True)
+            model = config.BUDGET_FALLBACK_MODEL
+
+        tokens_left = self.budget.tokens_left()
+        if tokens_left is not None:
+            completion_cap = tokens_left - estimate_tokens(messages)
+            if completion_cap <= 0:
+                raise BudgetExceeded(f"Budget '{self.budget.name}' has no room for the prompt of {where}")
+            # Only a cap the caller set is shrunk: the model's own completion limit is far below
+            # a paper's token budget, so an uncapped call must not be given the whole budget
+            if max_tokens is not None and completion_cap < max_tokens:
+                self.budget.record_cut("max_tokens", f"{max_tokens} -> {completion_cap} for {where}")
+                max_tokens = completion_cap
+        return model, max_tokens
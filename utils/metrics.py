@@ -0,0 +1,273 @@
+import logging
+import os
+import threading
+import time
+import bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Dict = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [("_total", key, None, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [("", key, None, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of the block"""
+        histogram = self
+
+        class _Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                histogram.observe(time.perf_counter() - self.start, **labels)
+                return False
+
+        return _Timer()
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    samples.append(("_bucket", key, {"le": _format_value(float(bound))}, cumulative))
+                samples.append(("_bucket", key, {"le": "+Inf"}, state["count"]))
+                samples.append(("_sum", key, None, state["sum"]))
+                samples.append(("_count", key, None, state["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self, namespace: str = "mockgen"):
+        self.namespace = namespace
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        full_name = f"{self.namespace}_{name}" if self.namespace else name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = cls(full_name, documentation, labelnames, **kwargs)
+                self._metrics[full_name] = metric
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {full_name} already registered with a different type or labels")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Write metrics for the node_exporter textfile collector (atomic rename)"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = MetricsRegistry()
+
+LLM_LATENCY = REGISTRY.histogram("llm_request_duration_seconds", "Latency of chat completion calls",
+                                 ("model", "node"))
+LLM_REQUESTS = REGISTRY.counter("llm_requests", "Chat completion calls by outcome",
+                                ("model", "node", "status"))
+LLM_HEDGES = REGISTRY.counter("llm_hedges", "Hedged chat completions: sent, won by the duplicate, or capped",
+                              ("model", "node", "outcome"))
+LLM_TOKENS = REGISTRY.counter("llm_tokens", "Tokens used by chat completion calls", ("model", "kind"))
+VECTOR_QUERY_LATENCY = REGISTRY.histogram("vector_query_duration_seconds", "Latency of vector store queries",
+                                          ("collection",))
+CACHE_LOOKUPS = REGISTRY.counter("cache_lookups", "Local cache lookups by result", ("cache", "result"))
+QUEUE_DEPTH = REGISTRY.gauge("queue_depth", "Items waiting to be processed", ("queue",))
+POOL_AVAILABLE = REGISTRY.gauge("pool_questions_available", "Pooled questions that can still be served",
+                                ("subject", "topic"))
+TOPIC_FAILURES = REGISTRY.counter("topic_failures", "Failed generations per topic", ("subject", "topic", "stage"))
+MODEL_ESCALATIONS = REGISTRY.counter("model_escalations", "Generations passed to a stronger model after failing validation",
+                                     ("node", "model"))
+DUPLICATE_QUESTIONS = REGISTRY.counter("duplicate_questions", "Generated questions rejected as copies of known ones",
+                                       ("subject", "topic"))
+PAPERS_GENERATED = REGISTRY.counter("papers_generated", "Papers written to disk", ("subject",))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics exporter: " + format % args)
+
+
+class MetricsExporter:
+    """Expose a registry over HTTP and/or keep a textfile collector file up to date"""
+
+    def __init__(self, registry=REGISTRY, port=None, textfile_path=None, textfile_interval=15.0):
+        self.registry = registry
+        self.port = port
+        self.textfile_path = textfile_path
+        self.textfile_interval = textfile_interval
+        self._server = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.port:
+            handler = type("MetricsHandler", (_MetricsHandler,), {"registry": self.registry})
+            self._server = ThreadingHTTPServer(("0.0.0.0", self.port), handler)
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Serving metrics on http://0.0.0.0:{self._server.server_address[1]}/metrics")
+        if self.textfile_path:
+            threading.Thread(target=self._textfile_loop, name="metrics-textfile", daemon=True).start()
+            logger.info(f"Writing metrics to {self.textfile_path} every {self.textfile_interval}s")
+        return self
+
+    def _textfile_loop(self):
+        while not self._stop.wait(self.textfile_interval):
+            self.flush()
+
+    def flush(self):
+        if not self.textfile_path:
+            return
+        try:
+            self.registry.write_textfile(self.textfile_path)
+        except Exception as e:
+            logger.error(f"Error writing metrics textfile: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+_exporter = None
+
+
+def start_exporter_from_config():
+    """Start the process-wide exporter once if METRICS_PORT or METRICS_TEXTFILE is set"""
+    global _exporter
+    if _exporter is None and (config.METRICS_PORT or config.METRICS_TEXTFILE):
+        _exporter = MetricsExporter(port=config.METRICS_PORT, textfile_path=config.METRICS_TEXTFILE).start()
+    return _exporter
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PaperSink:
+    """Writes a paper topic by topic as it is generated.
+
+    Each topic's questions are appended to `<output>.partial.jsonl` as one JSON line the
+    moment they exist, so a crash loses at most the topic in flight and partial papers
+    can be read while generation runs. finalize() then streams the lines into the usual
+    `json.dump(paper, indent=2)` file without holding the whole paper in memory.
+    """
+
+    def __init__(self, output_path: str, keep_partial: bool = False):
+        self.output_path = output_path
+        self.partial_path = f"{os.path.splitext(output_path)[0]}.partial.jsonl"
+        self.keep_partial = keep_partial
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        self._file = open(self.partial_path, "w", encoding="utf-8")
+
+    def write(self, key: str, value) -> None:
+        """Append one topic (or "case_studies") and flush it to disk"""
+        line = json.dumps({"key": key, "value": value}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def discard(self) -> None:
+        """Drop everything written so far, e.g. when the paper is regenerated from scratch"""
+        with self._lock:
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    @staticmethod
+    def read_partial(partial_path: str) -> Iterator[Tuple[str, object]]:
+        """(key, value) pairs of a partial file; a torn last line from a crash is skipped"""
+        with open(partial_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping incomplete line in {partial_path}")
+                    continue
+                yield record["key"], record["value"]
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            self._file.flush()
+        return [key for key, _ in self.read_partial(self.partial_path)]
+
+    def finalize(self) -> str:
+        """Write the assembled paper file from the partial lines; a key written twice keeps its last value"""
+        with self._lock:
+            self._file.close()
+
+        # First pass keeps only line numbers, second pass streams the values out in first-seen order
+        last_line: Dict[str, int] = {}
+        order: List[str] = []
+        for i, (key, _) in enumerate(self.read_partial(self.partial_path)):
+            if key not in last_line:
+                order.append(key)
+            last_line[key] = i
+        keep = {line: key for key, line in last_line.items()}
+        lines = {}
+
+        tmp_path = f"{self.output_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            if not order:
+                out.write("{}")
+            else:
+                written = 0
+                out.write("{\n")
+                # Values are emitted in first-seen key order; later duplicates are buffered only until their turn
+                for i, (key, value) in enumerate(self.read_partial(self.partial_path)):
+                    if i not in keep:
+                        continue
+                    lines[key] = value
+                    while written < len(order) and order[written] in lines:
+                        next_key = order[written]
+                        body = json.dumps(lines.pop(next_key), indent=2).replace("\n", "\n  ")
+                        out.write(("" if written == 0 else ",\n") + f"  {json.dumps(next_key)}: {body}")
+                        written += 1
+                out.write("\n}")
+        os.replace(tmp_path, self.output_path)
+        if not self.keep_partial:
+            os.remove(self.partial_path)
+        return self.output_path
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
@@ -0,0 +1,187 @@
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+import config
+
+logger = logging.getLogger(__name__)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    else:
+        # Library frames by package, e.g. "chromadb/api/rust.py"
+        parts = path.replace("\\", "/").split("/site-packages/")
+        path = parts[-1] if len(parts) > 1 else os.path.basename(path)
+    return f"{path}:{code.co_name}".replace(";", ",").replace(" ", "_")
+
+
+class NodeProfiler:
+    """Opt-in sampling and allocation profiler for the paper workflow.
+
+    Code runs inside section(node, topic), usually through wrap(). A background thread
+    samples the stacks of threads inside a section every config.PROFILE_INTERVAL seconds,
+    wall clock, so network waits show up as well as CPU. With tracemalloc on, each section
+    records the traced memory it added and the peak while it ran; PROFILE_MEMORY = "sites"
+    also diffs snapshots to find the allocating lines (about a second per section).
+    tracemalloc is process-wide, so memory is only measured for calls that ran with no
+    other section open: "memory_calls" counts those, "overlapped_calls" the rest (the
+    parallel case studies, for one), whose memory is left out rather than misattributed.
+    write() produces `<base>.profile.folded` (collapsed stacks for flamegraph.pl,
+    speedscope or inferno) and `<base>.profile.json` with per-section figures.
+    """
+
+    def __init__(self, interval: float = None, memory: str = None, top_allocations: int = None):
+        self.interval = interval or config.PROFILE_INTERVAL
+        self.memory = config.PROFILE_MEMORY if memory is None else memory  # "", "sizes" or "sites"
+        self.top_allocations = top_allocations or config.PROFILE_TOP_ALLOCATIONS
+        self._active: Dict[int, List[str]] = {}
+        self._stacks: Counter = Counter()
+        self._sections = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "samples": 0, "memory_calls": 0,
+                                                 "overlapped_calls": 0, "allocated_bytes": 0, "peak_bytes": 0})
+        self._allocations: Dict[str, Counter] = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._open = 0  # sections open in any thread
+        self._opened = 0  # sections ever opened, to spot one starting inside another
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_tracemalloc = False
+
+    def start(self) -> "NodeProfiler":
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="node-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, labels in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is None or not labels:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame))
+                        frame = frame.f_back
+                    self._stacks[";".join(labels + stack[::-1])] += 1
+                    self._sections[labels[-1]]["samples"] += 1
+
+    @contextmanager
+    def section(self, node: str, topic: str = None):
+        label = node if not topic else f"{node}[{topic}]"
+        label = label.replace(";", ",").replace(" ", "_")
+        ident = threading.get_ident()
+        tracing = tracemalloc.is_tracing()
+        with self._lock:
+            self._active.setdefault(ident, []).append(label)
+            alone = self._open == 0
+            self._open += 1
+            self._opened += 1
+            opened = self._opened
+        # Another section opening later is caught at exit; its memory is then not measured
+        before = tracemalloc.take_snapshot() if tracing and alone and self.memory == "sites" else None
+        if tracing and alone:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory() if tracing and alone else (0, 0)
+            with self._lock:
+                alone = alone and self._opened == opened
+                self._open -= 1
+                labels = self._active.get(ident, [])
+                if labels:
+                    labels.pop()
+                if not labels:
+                    self._active.pop(ident, None)
+                stats = self._sections[label]
+                stats["calls"] += 1
+                stats["seconds"] += elapsed
+                if tracing and alone:
+                    stats["memory_calls"] += 1
+                    stats["allocated_bytes"] += max(0, current - memory_before)
+                    stats["peak_bytes"] = max(stats["peak_bytes"], peak - memory_before)
+                elif tracing:
+                    stats["overlapped_calls"] += 1
+            if before is not None and alone and tracemalloc.is_tracing():
+                self._record_sites(label, before)
+
+    def _record_sites(self, label: str, before) -> None:
+        diff = tracemalloc.take_snapshot().compare_to(before, "lineno")
+        # The profiler's own sampling allocations are not the section's
+        own = (tracemalloc.__file__, os.path.abspath(__file__))
+        grown = [stat for stat in diff if stat.size_diff > 0 and stat.traceback[0].filename not in own]
+        with self._lock:
+            for stat in grown[:self.top_allocations]:
+                frame = stat.traceback[0]
+                path = os.path.relpath(frame.filename, _ROOT) if frame.filename.startswith(_ROOT) else frame.filename
+                self._allocations[label][f"{path}:{frame.lineno}"] += stat.size_diff
+
+    def wrap(self, node: str, fn: Callable, topic_of: Callable = None) -> Callable:
+        """fn run inside a section; topic_of(*args) names the topic, for graph nodes the topic being processed"""
+        if topic_of is None:
+            def topic_of(state=None, *args, **kwargs):
+                topics = state.get("remaining_topics") if isinstance(state, dict) else None
+                return topics[0] if topics and node != "analyze_distribution" else None
+
+        @functools.wraps(fn)  # LangGraph inspects the node's signature
+        def wrapped(*args, **kwargs):
+            with self.section(node, topic_of(*args, **kwargs)):
+                return fn(*args, **kwargs)
+        return wrapped
+
+    def summary(self) -> Dict:
+        with self._lock:
+            sections = {label: dict(stats, seconds=round(stats["seconds"], 4))
+                        for label, stats in self._sections.items()}
+            for label, sites in self._allocations.items():
+                sections[label]["top_allocations"] = dict(sites.most_common(self.top_allocations))
+        return {
+            "interval": self.interval,
+            "memory": self.memory,
+            "samples": sum(s["samples"] for s in sections.values()),
+            "sections": dict(sorted(sections.items(), key=lambda item: -item[1]["seconds"])),
+        }
+
+    def write(self, base_path: str) -> List[str]:
+        """Write `<base>.profile.folded` and `<base>.profile.json`; returns the paths"""
+        folded_path, summary_path = f"{base_path}.profile.folded", f"{base_path}.profile.json"
+        os.makedirs(os.path.dirname(base_path) or ".", exist_ok=True)
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        with open(folded_path, "w", encoding="utf-8") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        logger.info(f"Wrote profile to {folded_path} and {summary_path}")
+        return [folded_path, summary_path]
@@ -0,0 +1,57 @@
+import re
+from typing import Dict, List
+
+_OPTION = re.compile(r"^\s*\(?([A-D])[.)]\s*\S", re.MULTILINE)
+_ANSWER = re.compile(r"^\s*\**(?:Correct\s+)?Answer\**\s*:\**\s*(?:Option\s+)?\(?([^\s)*]*)", re.MULTILINE | re.IGNORECASE)
+_EXPLANATION = re.compile(r"^\s*\**(?:Explanation|Solution)\**\s*:", re.MULTILINE | re.IGNORECASE)
+_NUMBERED = re.compile(r"^\s*(?:Q(?:uestion)?\s*)?\d+[.):]", re.MULTILINE | re.IGNORECASE)
+
+# Subjects whose prompts ask for numerical-answer questions, which have no options
+_NUMERICAL_SUBJECTS = ("Maths-Core", "Maths-Applied")
+
+
+def question_problems(text: str, subject: str = None) -> List[str]:
+    """What a generated question lacks in the format the prompts ask for; empty if it passes.
+
+    Checks the structure only: four options A-D, an answer that names one of them (or a
+    number, for numerical-answer subjects) and an explanation or solution.
+    """
+    problems = []
+    options = _OPTION.findall(text)
+    answer = _ANSWER.search(text)
+    numerical = subject in _NUMERICAL_SUBJECTS and not options
+
+    if not numerical and sorted(set(options)) != list("ABCD"):
+        problems.append(f"has options {''.join(sorted(set(options))) or 'none'}, expected A-D")
+    if answer is None or not answer.group(1):
+        problems.append("no answer")
+    elif not numerical and answer.group(1).upper().rstrip(".") not in set(options):
+        problems.append(f"answer {answer.group(1)!r} is not one of the options")
+    elif numerical and not re.match(r"^-?[\d.,/]+", answer.group(1)):
+        problems.append(f"numerical answer {answer.group(1)!r} is not a number")
+    if not _EXPLANATION.search(text):
+        problems.append("no explanation")
+    return problems
+
+
+def split_questions(questions_text: str) -> List[str]:
+    """A case study's questions, one string each (they are numbered, possibly without blank lines between)"""
+    starts = [m.start() for m in _NUMBERED.finditer(questions_text)]
+    if not starts:
+        return [q for q in questions_text.split("\n\n") if q.strip()]
+    return [questions_text[a:b].strip() for a, b in zip(starts, starts[1:] + [len(questions_text)])]
+
+
+def case_study_problems(case_study: Dict, questions_per_case: int) -> List[str]:
+    """What a parsed case study lacks: its text, the requested number of questions, or a valid question"""
+    if not case_study:
+        return ["response did not have the CASE STUDY / QUESTIONS layout"]
+    problems = []
+    if len(case_study.get("content", "").split()) < 50:
+        problems.append("case text is under 50 words")
+    questions = split_questions(case_study.get("questions", ""))
+    if len(questions) != questions_per_case:
+        problems.append(f"{len(questions)} questions, expected {questions_per_case}")
+    for i, question in enumerate(questions, 1):
+        problems.extend(f"question {i}: {problem}" for problem in question_problems(question))
+    return problems
@@ -1,31 +1,179 @@
 # utils/.py
 # =====================
 import logging
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Dict, List, Optional
+import config
 
 logger = logging.getLogger(__name__)
 
+# Labels (node/topic/subject) of the code currently making LLM calls. A ContextVar
+# keeps them separate per thread and per asyncio task.
+_call_labels = contextvars.ContextVar("token_tracker_labels", default={})
+
+
+def cached_tokens(usage) -> int:
+    """Prompt tokens served from the provider's prompt cache (usage.prompt_tokens_details.cached_tokens)"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None and isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details")
+    if details is None:
+        return 0
+    if isinstance(details, dict):
+        return details.get("cached_tokens", 0) or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
 class TokenTracker:
-    def __init__(self):
-        self.usage = {"input": 0, "output": 0}
-    
-    def update(self, response):
+    def __init__(self, default_model=config.GPT_MODEL, pricing=None):
+        self.default_model = default_model
+        self.pricing = pricing or config.MODEL_PRICING
+        self.usage = {"input": 0, "cached_input": 0, "output": 0}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def scope(self, **labels):
+        """Attach node/topic/subject labels to every call recorded inside the block"""
+        token = _call_labels.set({**_call_labels.get(), **labels})
+        try:
+            yield
+        finally:
+            _call_labels.reset(token)
+
+    def update(self, response, model=None, latency=None, retries=0, **labels):
         """Update token usage from OpenAI response"""
-        if hasattr(response, "usage"):
-            self.usage["input"] += response.usage.prompt_tokens
-            self.usage["output"] += response.usage.completion_tokens
-        else:
+        if not hasattr(response, "usage"):
             logger.warning("Token usage data not found in OpenAI response")
-    
+            return
+
+        usage = response.usage
+        record = {
+            **_call_labels.get(),
+            **labels,
+            "model": model or getattr(response, "model", None) or self.default_model,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "cached_tokens": cached_tokens(usage),
+            "latency": latency,
+            "retries": retries
+        }
+        # The call hit the provider's prompt cache if any of its prompt was served from it
+        record["cache_hit"] = record["cached_tokens"] > 0
+        with self._lock:
+            self.usage["input"] += record["prompt_tokens"]
+            self.usage["cached_input"] += record["cached_tokens"]
+            self.usage["output"] += record["completion_tokens"]
+            self.calls.append(record)
+
+    def _price(self, model: str) -> Dict:
+        if model in self.pricing:
+            return self.pricing[model]
+        # Dated snapshots such as gpt-4o-mini-2024-07-18 share the base model price
+        for name in sorted(self.pricing, key=len, reverse=True):
+            if model and model.startswith(name):
+                return self.pricing[name]
+        return self.pricing.get(self.default_model, {"input": 0.0, "output": 0.0})
+
+    def cost_of(self, model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+        """Dollar cost of a call; cached prompt tokens are billed at the model's cached-input price"""
+        price = self._price(model)
+        cached_tokens = min(cached_tokens, prompt_tokens)
+        return ((prompt_tokens - cached_tokens) * price["input"]
+                + cached_tokens * price.get("cached_input", price["input"])
+                + completion_tokens * price["output"]) / 1_000_000
+
+    @staticmethod
+    def _price_factor(record: Dict) -> float:
+        """Batch API results are billed at a discount"""
+        return config.BATCH_JOB_PRICE_FACTOR if record.get("batch_job") else 1.0
+
+    def _call_cost(self, record: Dict) -> float:
+        return self.cost_of(record["model"], record["prompt_tokens"], record["completion_tokens"],
+                            record.get("cached_tokens", 0)) * self._price_factor(record)
+
+    def _cache_savings(self, record: Dict) -> float:
+        """Dollars saved on a call by its cached prompt tokens"""
+        uncached = self.cost_of(record["model"], record["prompt_tokens"], record["completion_tokens"])
+        return uncached * self._price_factor(record) - self._call_cost(record)
+
     def get_cost_estimate(self):
         """Calculate estimated cost based on current token usage"""
-        input_cost = self.usage["input"] * 0.001 * 0.005  # $0.005 per 1K input tokens
-        output_cost = self.usage["output"] * 0.001 * 0.015  # $0.015 per 1K output tokens
-        return input_cost + output_cost
-    
+        with self._lock:
+            calls = list(self.calls)
+        return sum(self._call_cost(record) for record in calls)
+
     def get_stats(self):
         """Get current token usage statistics"""
         return {
             "input_tokens": self.usage["input"],
+            "cached_input_tokens": self.usage["cached_input"],
             "output_tokens": self.usage["output"],
             "estimated_cost": f"${self.get_cost_estimate():.4f}"
         }
+
+    def _aggregate(self, calls: List[Dict]) -> Dict:
+        latencies = [c["latency"] for c in calls if c["latency"] is not None]
+        prompt_tokens = sum(c["prompt_tokens"] for c in calls)
+        cached = sum(c.get("cached_tokens", 0) for c in calls)
+        return {
+            "calls": len(calls),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": sum(c["completion_tokens"] for c in calls),
+            "cached_prompt_tokens": cached,
+            "prompt_cache_hit_rate": round(cached / prompt_tokens, 3) if prompt_tokens else 0.0,
+            "prompt_cache_savings": round(sum(self._cache_savings(c) for c in calls), 6),
+            "cost": round(sum(self._call_cost(c) for c in calls), 6),
+            "retries": sum(c["retries"] for c in calls),
+            "cache_hits": sum(1 for c in calls if c["cache_hit"]),
+            "hedge_duplicates": sum(1 for c in calls if c.get("hedge")),
+            "latency_total": round(sum(latencies), 3),
+            "latency_p50": round(_percentile(latencies, 50), 3),
+            "latency_p95": round(_percentile(latencies, 95), 3),
+            "latency_max": round(max(latencies), 3) if latencies else 0.0
+        }
+
+    def _group_by(self, calls: List[Dict], key: str) -> Dict:
+        groups = defaultdict(list)
+        for call in calls:
+            groups[call.get(key) or "unknown"].append(call)
+        summaries = {name: self._aggregate(group) for name, group in groups.items()}
+        return dict(sorted(summaries.items(), key=lambda item: item[1]["cost"], reverse=True))
+
+    def summary(self) -> Dict:
+        """Totals plus breakdowns per model, node, topic and subject, most expensive first"""
+        with self._lock:
+            calls = list(self.calls)
+
+        return {
+            "totals": self._aggregate(calls),
+            "by_model": self._group_by(calls, "model"),
+            "by_node": self._group_by(calls, "node"),
+            "by_topic": self._group_by(calls, "topic"),
+            "by_subject": self._group_by(calls, "subject"),
+            "calls": calls
+        }
+
+    def export_summary(self, path: str, extra: Dict = None) -> Optional[str]:
+        """Write the usage summary as JSON, with optional extra sections"""
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({**self.summary(), **(extra or {})}, f, indent=2)
+            logger.info(f"Saved token usage summary to {path}")
+            return path
+        except Exception as e:
+            logger.error(f"Error saving token usage summary: {e}")
+            return None
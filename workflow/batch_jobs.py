@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+import config
+
+logger = logging.getLogger(__name__)
+
+# Batch API job states that will not change any more
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+def request_line(custom_id: str, body: Dict) -> Dict:
+    """One line of a batch input file: a chat completion request and the id its result comes back under"""
+    return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+
+def write_requests(path: str, requests: Iterable[Dict]) -> int:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+class OpenAIBatchBackend:
+    """OpenAI Batch API: the input file is uploaded, answered within the completion window at a discount"""
+
+    @staticmethod
+    def _request(method: str, url: str, params: Dict = None) -> Dict:
+        from openai import api_requestor
+        from utils.llm_client import _openai
+        _openai()
+        response, _, _ = api_requestor.APIRequestor().request(method, url, params)
+        return response.data
+
+    def submit(self, input_path: str) -> str:
+        from utils.llm_client import _openai
+        openai = _openai()
+        with open(input_path, "rb") as f:
+            upload = openai.File.create(file=f, purpose="batch")
+        job = self._request("post", "/batches", {"input_file_id": upload["id"],
+                                                 "endpoint": "/v1/chat/completions",
+                                                 "completion_window": config.BATCH_JOB_COMPLETION_WINDOW})
+        return job["id"]
+
+    def status(self, job_id: str) -> Dict:
+        return self._request("get", f"/batches/{job_id}")
+
+    def results(self, job_id: str) -> List[Dict]:
+        """Output and error lines of a finished job (an expired job keeps the results it got to)"""
+        from utils.llm_client import _openai
+        openai = _openai()
+        job = self.status(job_id)
+        lines = []
+        for key in ("output_file_id", "error_file_id"):
+            if job.get(key):
+                content = openai.File.download(job[key]).decode("utf-8")
+                lines.extend(json.loads(line) for line in content.splitlines() if line.strip())
+        return lines
+
+    def cancel(self, job_id: str) -> None:
+        self._request("post", f"/batches/{job_id}/cancel")
+
+
+class LocalBatchBackend:
+    """File-based stand-in for the Batch API, for tests and runs against the fake server.
+
+    A job is a directory under config.BATCH_JOB_DIR holding input.jsonl, status.json and
+    output.jsonl, in the Batch API's formats. A background thread answers the requests
+    through the synchronous chat endpoint (openai.api_base), so the job finishes in
+    minutes rather than hours and at the full price.
+    """
+
+    def __init__(self, job_dir: str = None, workers: int = 4):
+        self.job_dir = job_dir or config.BATCH_JOB_DIR
+        self.workers = workers
+        self._lock = threading.Lock()
+
+    def _path(self, job_id: str, name: str) -> str:
+        return os.path.join(self.job_dir, job_id, name)
+
+    def _write_status(self, job_id: str, status: Dict) -> None:
+        path = self._path(job_id, "status.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(status, f)
+        os.replace(f"{path}.tmp", path)
+
+    def submit(self, input_path: str) -> str:
+        job_id = f"local-{uuid.uuid4().hex[:12]}"
+        os.makedirs(os.path.join(self.job_dir, job_id))
+        with open(input_path, encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        write_requests(self._path(job_id, "input.jsonl"), requests)
+        self._write_status(job_id, {"id": job_id, "status": "in_progress", "created_at": int(time.time()),
+                                    "request_counts": {"total": len(requests), "completed": 0, "failed": 0}})
+        threading.Thread(target=self._process, args=(job_id, requests), name=f"batch-{job_id}", daemon=True).start()
+        return job_id
+
+    def _answer(self, request: Dict) -> Dict:
+        from utils.llm_client import _openai
+        openai = _openai()
+        try:
+            response = openai.ChatCompletion.create(**request["body"])
+            return {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "body": response.to_dict_recursive()}, "error": None}
+        except Exception as e:
+            return {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request["custom_id"],
+                    "response": None, "error": {"code": type(e).__name__, "message": str(e)}}
+
+    def _process(self, job_id: str, requests: List[Dict]) -> None:
+        counts = {"total": len(requests), "completed": 0, "failed": 0}
+        with open(self._path(job_id, "output.jsonl"), "w", encoding="utf-8") as output, \
+                ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for result in executor.map(self._answer, requests):
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                counts["completed" if result["error"] is None else "failed"] += 1
+        self._write_status(job_id, {"id": job_id, "status": "completed", "completed_at": int(time.time()),
+                                    "request_counts": counts})
+
+    def status(self, job_id: str) -> Dict:
+        with open(self._path(job_id, "status.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def results(self, job_id: str) -> List[Dict]:
+        path = self._path(job_id, "output.jsonl")
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def cancel(self, job_id: str) -> None:
+        logger.warning(f"Local batch job {job_id} cannot be cancelled; it will finish on its own")
+
+
+BACKENDS = {"openai": OpenAIBatchBackend, "local": LocalBatchBackend}
+
+
+def batch_backend(name: str = None):
+    """The batch backend named by config.BATCH_JOB_BACKEND"""
+    name = name or config.BATCH_JOB_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown batch backend {name!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def run_job(backend, requests: List[Dict], input_path: str, poll_seconds: float = None,
+            timeout: float = None) -> Dict[str, Dict]:
+    """Submit requests as one job, wait for it to finish and return the results by custom_id.
+
+    A request missing from the results (failed, or left over when the job expired or timed
+    out) is simply absent; callers fill the gap with another round.
+    """
+    poll_seconds = config.BATCH_JOB_POLL_SECONDS if poll_seconds is None else poll_seconds
+    timeout = config.BATCH_JOB_TIMEOUT if timeout is None else timeout
+    count = write_requests(input_path, requests)
+    job_id = backend.submit(input_path)
+    logger.info(f"Submitted batch job {job_id} with {count} requests ({input_path})")
+
+    deadline = time.monotonic() + timeout
+    while True:
+        job = backend.status(job_id)
+        if job.get("status") in TERMINAL_STATES:
+            break
+        if time.monotonic() > deadline:
+            logger.error(f"Batch job {job_id} still {job.get('status')} after {timeout:.0f}s, cancelling it")
+            backend.cancel(job_id)
+            break
+        logger.info(f"Batch job {job_id} {job.get('status')}: {job.get('request_counts')}")
+        time.sleep(poll_seconds)
+    logger.info(f"Batch job {job_id} {job.get('status')}: {job.get('request_counts')}")
+
+    results = {}
+    for line in backend.results(job_id):
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Batch request {line.get('custom_id')} failed: {line.get('error') or response}")
+            continue
+        results[line["custom_id"]] = response["body"]
+    return results
@@ -0,0 +1,357 @@
+import argparse
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+import config
+from utils.token_tracker import TokenTracker, cached_tokens
+from utils.budget import Budget, BudgetExceeded
+from utils.dedup import NearDuplicateIndex
+from utils.paper_sink import PaperSink
+from utils.question_validator import case_study_problems, question_problems
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPlanner:
+    """Topic-major generation of several papers for one subject.
+
+    The per-paper workflow sends the same system prompt, few-shot examples and chapter
+    text once per topic per paper. Here each topic is asked for the whole batch's
+    questions (papers x quota) in as few calls as fit config.BATCH_COMPLETION_TOKENS,
+    and the distinct questions are then dealt out to the papers.
+    """
+
+    def __init__(self, subject: str, corpus_path: str = None, token_tracker: TokenTracker = None,
+                 budget: Budget = None, resources=None):
+        from workflow.resources import PaperResources
+
+        self.subject = subject
+        self.corpus_path = corpus_path or config.SERVICE_CORPUS_PATH
+        self.token_tracker = token_tracker or TokenTracker()
+        self.budget = budget
+        self.resources = resources or PaperResources()
+        self.failed_topics: List[str] = []  # topics of the last run that raised and got no questions
+
+    def plan(self, total_questions: int = None, distribution_overrides: Dict[str, int] = None) -> Dict[str, int]:
+        """Questions per topic for one paper, as DistributionAgent sets them"""
+        from agents.distribution_agent import DistributionAgent
+
+        agent = DistributionAgent(self.subject, self.resources.vector_store)
+        state = {"total_questions": total_questions,
+                 "detected_topics": list(DistributionAgent.default_topics(self.subject).keys()),
+                 "distribution_overrides": distribution_overrides or {}}
+        return agent.analyze_distribution(state)["distribution"]
+
+    @staticmethod
+    def call_sizes(count: int) -> List[int]:
+        """Split a topic's questions into as few, evenly sized calls as the completion limit allows"""
+        per_call = max(1, config.BATCH_COMPLETION_TOKENS // config.BATCH_TOKENS_PER_QUESTION)
+        calls = max(1, math.ceil(count / per_call))
+        return [count // calls + (1 if i < count % calls else 0) for i in range(calls)]
+
+    def generate_topic(self, question_agent, topic: str, quota: int, papers: int) -> List[List[str]]:
+        """Generate papers x quota distinct questions for a topic and deal them out, one list per paper"""
+        context_agent = self.resources.context_agent(self.subject)
+        context = context_agent.retrieve_context({"remaining_topics": [topic], "context": {}})["context"][topic]
+        needed = quota * papers
+        seen = NearDuplicateIndex(config.NOVELTY_THRESHOLD)
+        accepted = []
+        exhausted = False
+
+        for _ in range(1 + config.BATCH_TOPUP_ROUNDS):
+            missing = needed - len(accepted)
+            if missing <= 0 or exhausted:
+                break
+            for size in self.call_sizes(missing):
+                messages = question_agent.build_messages(topic, quota, context,
+                                                         question_agent.ncert_text(topic, max(quota, size)),
+                                                         request_count=size)
+                if self.budget and self.budget.is_low():
+                    messages = [messages[0]] + messages[-3:]
+                    self.budget.record_cut("few_shot_examples", f"3 -> 1 example turns for {topic} (batch)")
+                try:
+                    response = question_agent.llm.chat_completion(
+                        messages,
+                        temperature=0.8,
+                        max_tokens=min(config.BATCH_COMPLETION_TOKENS, size * config.BATCH_TOKENS_PER_QUESTION),
+                        node="generate_questions_batch",
+                        topic=topic,
+                        subject=self.subject
+                    )
+                except BudgetExceeded as e:
+                    logger.warning(f"Budget exhausted while generating {topic}: {e}")
+                    exhausted = True
+                    break
+                except Exception as e:
+                    logger.error(f"Error generating batch questions for {topic}: {e}")
+                    metrics.TOPIC_FAILURES.inc(subject=self.subject, topic=topic, stage="generate_questions_batch")
+                    continue
+
+                accepted.extend(self._keep(question_agent, topic, response.choices[0].message.content, seen))
+                logger.info(f"{topic}: {len(accepted)}/{needed} questions")
+
+        return self._deal(question_agent, topic, accepted, needed, papers)
+
+    def _keep(self, question_agent, topic: str, content: str, seen: NearDuplicateIndex,
+              flawed: List[str] = None) -> List[str]:
+        """Questions of a response that are new to the batch and do not copy known questions.
+
+        With a `flawed` list, only questions passing validation are returned and the flawed
+        ones (not preambles or stray lines) are appended to it as a last resort.
+        """
+        generated = [q.strip() for q in content.split('\n\n') if q.strip()]
+        if flawed is not None:
+            problems = [question_problems(q, self.subject) for q in generated]
+            flawed.extend(q for q, p in zip(generated, problems) if 0 < len(p) < 3)
+            generated = [q for q, p in zip(generated, problems) if not p]
+        fresh = [generated[i] for i in seen.deduplicate(generated)]
+        if question_agent.novelty_index:
+            copies = set(question_agent.novelty_index.flag_duplicates(fresh))
+            if copies:
+                metrics.DUPLICATE_QUESTIONS.inc(len(copies), subject=self.subject, topic=topic)
+            fresh = [q for i, q in enumerate(fresh) if i not in copies]
+        return fresh
+
+    @staticmethod
+    def _deal(question_agent, topic: str, accepted: List[str], needed: int, papers: int) -> List[List[str]]:
+        """Deal a topic's questions out to the papers, one list per paper"""
+        accepted = accepted[:needed]
+        if len(accepted) < needed:
+            logger.warning(f"Only {len(accepted)} of {needed} questions for {topic}; some papers get fewer")
+        if question_agent.novelty_index:
+            question_agent.novelty_index.add(accepted, source="generated")
+        # Round-robin so any shortfall is spread over the papers
+        return [accepted[i::papers] for i in range(papers)]
+
+    def run(self, output_paths: List[str], total_questions: int = None,
+            distribution_overrides: Dict[str, int] = None) -> List[str]:
+        """Generate one paper per output path; each topic is streamed to the papers' sinks as it completes"""
+        from agents.question_agent import QuestionAgent
+        from agents.case_q_agent import CaseQuestionAgent
+
+        papers = len(output_paths)
+        start = time.perf_counter()
+        self.resources.corpus(self.corpus_path)
+        novelty_index = self.resources.novelty_index(self.subject, self.corpus_path) if config.NOVELTY_CHECK else None
+        question_agent = QuestionAgent(self.subject, self.token_tracker, budget=self.budget, novelty_index=novelty_index)
+        case_agent = CaseQuestionAgent(self.subject, self.token_tracker, budget=self.budget)
+
+        distribution = self.plan(total_questions, distribution_overrides)
+        logger.info(f"Batch of {papers} {self.subject} papers over {len(distribution)} topics")
+        sinks = [PaperSink(path) for path in output_paths]
+
+        try:
+            with ThreadPoolExecutor(max_workers=config.BATCH_TOPIC_WORKERS, thread_name_prefix="batch") as executor:
+                case_futures = [executor.submit(case_agent.generate_case_studies, {"context": {}})
+                                for _ in range(papers)]
+                topic_futures = {executor.submit(self.generate_topic, question_agent, topic, quota, papers): topic
+                                 for topic, quota in distribution.items()}
+                self.failed_topics = []
+                for future in as_completed(topic_futures):
+                    topic = topic_futures[future]
+                    if future.exception() is not None:
+                        # One topic's failure (e.g. in retrieve_context) leaves the rest of the batch intact
+                        logger.error(f"Error generating {topic} for the batch: {future.exception()}")
+                        metrics.TOPIC_FAILURES.inc(subject=self.subject, topic=topic, stage="batch_topic")
+                        self.failed_topics.append(topic)
+                        continue
+                    for sink, questions in zip(sinks, future.result()):
+                        sink.write(topic, questions)
+                for sink, future in zip(sinks, case_futures):
+                    if future.exception() is not None:
+                        logger.error(f"Error generating case studies for {sink.output_path}: {future.exception()}")
+                    sink.write("case_studies", future.result() if future.exception() is None else [])
+
+            for sink in sinks:
+                try:
+                    sink.finalize()
+                    metrics.PAPERS_GENERATED.inc(subject=self.subject)
+                except Exception as e:
+                    logger.error(f"Error saving {sink.output_path}: {e}")
+        finally:
+            for sink in sinks:
+                sink.close()
+
+        if self.failed_topics:
+            logger.warning(f"Batch papers have no questions on {', '.join(self.failed_topics)}")
+        logger.info(f"Generated {papers} papers in {time.perf_counter() - start:.1f}s; "
+                    f"OpenAI Token Usage: {self.token_tracker.get_stats()}")
+        return list(output_paths)
+
+    def _record_batch_usage(self, response, model: str, **labels) -> None:
+        """Count a batch result's tokens, at the batch price, like LLMClient counts a call's"""
+        self.token_tracker.update(response, model=model, subject=self.subject, batch_job=True, **labels)
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        metrics.LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+        metrics.LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+        if self.budget:
+            cost = self.token_tracker.cost_of(model, prompt_tokens, completion_tokens, cached_tokens(usage))
+            self.budget.charge(prompt_tokens + completion_tokens, cost * config.BATCH_JOB_PRICE_FACTOR)
+
+    def run_offline(self, output_paths: List[str], total_questions: int = None,
+                    distribution_overrides: Dict[str, int] = None, backend=None) -> List[str]:
+        """run(), with every request sent as a batch job (config.BATCH_JOB_BACKEND) and polled for.
+
+        Uses the same prompts as the interactive path. Each round is a single job holding every
+        topic's calls and every paper's case studies. Whatever a round leaves short gets
+        another round on the next cascade model: duplicates, invalid output, failed requests.
+        """
+        from agents.question_agent import QuestionAgent
+        from agents.case_q_agent import CaseQuestionAgent
+        from openai.util import convert_to_openai_object
+        from utils.llm_client import cascade_models
+        from workflow.batch_jobs import batch_backend, request_line, run_job
+
+        backend = backend or batch_backend()
+        papers = len(output_paths)
+        start = time.perf_counter()
+        self.resources.corpus(self.corpus_path)
+        novelty_index = self.resources.novelty_index(self.subject, self.corpus_path) if config.NOVELTY_CHECK else None
+        question_agent = QuestionAgent(self.subject, self.token_tracker, budget=self.budget, novelty_index=novelty_index)
+        case_agent = CaseQuestionAgent(self.subject, self.token_tracker, budget=self.budget)
+
+        distribution = self.plan(total_questions, distribution_overrides)
+        context_agent = self.resources.context_agent(self.subject)
+        contexts = {topic: context_agent.retrieve_context({"remaining_topics": [topic], "context": {}})["context"][topic]
+                    for topic in distribution}
+        accepted = {topic: [] for topic in distribution}
+        flawed = {topic: [] for topic in distribution}
+        seen = {topic: NearDuplicateIndex(config.NOVELTY_THRESHOLD) for topic in distribution}
+        case_slots = [(paper, topic) for paper in range(papers) for topic in case_agent.select_topics()]
+        case_studies, flawed_case_studies = {}, {}
+        models = cascade_models()
+        slug = self.subject.lower().replace(" ", "_")
+        job_base = os.path.join(config.BATCH_JOB_DIR, f"{slug}_{int(time.time())}")
+        logger.info(f"Offline batch of {papers} {self.subject} papers over {len(distribution)} topics")
+
+        for round_number in range(1 + config.BATCH_TOPUP_ROUNDS):
+            model = models[min(round_number, len(models) - 1)]
+            requests, targets = [], {}
+            for topic, quota in distribution.items():
+                missing = quota * papers - len(accepted[topic])
+                for size in (self.call_sizes(missing) if missing > 0 else []):
+                    messages = question_agent.build_messages(topic, quota, contexts[topic],
+                                                             question_agent.ncert_text(topic, max(quota, size)),
+                                                             request_count=size)
+                    custom_id = f"r{round_number}-q{len(requests)}"
+                    targets[custom_id] = ("generate_questions_batch_job", topic)
+                    requests.append(request_line(custom_id, {
+                        "model": model, "messages": messages, "temperature": 0.8,
+                        "max_tokens": min(config.BATCH_COMPLETION_TOKENS, size * config.BATCH_TOKENS_PER_QUESTION)}))
+            for slot, (_, topic) in enumerate(case_slots):
+                if slot not in case_studies:
+                    custom_id = f"r{round_number}-c{slot}"
+                    targets[custom_id] = ("case_study_batch_job", slot)
+                    requests.append(request_line(custom_id, {
+                        "model": model, "messages": case_agent.build_messages(topic, case_agent.ncert_text(topic)),
+                        "temperature": 0.7, "max_tokens": 2500}))
+            if not requests:
+                break
+            try:
+                if self.budget:
+                    self.budget.check()
+            except BudgetExceeded as e:
+                logger.warning(f"Budget exhausted before batch round {round_number}: {e}")
+                break
+
+            results = run_job(backend, requests, f"{job_base}_round{round_number}.jsonl")
+            for custom_id, body in results.items():
+                node, target = targets[custom_id]
+                response = convert_to_openai_object(body)
+                topic = target if node == "generate_questions_batch_job" else case_slots[target][1]
+                self._record_batch_usage(response, model, node=node, topic=topic)
+                content = response.choices[0].message.content
+                if node == "generate_questions_batch_job":
+                    accepted[topic].extend(self._keep(question_agent, topic, content, seen[topic], flawed[topic]))
+                    continue
+                case_study = case_agent.parse_case_study(topic, content)
+                if not case_study_problems(case_study, case_agent.questions_per_case):
+                    case_studies[target] = case_study
+                elif case_study:
+                    flawed_case_studies[target] = case_study
+            logger.info(f"Batch round {round_number} on {model}: {len(results)} of {len(requests)} requests answered")
+
+        sinks = [PaperSink(path) for path in output_paths]
+        try:
+            for topic, quota in distribution.items():
+                missing = quota * papers - len(accepted[topic])
+                if missing > 0 and flawed[topic]:
+                    # Better a flawed question than an empty slot, as in the interactive cascade
+                    fillers = [flawed[topic][i] for i in seen[topic].deduplicate(flawed[topic])][-missing:]
+                    logger.warning(f"{topic}: filling {len(fillers)} of {missing} missing questions with ones "
+                                   f"that failed validation")
+                    accepted[topic].extend(fillers)
+                dealt = self._deal(question_agent, topic, accepted[topic], quota * papers, papers)
+                for sink, questions in zip(sinks, dealt):
+                    sink.write(topic, questions)
+            for paper, sink in enumerate(sinks):
+                # A case study that failed validation is still better than none
+                sink.write("case_studies", [case_studies.get(slot) or flawed_case_studies[slot]
+                                            for slot, (owner, _) in enumerate(case_slots)
+                                            if owner == paper and (slot in case_studies or slot in flawed_case_studies)])
+            for sink in sinks:
+                try:
+                    sink.finalize()
+                    metrics.PAPERS_GENERATED.inc(subject=self.subject)
+                except Exception as e:
+                    logger.error(f"Error saving {sink.output_path}: {e}")
+        finally:
+            for sink in sinks:
+                sink.close()
+
+        logger.info(f"Generated {papers} papers offline in {time.perf_counter() - start:.1f}s; "
+                    f"OpenAI Token Usage: {self.token_tracker.get_stats()}")
+        return list(output_paths)
+
+
+if __name__ == "__main__":
+    from utils.logging_utils import setup_logger
+    setup_logger()
+
+    parser = argparse.ArgumentParser(description="Generate several papers for one subject topic by topic")
+    parser.add_argument("--subject", required=True)
+    parser.add_argument("--papers", type=int, default=10)
+    parser.add_argument("--total-questions", type=int, default=None,
+                        help="resize the subject's distribution to this many questions")
+    parser.add_argument("--output-dir", default="outputs/batch")
+    parser.add_argument("--corpus", default=None)
+    parser.add_argument("--offline", action="store_true",
+                        help="send the requests as discounted batch jobs and wait for them (hours, not minutes)")
+    parser.add_argument("--backend", choices=["openai", "local"], default=None,
+                        help="batch job backend for --offline (default config.BATCH_JOB_BACKEND)")
+    args = parser.parse_args()
+
+    metrics.start_exporter_from_config()
+    tracker = TokenTracker()
+    # The batch may spend what its papers would have been allowed one by one
+    limits = {key: (value * args.papers if value and key != "max_seconds" else value)
+              for key, value in config.PAPER_BUDGET.items()}
+    if args.offline:
+        # Every round may take a whole batch job's completion window
+        limits["max_seconds"] = config.BATCH_JOB_TIMEOUT * (1 + config.BATCH_TOPUP_ROUNDS)
+    # ... and no more than config.BATCH_BUDGET allows for a whole batch
+    batch_limit = Budget.from_config("batch", config.BATCH_BUDGET, low_water=config.BUDGET_LOW_WATER)
+    budget = Budget.from_config(f"batch:{args.subject}", limits, parent=batch_limit, low_water=config.BUDGET_LOW_WATER)
+    planner = BatchPlanner(args.subject, args.corpus, tracker, budget)
+
+    slug = args.subject.lower().replace(" ", "_")
+    stamp = int(time.time())
+    paths = [os.path.join(args.output_dir, f"{slug}_{stamp}_{i}.json") for i in range(args.papers)]
+    try:
+        if args.offline:
+            from workflow.batch_jobs import batch_backend
+            planner.run_offline(paths, args.total_questions, backend=batch_backend(args.backend))
+        else:
+            planner.run(paths, args.total_questions)
+    finally:
+        planner.resources.close()
+    tracker.export_summary(os.path.join(args.output_dir, f"{slug}_{stamp}_batch_usage.json"),
+                           extra={"budget": budget.report(), "failed_topics": planner.failed_topics})
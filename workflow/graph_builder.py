@@ -1,25 +1,29 @@
 import logging
-from langgraph.graph import StateGraph, END
 from workflow.state import GraphState
-from agents.distribution_agent import DistributionAgent
-from agents.context_agent import ContextAgent
-from agents.question_agent import QuestionAgent
 
 logger = logging.getLogger(__name__)
 
 class WorkflowBuilder:
-    def __init__(self, distribution_agent, context_agent, question_agent):
+    def __init__(self, distribution_agent, context_agent, question_agent, profiler=None):
         self.distribution_agent = distribution_agent
         self.context_agent = context_agent
         self.question_agent = question_agent
+        self.profiler = profiler
+
+    def _node(self, name, fn):
+        """The node function, inside a profiler section when profiling"""
+        return self.profiler.wrap(name, fn) if self.profiler else fn
         
     def create_workflow(self):
         """Create and configure the workflow graph"""
+        from langgraph.graph import StateGraph, END
+
         workflow = StateGraph(GraphState)
         
-        workflow.add_node("analyze_distribution", self.distribution_agent.analyze_distribution)
-        workflow.add_node("retrieve_context", self.context_agent.retrieve_context)
-        workflow.add_node("generate_questions", self.question_agent.generate_questions)
+        workflow.add_node("analyze_distribution",
+                          self._node("analyze_distribution", self.distribution_agent.analyze_distribution))
+        workflow.add_node("retrieve_context", self._node("retrieve_context", self.context_agent.retrieve_context))
+        workflow.add_node("generate_questions", self._node("generate_questions", self.question_agent.generate_questions))
         
         workflow.set_entry_point("analyze_distribution")
         workflow.add_edge("analyze_distribution", "retrieve_context")
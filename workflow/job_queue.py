@@ -0,0 +1,443 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+import config
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def check_payload(subject: str, payload: Dict) -> None:
+    """Raise ValueError for a job that could never succeed, so it is rejected rather than retried to death"""
+    from agents.distribution_agent import DistributionAgent
+
+    overrides = payload.get("distribution") or {}
+    if not isinstance(overrides, dict) or not all(
+            isinstance(topic, str) and isinstance(count, int) and count >= 0 for topic, count in overrides.items()):
+        raise ValueError("distribution must map topic names to non-negative integers")
+    unknown = sorted(set(overrides) - set(DistributionAgent.default_topics(subject)))
+    if unknown:
+        raise ValueError(f"unknown {subject} topics in distribution: {unknown}")
+
+
+class Job:
+    """A leased paper job"""
+
+    def __init__(self, id: int, subject: str, payload: Dict, attempts: int, max_attempts: int, lease_owner: str,
+                 lease_expires: float):
+        self.id = id
+        self.subject = subject
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.lease_owner = lease_owner
+        self.lease_expires = lease_expires
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.subject!r}, attempt {self.attempts}/{self.max_attempts})"
+
+
+class JobQueue:
+    """Durable queue of paper jobs shared by many workers.
+
+    Jobs are leased rather than popped: a worker that dies loses its lease when it
+    expires and the job becomes available again. A job that fails or expires
+    max_attempts times moves to the dead-letter queue. lease() prefers jobs for the
+    subjects a worker asks for, so workers keep their subject's indexes hot.
+
+    SQLiteJobQueue works for workers on one machine or a shared disk; a networked
+    backend implements the same methods.
+    """
+
+    def enqueue(self, subject: str, payload: Dict, priority: int = 0, max_attempts: int = None) -> int:
+        """Add a job; raises ValueError (see check_payload) for one that could never succeed"""
+        raise NotImplementedError
+
+    def lease(self, worker_id: str, subjects: Iterable[str] = (), steal: bool = True,
+              lease_seconds: float = None) -> Optional[Job]:
+        """Lease the next job, preferring `subjects`; other subjects only if `steal` is set"""
+        raise NotImplementedError
+
+    def heartbeat(self, job: Job, lease_seconds: float = None) -> bool:
+        """Extend a lease; False if the worker no longer holds it"""
+        raise NotImplementedError
+
+    def complete(self, job: Job, result: Dict = None) -> bool:
+        raise NotImplementedError
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> str:
+        """Record a failure; returns the job's new status ("queued" for a retry, or "dead")"""
+        raise NotImplementedError
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        raise NotImplementedError
+
+    def requeue_dead(self, job_ids: Iterable[int] = None) -> int:
+        """Give dead jobs (all, or the given ids) a fresh set of attempts"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class SQLiteJobQueue(JobQueue):
+    """JobQueue backed by a SQLite file; leases are taken inside BEGIN IMMEDIATE transactions"""
+
+    def __init__(self, path: str = None, lease_seconds: float = None, max_attempts: int = None,
+                 retry_backoff: float = None):
+        self.path = path or config.QUEUE_PATH
+        self.lease_seconds = lease_seconds or config.QUEUE_LEASE_SECONDS
+        self.max_attempts = max_attempts or config.QUEUE_MAX_ATTEMPTS
+        self.retry_backoff = config.QUEUE_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                subject TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, subject, priority, available_at)")
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; isolation_level=None so transactions are explicit
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        queue = self
+
+        class _Transaction:
+            def __enter__(self):
+                queue._conn.execute("BEGIN IMMEDIATE")
+                return queue._conn
+
+            def __exit__(self, exc_type, *exc):
+                queue._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+                return False
+
+        return _Transaction()
+
+    def enqueue(self, subject: str, payload: Dict, priority: int = 0, max_attempts: int = None) -> int:
+        check_payload(subject, payload)
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (subject, payload, priority, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (subject, json.dumps(payload), priority, max_attempts or self.max_attempts, now, now, now))
+            return cursor.lastrowid
+
+    def enqueue_many(self, jobs: Iterable[Dict]) -> int:
+        """Enqueue dicts with subject, payload and optional priority/max_attempts in one transaction (all or none)"""
+        jobs = list(jobs)
+        for job in jobs:
+            check_payload(job["subject"], job["payload"])
+        now = time.time()
+        rows = [(job["subject"], json.dumps(job["payload"]), job.get("priority", 0),
+                 job.get("max_attempts") or self.max_attempts, now, now, now) for job in jobs]
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO jobs (subject, payload, priority, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def _reclaim_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        """Return jobs whose worker stopped heartbeating; dead-letter those out of attempts"""
+        conn.execute("UPDATE jobs SET status = 'dead', lease_owner = NULL, updated_at = ?, "
+                     "last_error = 'lease expired on final attempt' "
+                     "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts", (now, now))
+        expired = conn.execute("UPDATE jobs SET status = 'queued', lease_owner = NULL, updated_at = ?, "
+                               "last_error = 'lease expired' "
+                               "WHERE status = 'leased' AND lease_expires < ?", (now, now)).rowcount
+        if expired:
+            logger.warning(f"Requeued {expired} jobs whose lease expired")
+
+    def lease(self, worker_id: str, subjects: Iterable[str] = (), steal: bool = True,
+              lease_seconds: float = None) -> Optional[Job]:
+        subjects = list(subjects)
+        lease_seconds = lease_seconds or self.lease_seconds
+        now = time.time()
+        with self._transaction() as conn:
+            self._reclaim_expired(conn, now)
+
+            row = None
+            ready = "SELECT id FROM jobs WHERE status = 'queued' AND available_at <= ?"
+            order = " ORDER BY priority DESC, id LIMIT 1"
+            if subjects:
+                placeholders = ",".join("?" * len(subjects))
+                row = conn.execute(f"{ready} AND subject IN ({placeholders}){order}", [now, *subjects]).fetchone()
+            if row is None and (steal or not subjects):
+                row = conn.execute(ready + order, (now,)).fetchone()
+            if row is None:
+                return None
+
+            conn.execute("UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                         "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                         (worker_id, now + lease_seconds, now, row[0]))
+            job_id, subject, payload, attempts, max_attempts = conn.execute(
+                "SELECT id, subject, payload, attempts, max_attempts FROM jobs WHERE id = ?", (row[0],)).fetchone()
+        return Job(job_id, subject, json.loads(payload), attempts, max_attempts, worker_id, now + lease_seconds)
+
+    def heartbeat(self, job: Job, lease_seconds: float = None) -> bool:
+        now = time.time()
+        expires = now + (lease_seconds or self.lease_seconds)
+        with self._transaction() as conn:
+            updated = conn.execute("UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                                   "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                                   (expires, now, job.id, job.lease_owner)).rowcount
+        if updated:
+            job.lease_expires = expires
+        return bool(updated)
+
+    def complete(self, job: Job, result: Dict = None) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute("UPDATE jobs SET status = 'done', result = ?, lease_owner = NULL, updated_at = ? "
+                                   "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                                   (json.dumps(result or {}), now, job.id, job.lease_owner)).rowcount
+        if not updated:
+            logger.warning(f"{job} finished after its lease was lost; result not recorded")
+        return bool(updated)
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> str:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs "
+                               "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                               (job.id, job.lease_owner)).fetchone()
+            if row is None:
+                logger.warning(f"{job} failed after its lease was lost: {error}")
+                return "lost"
+            attempts, max_attempts = row
+            if retry and attempts < max_attempts:
+                status, available_at = "queued", now + self.retry_backoff * (2 ** (attempts - 1))
+            else:
+                status, available_at = "dead", now
+            conn.execute("UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, last_error = ?, "
+                         "updated_at = ? WHERE id = ?", (status, available_at, error, now, job.id))
+        logger.log(logging.ERROR if status == "dead" else logging.WARNING,
+                   f"{job} failed ({error}); {'moved to dead-letter queue' if status == 'dead' else 'will retry'}")
+        return status
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        rows = self._conn.execute("SELECT id, subject, payload, attempts, last_error, updated_at FROM jobs "
+                                  "WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+        return [{"id": r[0], "subject": r[1], "payload": json.loads(r[2]), "attempts": r[3], "last_error": r[4],
+                 "failed_at": r[5]} for r in rows]
+
+    def requeue_dead(self, job_ids: Iterable[int] = None) -> int:
+        now = time.time()
+        query = ("UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? "
+                 "WHERE status = 'dead'")
+        params = [now, now]
+        if job_ids is not None:
+            job_ids = list(job_ids)
+            query += f" AND id IN ({','.join('?' * len(job_ids))})"
+            params += job_ids
+        with self._transaction() as conn:
+            return conn.execute(query, params).rowcount
+
+    def stats(self) -> Dict:
+        by_status = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        by_subject = {}
+        for subject, status, count in self._conn.execute(
+                "SELECT subject, status, COUNT(*) FROM jobs GROUP BY subject, status").fetchall():
+            by_subject.setdefault(subject, {})[status] = count
+        metrics.QUEUE_DEPTH.set(by_status.get("queued", 0), queue="jobs")
+        return {"by_status": by_status, "by_subject": by_subject}
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class QueueWorker:
+    """Leases paper jobs and runs them through main.main with warm, shared resources.
+
+    Subjects given up front are preferred, and so is every subject the worker has
+    already generated, since its context agent and novelty index are then loaded.
+    """
+
+    def __init__(self, queue: JobQueue, worker_id: str = None, subjects: Iterable[str] = (), steal: bool = True,
+                 resources=None, corpus_path: str = None, poll_interval: float = 2.0, batch_budget=None):
+        from workflow.resources import PaperResources
+
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.subjects = list(subjects)
+        self.steal = steal
+        self.resources = resources or PaperResources()
+        self.corpus_path = corpus_path or config.SERVICE_CORPUS_PATH
+        self.poll_interval = poll_interval
+        self.batch_budget = batch_budget  # shared by every paper this worker runs (config.BATCH_BUDGET)
+        self.processed = 0
+        self._stop = threading.Event()
+
+    def preferred_subjects(self) -> List[str]:
+        warm = [s for s in self.resources.warm_subjects() if s not in self.subjects]
+        return self.subjects + warm
+
+    def run_once(self) -> bool:
+        """Process one job; False if none was available"""
+        job = self.queue.lease(self.worker_id, self.preferred_subjects(), steal=self.steal)
+        if job is None:
+            return False
+
+        logger.info(f"Worker {self.worker_id} running {job}")
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, stop_heartbeat), daemon=True)
+        heartbeat.start()
+        try:
+            result = self.execute(job)
+        except Exception as e:
+            self.queue.fail(job, f"{type(e).__name__}: {e}")
+        else:
+            if result.get("questions"):
+                self.queue.complete(job, result)
+            else:
+                self.queue.fail(job, "no questions were generated")
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        self.processed += 1
+        return True
+
+    def execute(self, job: Job) -> Dict:
+        import main
+
+        payload = job.payload
+        output_path = payload["output_path"]
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        start = time.perf_counter()
+        paper = main.main(payload.get("corpus_path") or self.corpus_path, output_path, job.subject,
+                          payload.get("total_questions"),
+                          batch_budget=self.batch_budget, distribution_overrides=payload.get("distribution"),
+                          resources=self.resources, raise_on_failure=True)
+        questions = sum(len(v) for k, v in paper.items() if k != "case_studies" and isinstance(v, list))
+        return {"output_path": output_path, "questions": questions,
+                "case_studies": len(paper.get("case_studies", [])),
+                "seconds": round(time.perf_counter() - start, 3), "worker": self.worker_id}
+
+    def _heartbeat(self, job: Job, stop: threading.Event) -> None:
+        interval = max(1.0, (job.lease_expires - time.time()) / 3)
+        while not stop.wait(interval):
+            if not self.queue.heartbeat(job):
+                logger.warning(f"Worker {self.worker_id} lost the lease on {job}")
+                return
+
+    def run(self, max_jobs: int = None, exit_when_idle: bool = False) -> int:
+        while not self._stop.is_set() and (max_jobs is None or self.processed < max_jobs):
+            if not self.run_once():
+                if exit_when_idle:
+                    break
+                self._stop.wait(self.poll_interval)
+        return self.processed
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def run_workers(queue: JobQueue, concurrency: int = 1, **worker_kwargs) -> int:
+    """Run several workers in this process, sharing one set of warm resources and one config.BATCH_BUDGET"""
+    from utils.budget import Budget
+    from workflow.resources import PaperResources
+
+    resources = worker_kwargs.pop("resources", None) or PaperResources()
+    worker_kwargs.setdefault("batch_budget", Budget.from_config("queue", config.BATCH_BUDGET,
+                                                                low_water=config.BUDGET_LOW_WATER))
+    base_id = worker_kwargs.pop("worker_id", None) or f"{socket.gethostname()}:{os.getpid()}"
+    exit_when_idle = worker_kwargs.pop("exit_when_idle", False)
+    workers = [QueueWorker(queue, worker_id=f"{base_id}/{i}", resources=resources, **worker_kwargs)
+               for i in range(concurrency)]
+    threads = [threading.Thread(target=w.run, kwargs={"exit_when_idle": exit_when_idle}, name=w.worker_id)
+               for w in workers]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.stop()
+        for thread in threads:
+            thread.join()
+    finally:
+        resources.close()
+    return sum(w.processed for w in workers)
+
+
+if __name__ == "__main__":
+    from utils.logging_utils import setup_logger
+    setup_logger()
+
+    parser = argparse.ArgumentParser(description="Queue paper jobs and run queue workers")
+    parser.add_argument("--queue", default=config.QUEUE_PATH, help="SQLite queue file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add paper jobs")
+    enqueue.add_argument("--subject", required=True)
+    enqueue.add_argument("--papers", type=int, default=1)
+    enqueue.add_argument("--total-questions", type=int, default=None,
+                         help="resize the subject's distribution to this many questions")
+    enqueue.add_argument("--output-dir", default="outputs/queue")
+    enqueue.add_argument("--corpus", default=None)
+    enqueue.add_argument("--priority", type=int, default=0)
+
+    work = commands.add_parser("work", help="run workers until interrupted")
+    work.add_argument("--subjects", nargs="*", default=[], help="subjects this worker prefers")
+    work.add_argument("--no-steal", action="store_true", help="only take jobs for --subjects")
+    work.add_argument("--concurrency", type=int, default=1, help="workers in this process")
+    work.add_argument("--exit-when-idle", action="store_true")
+
+    commands.add_parser("stats", help="job counts by status and subject")
+    commands.add_parser("dead", help="list dead-lettered jobs")
+    requeue = commands.add_parser("requeue", help="retry dead-lettered jobs")
+    requeue.add_argument("ids", nargs="*", type=int)
+
+    args = parser.parse_args()
+    queue = SQLiteJobQueue(args.queue)
+
+    if args.command == "enqueue":
+        slug = args.subject.lower().replace(" ", "_")
+        stamp = int(time.time())
+        count = queue.enqueue_many({
+            "subject": args.subject,
+            "priority": args.priority,
+            "payload": {"output_path": os.path.join(args.output_dir, f"{slug}_{stamp}_{i}.json"),
+                        "total_questions": args.total_questions, "corpus_path": args.corpus}
+        } for i in range(args.papers))
+        print(f"Enqueued {count} {args.subject} jobs")
+    elif args.command == "work":
+        processed = run_workers(queue, args.concurrency, subjects=args.subjects, steal=not args.no_steal,
+                                exit_when_idle=args.exit_when_idle)
+        print(f"Processed {processed} jobs")
+    elif args.command == "stats":
+        print(json.dumps(queue.stats(), indent=2))
+    elif args.command == "dead":
+        print(json.dumps(queue.dead_letters(), indent=2))
+    elif args.command == "requeue":
+        print(f"Requeued {queue.requeue_dead(args.ids or None)} jobs")
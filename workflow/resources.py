@@ -0,0 +1,139 @@
+import logging
+import threading
+from typing import Dict, List
+import config
+from data.vector_store import collection_name
+from utils.json_cache import load_json
+
+logger = logging.getLogger(__name__)
+
+
+class PaperResources:
+    """Components shared by every paper generated in one process.
+
+    Holds the vector store (each corpus is indexed once), per-subject context agents
+    and novelty indexes. main() builds a throwaway instance unless one is passed in;
+    the generation service keeps one warm for its whole life.
+    """
+
+    def __init__(self, vector_store=None):
+        self._vector_store = vector_store
+        self._corpora: Dict[str, List[Dict]] = {}
+        self._context_agents = {}
+        self._novelty_indexes = {}
+        self._lock = threading.RLock()
+
+    @property
+    def vector_store(self):
+        with self._lock:
+            if self._vector_store is None:
+                if config.VECTOR_BACKEND == "numpy":
+                    from data.numpy_vector_store import NumpyVectorStore
+                    self._vector_store = NumpyVectorStore()
+                else:
+                    from data.vector_store import VectorStore
+                    self._vector_store = VectorStore()
+                if config.HYBRID_RETRIEVAL:
+                    from data.lexical_index import HybridStore
+                    self._vector_store = HybridStore(self._vector_store)
+            return self._vector_store
+
+    def corpus(self, corpus_path: str, subject: str = None) -> List[Dict]:
+        """Load a corpus and index it in its subject's collection (config.CORPUS_SUBJECT by default), once per path"""
+        with self._lock:
+            if corpus_path in self._corpora:
+                return self._corpora[corpus_path]
+
+            logger.info(f"Loading corpus from {corpus_path}")
+            try:
+                corpus = load_json(corpus_path)
+            except Exception as e:
+                logger.error(f"Error loading corpus: {e}")
+                logger.info("Using empty corpus instead")
+                corpus = []
+
+            if config.TOPIC_TAGGING and corpus:
+                # Syllabus topic of every question, stored as metadata for topic-filtered retrieval
+                from data.topic_tagger import TopicTagger
+                corpus_subject = subject or config.CORPUS_SUBJECT
+                try:
+                    pyqs = self.context_agent(corpus_subject).corpus_records()
+                    corpus = TopicTagger(corpus_subject, pyqs).tag(corpus)
+                except Exception as e:
+                    logger.error(f"Error tagging corpus topics: {e}")
+
+            # Handle potential ChromaDB dimension issues
+            try:
+                self.vector_store.initialize_from_corpus(corpus, subject)
+            except Exception as e:
+                logger.error(f"Error in vector store initialization: {e}")
+                logger.info("Attempting to recreate collection...")
+                try:
+                    self.vector_store.get_or_create_collection(
+                        collection_name(subject or config.CORPUS_SUBJECT), force_recreate=True)
+                    self.vector_store.initialize_from_corpus(corpus, subject)
+                except Exception as inner_e:
+                    logger.error(f"Failed to recover from vector store error: {inner_e}")
+
+            self._corpora[corpus_path] = corpus
+            return corpus
+
+    def context_agent(self, subject: str):
+        with self._lock:
+            if subject not in self._context_agents:
+                from agents.context_agent import ContextAgent
+                agent = ContextAgent(subject, self.vector_store)
+                if hasattr(self.vector_store, "add_records"):
+                    added = self.vector_store.add_records(agent.corpus_records(), subject)
+                    logger.info(f"Indexed {added} {subject} PYQs for lexical retrieval")
+                self._context_agents[subject] = agent
+            return self._context_agents[subject]
+
+    def warm_subjects(self) -> List[str]:
+        """Subjects whose context agent is already loaded"""
+        with self._lock:
+            return list(self._context_agents)
+
+    def novelty_index(self, subject: str, corpus_path: str = None):
+        """The subject's novelty index, seeded with its PYQs and (for the corpus subject) the corpus; None on error"""
+        with self._lock:
+            if subject not in self._novelty_indexes:
+                from data.novelty_index import NoveltyIndex
+                try:
+                    index = NoveltyIndex(subject)
+                    index.seed(self.context_agent(subject).corpus_questions(), source="pyq")
+                except Exception as e:
+                    logger.error(f"Error opening novelty index, generated questions will not be checked: {e}")
+                    index = None
+                self._novelty_indexes[subject] = index
+
+            index = self._novelty_indexes[subject]
+            # The corpus holds config.CORPUS_SUBJECT's papers; other subjects must not be checked against it
+            if index is not None and corpus_path and subject == config.CORPUS_SUBJECT:
+                corpus = self.corpus(corpus_path)
+                index.seed([q["question"] for q in corpus if "question" in q], source=f"corpus:{corpus_path}")
+            return index
+
+    def warm(self, subjects: List[str], corpus_path: str, novelty_check: bool = True) -> None:
+        """Load everything a paper for these subjects needs before the first request arrives"""
+        from agents.question_agent import QuestionAgent
+        from agents.case_q_agent import CaseQuestionAgent
+
+        self.corpus(corpus_path)
+        for subject in subjects:
+            self.context_agent(subject)
+            if novelty_check:
+                self.novelty_index(subject, corpus_path)
+            try:
+                QuestionAgent(subject)._load_chapters()
+                CaseQuestionAgent(subject)._load_chapters()
+            except Exception as e:
+                logger.error(f"Error preloading NCERT text for {subject}: {e}")
+            logger.info(f"Warmed resources for {subject}")
+
+    def close(self) -> None:
+        with self._lock:
+            for index in self._novelty_indexes.values():
+                if index is not None:
+                    index.close()
+            self._novelty_indexes.clear()